@@ -0,0 +1,343 @@
+"""
+Analytics de qualidade e latência da frota do Agente Médico Vizeval
+Sketches de quantis mescláveis por complexidade/modelo/threshold, compartilhados entre processos via SQLite
+
+Uso:
+    python analytics.py                    # painel no terminal
+    python analytics.py --json frota.json  # exportação
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+GroupKey = Tuple[str, str, str]
+
+
+class QuantileSketch:
+    """Sketch de quantis com erro relativo limitado (estilo DDSketch), mesclável e de memória constante
+
+    Valores positivos caem em buckets logarítmicos de razão gamma = (1 + a) / (1 - a): qualquer
+    quantil é estimado com erro relativo de no máximo `relative_accuracy`. Acima de `max_bins`
+    buckets, os menores são fundidos (perde-se precisão apenas na cauda inferior).
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1):
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= self.min_value:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def merge(self, other: "QuantileSketch"):
+        """Soma outro sketch (mesma precisão) a este"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Sketches com precisões diferentes não podem ser mesclados")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimativa do quantil q (0 a 1), ou None se vazio"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = self.zero_count
+        if rank < cumulative:
+            return max(self.min, 0.0)
+        for index in sorted(self.bins):
+            cumulative += self.bins[index]
+            if cumulative > rank:
+                estimate = 2 * self._gamma ** index / (self._gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "bins": {str(index): count for index, count in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(relative_accuracy=data["relative_accuracy"])
+        sketch.bins = {int(index): count for index, count in data["bins"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+    def _collapse(self):
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins
+        for index in indexes[:excess]:
+            self.bins[indexes[excess]] += self.bins.pop(index)
+
+
+class GroupStats:
+    """Contadores e sketches de um grupo (complexidade, modelo, threshold)"""
+
+    def __init__(self):
+        self.count = 0
+        self.passed = 0
+        self.errors = 0
+        self.attempts: Dict[int, int] = {}
+        self.score = QuantileSketch()
+        self.latency = QuantileSketch()
+
+    def record(self, results: Dict[str, Any]):
+        self.count += 1
+        metrics = results["quality_metrics"]
+        if "error" in metrics:
+            self.errors += 1
+            return
+        self.passed += bool(metrics["passed_threshold"])
+        attempts = metrics["total_attempts"]
+        self.attempts[attempts] = self.attempts.get(attempts, 0) + 1
+        if metrics["final_score"] is not None:
+            self.score.add(metrics["final_score"])
+        total_s = results.get("performance", {}).get("total_s")
+        if total_s is not None:
+            self.latency.add(total_s)
+
+    def merge(self, other: "GroupStats"):
+        self.count += other.count
+        self.passed += other.passed
+        self.errors += other.errors
+        for attempts, count in other.attempts.items():
+            self.attempts[attempts] = self.attempts.get(attempts, 0) + count
+        self.score.merge(other.score)
+        self.latency.merge(other.latency)
+
+    def summary(self) -> Dict[str, Any]:
+        """Métricas do grupo para painel e exportação"""
+        evaluated = self.count - self.errors
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "pass_rate": self.passed / evaluated if evaluated else None,
+            "score_p10": self.score.quantile(0.10),
+            "score_p50": self.score.quantile(0.50),
+            "score_p90": self.score.quantile(0.90),
+            "attempts_mean": sum(a * c for a, c in self.attempts.items()) / evaluated if evaluated else None,
+            "attempts": {str(a): c for a, c in sorted(self.attempts.items())},
+            "latency_p50_s": self.latency.quantile(0.50),
+            "latency_p95_s": self.latency.quantile(0.95),
+            "latency_p99_s": self.latency.quantile(0.99)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "passed": self.passed,
+            "errors": self.errors,
+            "attempts": {str(a): c for a, c in self.attempts.items()},
+            "score": self.score.to_dict(),
+            "latency": self.latency.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GroupStats":
+        stats = cls()
+        stats.count, stats.passed, stats.errors = data["count"], data["passed"], data["errors"]
+        stats.attempts = {int(a): c for a, c in data["attempts"].items()}
+        stats.score = QuantileSketch.from_dict(data["score"])
+        stats.latency = QuantileSketch.from_dict(data["latency"])
+        return stats
+
+
+class FleetAnalytics:
+    """Agregador de qualidade e latência compartilhado por agentes e processos
+
+    Cada processo acumula um delta em memória (um GroupStats por grupo) e o mescla no arquivo
+    SQLite a cada `flush_interval` segundos, dentro de uma transação exclusiva. O tamanho do
+    estado depende apenas do número de grupos, não do número de análises.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 5.0):
+        """
+        Args:
+            path: Arquivo SQLite compartilhado (None = apenas este processo)
+            flush_interval: Intervalo mínimo entre mesclagens no arquivo
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: Dict[GroupKey, GroupStats] = {}
+        self._local: Dict[GroupKey, GroupStats] = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._connect() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("""
+                    CREATE TABLE IF NOT EXISTS fleet_groups (
+                        complexity TEXT NOT NULL,
+                        model TEXT NOT NULL,
+                        threshold TEXT NOT NULL,
+                        stats TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (complexity, model, threshold)
+                    )
+                """)
+
+    def record(self, results: Dict[str, Any], complexity: str, model: str, threshold: Optional[float]):
+        """Registra o resultado de uma análise (formato de analyze_case)"""
+        key = (complexity or "", model or "", "" if threshold is None else f"{threshold:g}")
+        with self._lock:
+            target = self._pending if self.path else self._local
+            target.setdefault(key, GroupStats()).record(results)
+            due = self.path and time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Mescla o delta deste processo no arquivo compartilhado"""
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            for key, delta in pending.items():
+                row = db.execute("SELECT stats FROM fleet_groups WHERE complexity = ? AND model = ? AND threshold = ?",
+                                 key).fetchone()
+                stats = GroupStats.from_dict(json.loads(row[0])) if row else GroupStats()
+                stats.merge(delta)
+                db.execute("INSERT OR REPLACE INTO fleet_groups (complexity, model, threshold, stats, updated_at) "
+                           "VALUES (?, ?, ?, ?, ?)", (*key, json.dumps(stats.to_dict()), time.time()))
+            db.execute("COMMIT")
+        except Exception:
+            # BEGIN IMMEDIATE também pode falhar (banco bloqueado): aí não há transação para desfazer
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            # Delta volta para a próxima tentativa de mesclagem
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending.setdefault(key, GroupStats()).merge(delta)
+            raise
+        finally:
+            db.close()
+
+    def groups(self) -> Dict[GroupKey, GroupStats]:
+        """Estado agregado da frota (arquivo compartilhado + delta ainda não mesclado)"""
+        merged: Dict[GroupKey, GroupStats] = {}
+        if self.path:
+            with self._connect() as db:
+                for complexity, model, threshold, stats in db.execute(
+                        "SELECT complexity, model, threshold, stats FROM fleet_groups"):
+                    merged[(complexity, model, threshold)] = GroupStats.from_dict(json.loads(stats))
+        with self._lock:
+            for key, delta in list(self._pending.items()) + list(self._local.items()):
+                merged.setdefault(key, GroupStats()).merge(delta)
+        return merged
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Uma linha por grupo, ordenada por complexidade, modelo e threshold"""
+        return [
+            {"complexity": complexity, "model": model, "threshold": threshold, **stats.summary()}
+            for (complexity, model, threshold), stats in sorted(self.groups().items())
+        ]
+
+    def reset(self):
+        """Apaga o estado da frota"""
+        with self._lock:
+            self._pending.clear()
+            self._local.clear()
+        if self.path:
+            with self._connect() as db:
+                db.execute("DELETE FROM fleet_groups")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+
+def display_report(report: List[Dict[str, Any]], console=None):
+    """Painel da frota no terminal"""
+    # rich só é carregado aqui: o agente importa este módulo como biblioteca
+    from rich.console import Console
+    from rich.table import Table
+
+    def fmt(value, spec=".3f"):
+        return "N/A" if value is None else format(value, spec)
+
+    table = Table(title="🌐 Qualidade e Latência da Frota")
+    for column in ("Complexidade", "Modelo", "Threshold", "Análises", "Erros", "Aprovação", "Score p10/p50/p90",
+                   "Tentativas (média)", "Distribuição", "Latência p50/p95/p99"):
+        table.add_column(column, style="cyan" if column in ("Complexidade", "Modelo") else "green")
+    for row in report:
+        table.add_row(
+            row["complexity"], row["model"], row["threshold"], str(row["count"]), str(row["errors"]),
+            fmt(row["pass_rate"], ".1%"),
+            "/".join(fmt(row[f"score_p{q}"]) for q in (10, 50, 90)),
+            fmt(row["attempts_mean"], ".2f"),
+            " ".join(f"{a}:{c}" for a, c in row["attempts"].items()),
+            "/".join(fmt(row[f"latency_p{q}_s"], ".2f") for q in (50, 95, 99)) + "s"
+        )
+    (console or Console()).print(table)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Analytics da frota do Agente Médico Vizeval")
+    parser.add_argument("--path", default=os.getenv("VIZEVAL_ANALYTICS_PATH", ".cache/fleet_analytics.sqlite3"))
+    parser.add_argument("--json", help="Exportar o relatório em JSON")
+    args = parser.parse_args(argv)
+
+    report = FleetAnalytics(args.path).report()
+    display_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Registro das tentativas de cada análise (score, feedback, tokens e latências)
+Base do simulador what-if de thresholds e retries (whatif.py), sem novas chamadas ao GPT-4 e ao Vizeval
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AttemptLog:
+    """Tentativas das análises concluídas, gravadas em SQLite em lotes
+
+    Cada processo acumula as análises em memória e as grava no arquivo a cada `flush_interval`
+    segundos (e em `flush()`), em uma única transação por lote. Cada análise vira uma linha em
+    `analyses` (complexidade, modelo, threshold e retries usados) e uma linha por tentativa em
+    `attempts`.
+    """
+
+    def __init__(self, path: Optional[str] = ".cache/attempts.sqlite3", flush_interval: float = 5.0):
+        """
+        Args:
+            path: Arquivo SQLite compartilhado (None = ":memory:", apenas este processo)
+            flush_interval: Intervalo mínimo entre gravações no arquivo
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[tuple, List[tuple]]] = []
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY,
+                patient_id TEXT,
+                complexity TEXT NOT NULL,
+                model TEXT NOT NULL,
+                threshold REAL,
+                max_retries INTEGER,
+                recorded_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS attempts (
+                analysis_id INTEGER NOT NULL,
+                attempt INTEGER NOT NULL,
+                score REAL,
+                evaluated INTEGER NOT NULL,
+                feedback TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                generation_s REAL,
+                evaluation_s REAL,
+                round INTEGER,
+                PRIMARY KEY (analysis_id, attempt)
+            ) WITHOUT ROWID;
+        """)
+        if "round" not in {row[1] for row in self._db.execute("PRAGMA table_info(attempts)")}:
+            # Arquivo de uma versão anterior: tentativas sem rodada contam como sequenciais
+            self._db.execute("ALTER TABLE attempts ADD COLUMN round INTEGER")
+        self._db_lock = threading.Lock()
+
+    def record(self, results: Dict[str, Any], complexity: str, model: str, threshold: Optional[float],
+               max_retries: Optional[int]):
+        """Registra as tentativas de uma análise concluída (formato de analyze_case)"""
+        attempts = results.get("attempt_history") or []
+        if not attempts:
+            return
+        analysis = (results.get("patient_id"), complexity or "", model or "", threshold, max_retries, time.time())
+        rows = [(a["attempt"], a.get("score"), int(a.get("evaluated", True)), a.get("feedback"),
+                 a.get("prompt_tokens"), a.get("completion_tokens"), a.get("generation_s"), a.get("evaluation_s"),
+                 a.get("round", a["attempt"]))
+                for a in attempts]
+        with self._lock:
+            self._pending.append((analysis, rows))
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Grava no arquivo as análises acumuladas"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+
+        with self._db_lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                for analysis, rows in pending:
+                    analysis_id = self._db.execute(
+                        "INSERT INTO analyses (patient_id, complexity, model, threshold, max_retries, recorded_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", analysis).lastrowid
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO attempts (analysis_id, attempt, score, evaluated, feedback, "
+                        "prompt_tokens, completion_tokens, generation_s, evaluation_s, round) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [(analysis_id, *row) for row in rows])
+                self._db.execute("COMMIT")
+            except Exception:
+                # BEGIN IMMEDIATE também pode falhar (banco bloqueado): aí não há transação para desfazer
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                # Lote volta para a próxima gravação
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+    def count(self) -> Dict[str, int]:
+        """Análises e tentativas registradas (incluindo as ainda não gravadas)"""
+        with self._db_lock:
+            analyses = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            attempts = self._db.execute("SELECT COUNT(*) FROM attempts").fetchone()[0]
+        with self._lock:
+            analyses += len(self._pending)
+            attempts += sum(len(rows) for _, rows in self._pending)
+        return {"analyses": analyses, "attempts": attempts}
+
+    def query(self, sql: str, parameters: tuple = ()) -> List[tuple]:
+        """Executa uma consulta de agregação no arquivo (após gravar o pendente)"""
+        self.flush()
+        with self._db_lock:
+            return self._db.execute(sql, parameters).fetchall()
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexão própria de leitura (para o simulador ler em streaming sem bloquear as gravações)"""
+        self.flush()
+        if not self.path:
+            return self._db
+        return sqlite3.connect(self.path, timeout=30)
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._db.close()
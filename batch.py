@@ -0,0 +1,205 @@
+"""
+Modo batch (headless) do Agente Médico Vizeval
+Lê casos de JSONL/CSV ou de um CaseStore em streaming, analisa com concorrência limitada e grava um resultado por linha
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import fields
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, Union
+
+from case_store import CaseStore
+from medical_agent import AnalysisConfig, MedicalAgent, MedicalCase, add_queue_time
+
+CASE_FIELDS = {f.name for f in fields(MedicalCase)}
+
+# Intervalo mínimo entre gravações do checkpoint
+CHECKPOINT_INTERVAL = 1.0
+
+
+def case_from_record(record: Dict[str, Any]) -> MedicalCase:
+    """Converte um registro de entrada (linha JSONL ou CSV) em MedicalCase"""
+    missing = {"patient_id", "symptoms", "medical_history", "complexity_level"} - set(record)
+    if missing:
+        raise ValueError(f"Campos obrigatórios ausentes: {', '.join(sorted(missing))}")
+
+    values = {k: v for k, v in record.items() if k in CASE_FIELDS}
+    for name in ("expected_focus", "documents"):
+        if isinstance(values.get(name), str):
+            # CSV: itens separados por ";"
+            values[name] = [item.strip() for item in values[name].split(";") if item.strip()] or None
+    return MedicalCase(**values)
+
+
+def read_cases(path: str) -> Iterator[Tuple[int, Union[Dict[str, Any], MedicalCase]]]:
+    """Produz (índice, registro) a partir de um arquivo .jsonl ou .csv, sem carregá-lo inteiro
+
+    Um diretório é lido como CaseStore: os registros já são MedicalCase, lidos das colunas mapeadas.
+    """
+    if os.path.isdir(path):
+        yield from enumerate(CaseStore(path))
+        return
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            yield from enumerate(csv.DictReader(f))
+            return
+
+        index = 0
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            yield index, json.loads(line)
+            index += 1
+
+
+class BatchCheckpoint:
+    """Progresso de um batch: casos concluídos abaixo da marca d'água + concluídos fora de ordem acima dela
+
+    O arquivo de saída é o registro definitivo; o checkpoint guarda o offset já contabilizado
+    para que a retomada leia apenas o final do arquivo. A memória fica limitada à janela de
+    concorrência, independentemente do tamanho da entrada.
+    """
+
+    def __init__(self, output_path: str, checkpoint_path: Optional[str] = None):
+        self.output_path = output_path
+        self.path = checkpoint_path or f"{output_path}.checkpoint"
+        self.watermark = 0
+        self.done: Set[int] = set()
+        self.offset = 0
+        self._saved_at = 0.0
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done
+
+    def mark(self, index: int):
+        """Registra um caso concluído e avança a marca d'água"""
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.remove(self.watermark)
+            self.watermark += 1
+
+    def load(self):
+        """Reconstrói o progresso a partir do checkpoint e do final do arquivo de saída"""
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.watermark = state["watermark"]
+            self.done = set(state["done"])
+            self.offset = state["offset"]
+
+        if not os.path.exists(self.output_path):
+            # Saída removida: recomeçar do zero
+            self.watermark, self.done, self.offset = 0, set(), 0
+            return
+
+        with open(self.output_path, "rb+") as f:
+            f.seek(self.offset)
+            position = self.offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Linha incompleta de uma execução interrompida: descartar
+                    break
+                try:
+                    self.mark(json.loads(line)["index"])
+                except (ValueError, KeyError):
+                    break
+                position += len(line)
+            f.truncate(position)
+            self.offset = position
+
+    def save(self, offset: int, force: bool = False):
+        """Grava o checkpoint de forma atômica (no máximo a cada CHECKPOINT_INTERVAL)"""
+        now = time.monotonic()
+        if not force and now - self._saved_at < CHECKPOINT_INTERVAL:
+            return
+        self.offset = offset
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done), "offset": offset}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = now
+
+
+def run_batch(agent: MedicalAgent, input_path: str, output_path: str, max_concurrency: int = 8,
+              config: Optional[AnalysisConfig] = None, resume: bool = True, refresh: bool = False,
+              checkpoint_path: Optional[str] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+    """Analisa os casos do arquivo de entrada gravando cada resultado em JSONL assim que termina
+
+    Com resume=True, casos já presentes na saída de uma execução anterior são pulados.
+    `should_stop` é consultado entre casos: quando devolve True, nenhum caso novo é iniciado e
+    nada mais é gravado na saída nem no checkpoint (os casos em andamento são descartados).
+    Retorna contadores de casos processados, pulados e com erro.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency deve ser maior ou igual a 1")
+
+    checkpoint = BatchCheckpoint(output_path, checkpoint_path)
+    if resume:
+        checkpoint.load()
+    elif os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    stats = {"processed": 0, "skipped": 0, "errors": 0}
+    stopped = should_stop or (lambda: False)
+
+    def analyze(record: Union[Dict[str, Any], MedicalCase], queued_at: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # Registro inválido ou falha da análise viram resultado de erro sem interromper o batch
+        try:
+            case = record if isinstance(record, MedicalCase) else case_from_record(record)
+        except (TypeError, ValueError) as e:
+            return {"patient_id": record.get("patient_id"), "analysis": f"Erro na análise: {str(e)}",
+                    "quality_metrics": {"error": str(e)}, "attempt_history": []}
+        try:
+            result = agent.analyze_case(case, config=config, show_progress=False, refresh=refresh)
+        except Exception as e:
+            return agent._error_result(case, e)
+        return add_queue_time(result, started - queued_at)
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="medical-batch") as pool:
+        pending = {}
+
+        def drain(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                index = pending.pop(future)
+                result = future.result()
+                if stopped():
+                    continue
+                out.write(json.dumps({"index": index, **result}, ensure_ascii=False) + "\n")
+                out.flush()
+                checkpoint.mark(index)
+                stats["processed"] += 1
+                if "error" in result["quality_metrics"]:
+                    stats["errors"] += 1
+            if not stopped():
+                checkpoint.save(out.tell())
+
+        for index, record in read_cases(input_path):
+            if stopped():
+                break
+            if checkpoint.is_done(index):
+                stats["skipped"] += 1
+                continue
+            # Janela limitada de casos em andamento: a entrada é lida conforme há vaga
+            if len(pending) >= max_concurrency:
+                drain(FIRST_COMPLETED)
+            pending[pool.submit(analyze, record, time.perf_counter())] = index
+
+        while pending:
+            drain(FIRST_COMPLETED)
+        if not stopped():
+            checkpoint.save(out.tell(), force=True)
+
+    return stats
@@ -0,0 +1,278 @@
+"""
+Benchmark offline do Agente Médico Vizeval
+Mede vazão, latência, tentativas e overhead local de CPU/memória contra servidores simulados
+
+Uso:
+    python -m benchmarks.run_benchmarks --repeats 20 --concurrency 8
+    python benchmarks/run_benchmarks.py --repeats 20 --concurrency 8
+    python -m benchmarks.run_benchmarks --json bench.json --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, fields
+from typing import Any, Dict, List, Optional
+
+from rich.console import Console
+from rich.table import Table
+
+if not __package__:
+    # Executado como script (python benchmarks/run_benchmarks.py): a raiz do repositório entra no path
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import medical_agent
+from batch import run_batch
+from benchmarks.stub_servers import StubProfile, StubServers
+from medical_agent import AsyncMedicalAgent, MedicalAgent, MedicalCase, create_sample_cases
+
+console = Console()
+
+SCENARIOS = ("analyze_case", "analyze_cases", "stream_case", "batch", "async")
+
+# Métricas comparadas com o baseline: nome → True se maior é melhor
+REGRESSION_METRICS = {"throughput": True, "p95_s": False, "cpu_ms_per_case": False}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil com interpolação linear (q em [0, 100])"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class Recorder:
+    """Coleta latência e resultado de cada análise de um cenário"""
+
+    def __init__(self):
+        self.samples: List[Dict[str, Any]] = []
+
+    def add(self, case: MedicalCase, seconds: float, result: Optional[Dict[str, Any]]):
+        metrics = (result or {}).get("quality_metrics", {"error": "sem resultado"})
+        self.samples.append({
+            "complexity": case.complexity_level,
+            "latency_s": seconds,
+            "attempts": metrics.get("total_attempts", 0),
+            "error": "error" in metrics
+        })
+
+    def instrument(self, agent: MedicalAgent):
+        """Mede cada chamada de analyze_case, inclusive as feitas pelas APIs de batch"""
+        original = agent.analyze_case
+
+        if isinstance(agent, AsyncMedicalAgent):
+            async def timed(case, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await original(case, *args, **kwargs)
+                except Exception:
+                    self.add(case, time.perf_counter() - start, None)
+                    raise
+                self.add(case, time.perf_counter() - start, result)
+                return result
+        else:
+            def timed(case, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = original(case, *args, **kwargs)
+                except Exception:
+                    self.add(case, time.perf_counter() - start, None)
+                    raise
+                self.add(case, time.perf_counter() - start, result)
+                return result
+
+        agent.analyze_case = timed
+
+
+def _workload(repeats: int) -> List[MedicalCase]:
+    """Casos de exemplo (todas as complexidades) repetidos com IDs distintos"""
+    cases = []
+    for i in range(repeats):
+        for case in create_sample_cases():
+            cases.append(MedicalCase(**{**asdict(case), "patient_id": f"{case.patient_id}-{i}"}))
+    return cases
+
+
+def _run_scenario(name: str, cases: List[MedicalCase], openai_url: str, vizeval_url: str,
+                  concurrency: int, recorder: Recorder):
+    if name == "async":
+        async def run():
+            async with AsyncMedicalAgent("bench", "bench", vizeval_url, openai_base_url=openai_url) as agent:
+                recorder.instrument(agent)
+                await agent.analyze_cases(cases, max_concurrency=concurrency)
+        asyncio.run(run())
+        return
+
+    agent = MedicalAgent("bench", "bench", vizeval_url, openai_base_url=openai_url)
+    if name == "stream_case":
+        # Caminho usado pela interface Streamlit
+        for case in cases:
+            start = time.perf_counter()
+            result = None
+            try:
+                for event in agent.stream_case(case):
+                    if event["type"] == "result":
+                        result = event["result"]
+            except Exception:
+                pass
+            recorder.add(case, time.perf_counter() - start, result)
+        return
+
+    recorder.instrument(agent)
+    if name == "analyze_case":
+        for case in cases:
+            try:
+                agent.analyze_case(case, show_progress=False)
+            except Exception:
+                pass
+    elif name == "analyze_cases":
+        agent.analyze_cases(cases, max_concurrency=concurrency)
+    elif name == "batch":
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, "cases.jsonl")
+            with open(input_path, "w", encoding="utf-8") as f:
+                for case in cases:
+                    f.write(json.dumps(asdict(case), ensure_ascii=False) + "\n")
+            run_batch(agent, input_path, os.path.join(directory, "results.jsonl"), max_concurrency=concurrency)
+
+
+def summarize(name: str, recorder: Recorder, wall_s: float, cpu_s: float,
+              memory: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    """Métricas agregadas do cenário e por nível de complexidade"""
+    samples = recorder.samples
+    latencies = [s["latency_s"] for s in samples]
+    n = len(samples) or 1
+    summary = {
+        "scenario": name,
+        "cases": len(samples),
+        "errors": sum(s["error"] for s in samples),
+        "throughput": len(samples) / wall_s if wall_s else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "attempts_per_case": sum(s["attempts"] for s in samples) / n,
+        "cpu_ms_per_case": 1000 * cpu_s / n,
+        "by_complexity": {}
+    }
+    if memory is not None:
+        summary["peak_kib"] = memory["peak"] / 1024
+        summary["retained_kib_per_case"] = memory["retained"] / 1024 / n
+
+    for level in dict.fromkeys(s["complexity"] for s in samples):
+        group = [s for s in samples if s["complexity"] == level]
+        summary["by_complexity"][level] = {
+            "cases": len(group),
+            "errors": sum(s["error"] for s in group),
+            "p50_s": percentile([s["latency_s"] for s in group], 50),
+            "attempts_per_case": sum(s["attempts"] for s in group) / len(group)
+        }
+    return summary
+
+
+def run_benchmarks(scenarios=SCENARIOS, profile: StubProfile = StubProfile(), repeats: int = 10,
+                   concurrency: int = 8, trace_memory: bool = False) -> List[Dict[str, Any]]:
+    """Executa os cenários contra os servidores simulados e devolve um resumo por cenário"""
+    # Saída do agente desligada: mede-se o processamento, não o terminal
+    medical_agent.console.quiet = True
+    summaries = []
+    try:
+        with StubServers(profile) as (openai_url, vizeval_url):
+            for name in scenarios:
+                cases = _workload(repeats)
+                recorder = Recorder()
+                memory = None
+                if trace_memory:
+                    tracemalloc.start()
+                    baseline = tracemalloc.get_traced_memory()[0]
+                cpu_start, wall_start = time.process_time(), time.perf_counter()
+                _run_scenario(name, cases, openai_url, vizeval_url, concurrency, recorder)
+                wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+                if trace_memory:
+                    current, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    memory = {"peak": peak - baseline, "retained": current - baseline}
+                summaries.append(summarize(name, recorder, wall_s, cpu_s, memory))
+    finally:
+        medical_agent.console.quiet = False
+    return summaries
+
+
+def compare(summaries: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """Regressões acima da tolerância relativa em relação ao baseline"""
+    previous = {s["scenario"]: s for s in baseline}
+    regressions = []
+    for summary in summaries:
+        reference = previous.get(summary["scenario"])
+        if reference is None:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = reference.get(metric), summary.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{summary['scenario']}.{metric}: {old:.4f} → {new:.4f} ({change:+.1%})")
+    return regressions
+
+
+def display(summaries: List[Dict[str, Any]]):
+    """Tabela com o resumo de cada cenário"""
+    table = Table(title="⏱️ Benchmark offline - Agente Médico Vizeval")
+    for column in ("Cenário", "Casos", "Erros", "Casos/s", "p50 (s)", "p95 (s)", "p99 (s)", "Tentativas/caso",
+                   "CPU/caso (ms)", "Pico mem (KiB)"):
+        table.add_column(column, style="cyan" if column == "Cenário" else "green")
+
+    def fmt(value, spec=".3f"):
+        return "N/A" if value is None else format(value, spec)
+
+    for s in summaries:
+        table.add_row(s["scenario"], str(s["cases"]), str(s["errors"]), fmt(s["throughput"], ".1f"),
+                      fmt(s["p50_s"]), fmt(s["p95_s"]), fmt(s["p99_s"]), fmt(s["attempts_per_case"], ".2f"),
+                      fmt(s["cpu_ms_per_case"], ".1f"), fmt(s.get("peak_kib"), ".0f"))
+    console.print(table)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do Agente Médico Vizeval")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeats", type=int, default=10, help="Repetições do conjunto de casos de exemplo")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--memory", action="store_true", help="Medir memória com tracemalloc (aumenta o CPU medido)")
+    parser.add_argument("--json", help="Gravar os resumos em JSON")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa tolerada em relação ao baseline")
+    for f in fields(StubProfile):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default)
+    args = parser.parse_args(argv)
+
+    profile = StubProfile(**{f.name: getattr(args, f.name) for f in fields(StubProfile)})
+    summaries = run_benchmarks(args.scenarios, profile, repeats=args.repeats, concurrency=args.concurrency,
+                               trace_memory=args.memory)
+    display(summaries)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(summaries, json.load(f), args.tolerance)
+        for regression in regressions:
+            console.print(f"❌ [bold red]Regressão:[/bold red] {regression}")
+        if regressions:
+            return 1
+        console.print("✅ [bold green]Sem regressões em relação ao baseline[/bold green]")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Servidores locais que imitam a API da OpenAI e a API Vizeval
+Latência, score e taxa de erro configuráveis para benchmarks sem rede
+"""
+
+import json
+import math
+import multiprocessing
+import random
+import re
+import sys
+import time
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+ATTEMPT_MARKER = re.compile(r"\[tentativa (\d+)\]")
+
+
+@dataclass(frozen=True)
+class StubProfile:
+    """Comportamento dos servidores simulados
+
+    Latências seguem uma lognormal (mediana em ms, sigma do log); scores seguem uma normal
+    truncada em [0, 1] cuja média sobe `score_gain` a cada retry.
+    """
+    openai_latency_ms: float = 40.0
+    openai_latency_sigma: float = 0.5
+    openai_error_rate: float = 0.0
+    completion_words: int = 300
+    vizeval_latency_ms: float = 15.0
+    vizeval_latency_sigma: float = 0.5
+    vizeval_error_rate: float = 0.0
+    score_mean: float = 0.8
+    score_sd: float = 0.08
+    score_gain: float = 0.04
+    seed: int = 0
+
+    def sample_latency(self, rng: random.Random, median_ms: float, sigma: float) -> float:
+        """Latência em segundos"""
+        if median_ms <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(median_ms / 1000), sigma) if sigma > 0 else median_ms / 1000
+
+    def sample_score(self, rng: random.Random, attempt: int) -> float:
+        return min(1.0, max(0.0, rng.gauss(self.score_mean + self.score_gain * (attempt - 1), self.score_sd)))
+
+
+def _count_tokens(text: str) -> int:
+    # Aproximação de ~4 caracteres por token
+    return max(1, len(text) // 4)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    profile: StubProfile
+    rng: random.Random
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            self._chat_completions(self._read_json())
+        elif path.endswith("/evaluation"):
+            self._evaluation(self._read_json())
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    def _chat_completions(self, request: Dict[str, Any]):
+        profile = self.profile
+        time.sleep(profile.sample_latency(self.rng, profile.openai_latency_ms, profile.openai_latency_sigma))
+
+        if self.rng.random() < profile.openai_error_rate:
+            self._send_json(500, {"error": {"message": "erro simulado", "type": "server_error"}},
+                            headers={"retry-after-ms": "10"})
+            return
+
+        messages = request.get("messages", [])
+        attempt = 1 + sum(1 for m in messages if m.get("role") == "assistant")
+        words = min(profile.completion_words, int(request.get("max_tokens") or profile.completion_words))
+        tokens = [f"[tentativa {attempt}]"] + [f" palavra{i}" for i in range(max(0, words - 1))]
+        content = "".join(tokens)
+        usage = {
+            "prompt_tokens": sum(_count_tokens(m.get("content") or "") for m in messages),
+            "completion_tokens": len(tokens),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": request.get("model", "stub")}
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for token in tokens:
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        final = {**base, "object": "chat.completion.chunk", "usage": usage,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+
+    def _evaluation(self, request: Dict[str, Any]):
+        profile = self.profile
+        time.sleep(profile.sample_latency(self.rng, profile.vizeval_latency_ms, profile.vizeval_latency_sigma))
+
+        if self.rng.random() < profile.vizeval_error_rate:
+            self._send_json(503, {"detail": "avaliador indisponível (simulado)"})
+            return
+
+        match = ATTEMPT_MARKER.search(request.get("response", ""))
+        score = profile.sample_score(self.rng, int(match.group(1)) if match else 1)
+        self._send_json(201, {
+            "evaluator": request.get("evaluator", "medical"),
+            "score": round(score, 4),
+            "feedback": f"Avaliação simulada (score {score:.3f})"
+        })
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Cliente que desiste no meio da resposta (stream cancelado, candidato especulativo
+        # descartado, hedging) é comportamento esperado no benchmark, não erro do servidor
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def _serve(profile_fields: Dict[str, Any], ready):
+    profile = StubProfile(**profile_fields)
+    handler = type("StubHandler", (_StubHandler,), {"profile": profile, "rng": random.Random(profile.seed)})
+    server = _StubServer(("127.0.0.1", 0), handler)
+    ready.send(server.server_address[1])
+    ready.close()
+    server.serve_forever()
+
+
+class StubServers:
+    """Sobe os servidores simulados em um processo separado (CPU do benchmark não se mistura)
+
+    Uso:
+        with StubServers(StubProfile(score_mean=0.7)) as (openai_url, vizeval_url):
+            agent = MedicalAgent("bench", "bench", vizeval_url, openai_base_url=openai_url)
+    """
+
+    def __init__(self, profile: StubProfile = StubProfile()):
+        self.profile = profile
+        self._process = None
+
+    def start(self) -> Tuple[str, str]:
+        parent, child = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(target=_serve, args=(asdict(self.profile), child), daemon=True)
+        self._process.start()
+        if not parent.poll(10):
+            self.stop()
+            raise RuntimeError("Servidores simulados não iniciaram")
+        base_url = f"http://127.0.0.1:{parent.recv()}"
+        # Um único servidor atende as duas APIs
+        return f"{base_url}/v1", base_url
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    def __enter__(self) -> Tuple[str, str]:
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
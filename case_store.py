@@ -0,0 +1,219 @@
+"""
+Armazenamento colunar de casos médicos para corpora de regressão com milhões de casos
+Colunas NumPy + arquivo de offsets mapeados em memória; casos materializados só quando lidos
+
+Uso:
+    python case_store.py build casos.jsonl corpus/   # converte JSONL/CSV em um store
+    python case_store.py info corpus/                # contagem por complexidade
+"""
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from medical_agent import MedicalCase
+
+FORMAT_VERSION = 1
+
+# Níveis de complexidade conhecidos: código uint8 = posição na tupla; níveis novos são acrescentados no store
+COMPLEXITY_LEVELS = ("low", "medium", "high", "very_high", "extreme")
+
+# Colunas de texto (bytes UTF-8 concatenados + offsets uint64)
+TEXT_FIELDS = ("patient_id", "symptoms", "medical_history", "expected_focus", "documents")
+
+# Separador dos itens das colunas de lista (expected_focus, documents)
+LIST_SEPARATOR = "\x1f"
+
+# Buffer de escrita das colunas de texto
+WRITE_BUFFER = 1 << 20
+
+# Casos decodificados por bloco na iteração
+ITER_BLOCK = 4096
+
+
+class _TextColumn:
+    """Coluna de texto mapeada: o item i ocupa data[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        with open(os.path.join(path, f"{name}.bin"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap de arquivo vazio não é permitido
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __getitem__(self, index: int) -> str:
+        return self.data[int(self.offsets[index]):int(self.offsets[index + 1])].decode("utf-8")
+
+    def slice(self, start: int, stop: int) -> Iterator[str]:
+        """Itens [start, stop) em sequência"""
+        offsets = self.offsets[start:stop + 1].tolist()
+        data = self.data
+        for begin, end in zip(offsets, offsets[1:]):
+            yield data[begin:end].decode("utf-8")
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+class CaseStore:
+    """Casos em colunas mapeadas em memória, com iteração preguiçosa e fatias sem cópia
+
+    Abrir um store lê apenas o arquivo de metadados; as páginas das colunas são carregadas
+    pelo sistema operacional conforme os casos são lidos, então a memória usada não depende
+    do tamanho do corpus. `shard` e `view` devolvem stores que compartilham os mesmos mapas.
+    """
+
+    def __init__(self, path: str, _columns: Optional[tuple] = None, _range: Optional[Tuple[int, int]] = None):
+        self.path = path
+        if _columns is None:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["version"] != FORMAT_VERSION:
+                raise ValueError(f"Versão de store não suportada: {meta['version']}")
+            # Cada nível é uma única string compartilhada por todos os casos daquele nível
+            levels = tuple(meta["levels"])
+            complexity = np.load(os.path.join(path, "complexity.npy"), mmap_mode="r")
+            text = {name: _TextColumn(path, name) for name in TEXT_FIELDS}
+            _columns = (levels, complexity, text)
+        self._columns = _columns
+        self.levels, self.complexity, self._text = _columns
+        self.start, self.stop = _range or (0, len(self.complexity))
+
+    @classmethod
+    def write(cls, path: str, cases: Iterable[MedicalCase]) -> "CaseStore":
+        """Grava os casos em `path` (substituindo um store existente) em uma única passada
+
+        Os casos são consumidos em streaming: a memória usada é a dos offsets (8 bytes por
+        caso e coluna) e dos buffers de escrita.
+        """
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        levels: List[str] = list(COMPLEXITY_LEVELS)
+        codes: Dict[str, int] = {level: i for i, level in enumerate(levels)}
+        complexity = array("B")
+        offsets = {name: array("Q", [0]) for name in TEXT_FIELDS}
+        files = {name: open(os.path.join(tmp_path, f"{name}.bin"), "wb", buffering=WRITE_BUFFER)
+                 for name in TEXT_FIELDS}
+        try:
+            for case in cases:
+                level = case.complexity_level
+                if level not in codes:
+                    if len(levels) == 256:
+                        raise ValueError("Mais de 256 níveis de complexidade distintos")
+                    codes[level] = len(levels)
+                    levels.append(level)
+                complexity.append(codes[level])
+                for name in TEXT_FIELDS:
+                    value = getattr(case, name)
+                    if isinstance(value, list):
+                        value = LIST_SEPARATOR.join(value)
+                    data = (value or "").encode("utf-8")
+                    files[name].write(data)
+                    offsets[name].append(offsets[name][-1] + len(data))
+        finally:
+            for f in files.values():
+                f.close()
+
+        np.save(os.path.join(tmp_path, "complexity.npy"), np.frombuffer(complexity, dtype=np.uint8))
+        for name in TEXT_FIELDS:
+            np.save(os.path.join(tmp_path, f"{name}.offsets.npy"), np.frombuffer(offsets[name], dtype=np.uint64))
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": len(complexity), "levels": levels}, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, index: int) -> MedicalCase:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        row = self.start + index
+        focus = self._text["expected_focus"][row]
+        documents = self._text["documents"][row]
+        return MedicalCase(
+            patient_id=self._text["patient_id"][row],
+            symptoms=self._text["symptoms"][row],
+            medical_history=self._text["medical_history"][row],
+            complexity_level=self.levels[self.complexity[row]],
+            expected_focus=focus.split(LIST_SEPARATOR) if focus else None,
+            documents=documents.split(LIST_SEPARATOR) if documents else None
+        )
+
+    def __iter__(self) -> Iterator[MedicalCase]:
+        # Offsets e códigos convertidos em blocos: evita um acesso NumPy escalar por campo e caso
+        for start in range(self.start, self.stop, ITER_BLOCK):
+            stop = min(start + ITER_BLOCK, self.stop)
+            columns = [self._text[name].slice(start, stop) for name in TEXT_FIELDS]
+            levels = [self.levels[code] for code in self.complexity[start:stop].tolist()]
+            for patient_id, symptoms, history, focus, documents, level in zip(*columns, levels):
+                yield MedicalCase(
+                    patient_id=patient_id,
+                    symptoms=symptoms,
+                    medical_history=history,
+                    complexity_level=level,
+                    expected_focus=focus.split(LIST_SEPARATOR) if focus else None,
+                    documents=documents.split(LIST_SEPARATOR) if documents else None
+                )
+
+    def view(self, start: int, stop: int) -> "CaseStore":
+        """Casos [start, stop) deste store, sem cópia"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        return CaseStore(self.path, self._columns, (self.start + start, self.start + max(start, stop)))
+
+    def shard(self, index: int, count: int) -> "CaseStore":
+        """Fatia contígua `index` de `count` partes de tamanho quase igual"""
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index} fora de 0..{count - 1}")
+        return self.view(len(self) * index // count, len(self) * (index + 1) // count)
+
+    def batches(self, size: int) -> Iterator[List[MedicalCase]]:
+        """Casos em listas de até `size`, materializadas uma de cada vez"""
+        for start in range(0, len(self), size):
+            yield list(self.view(start, start + size))
+
+    def complexity_counts(self) -> Dict[str, int]:
+        """Casos por nível de complexidade (contagem vetorizada sobre a coluna de códigos)"""
+        counts = np.bincount(self.complexity[self.start:self.stop], minlength=len(self.levels))
+        return {level: int(count) for level, count in zip(self.levels, counts) if count}
+
+    def close(self):
+        for column in self._text.values():
+            column.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    from batch import case_from_record, read_cases
+
+    parser = argparse.ArgumentParser(description="Store colunar de casos do Agente Médico Vizeval")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Converter um arquivo .jsonl/.csv em store")
+    build.add_argument("input")
+    build.add_argument("output")
+    info = commands.add_parser("info", help="Resumo de um store")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        store = CaseStore.write(args.output, (case_from_record(record) for _, record in read_cases(args.input)))
+    else:
+        store = CaseStore(args.path)
+    print(json.dumps({"path": store.path, "cases": len(store), "complexity": store.complexity_counts()},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Ingestão de documentos do paciente (PDF, DOCX, TXT)
+Leitura em blocos/mmap, cache do texto extraído por hash do conteúdo e extração paralela em processos
+"""
+
+import codecs
+import hashlib
+import mmap
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+try:
+    import pypdf
+except ImportError:  # PDFs exigem pypdf; DOCX e TXT usam só a biblioteca padrão
+    pypdf = None
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+# Bloco de leitura de arquivos de texto
+CHUNK_SIZE = 1 << 20
+
+# Muda quando a extração muda: textos antigos do cache deixam de ser usados
+EXTRACTOR_VERSION = 1
+
+# Hashes de arquivos lembrados por ingestor (os menos usados recentemente são esquecidos)
+MAX_DIGESTS = 4096
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class DocumentError(ValueError):
+    """Documento em formato não suportado ou ilegível"""
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 do conteúdo do arquivo, lido por mmap (sem copiar o arquivo para a memória)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def iter_text(path: str) -> Iterator[str]:
+    """Texto do documento em blocos (páginas do PDF, parágrafos do DOCX, blocos do TXT)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".txt":
+        yield from _iter_txt(path)
+    elif extension == ".docx":
+        yield from _iter_docx(path)
+    elif extension == ".pdf":
+        yield from _iter_pdf(path)
+    else:
+        raise DocumentError(f"Formato não suportado: {extension or os.path.basename(path)} "
+                            f"(aceitos: {', '.join(SUPPORTED_EXTENSIONS)})")
+
+
+def _iter_txt(path: str) -> Iterator[str]:
+    # Decodificação incremental: caracteres multibyte cortados entre blocos não se perdem
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def _iter_docx(path: str) -> Iterator[str]:
+    # document.xml é descompactado e analisado em streaming; cada parágrafo é liberado após o uso
+    try:
+        with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+            for _, element in ElementTree.iterparse(xml, events=("end",)):
+                if element.tag == f"{_WORD_NS}p":
+                    text = "".join(node.text or "" for node in element.iter(f"{_WORD_NS}t"))
+                    if text:
+                        yield text + "\n"
+                    element.clear()
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise DocumentError(f"DOCX inválido: {os.path.basename(path)} ({e})") from e
+
+
+def _iter_pdf(path: str) -> Iterator[str]:
+    if pypdf is None:
+        raise DocumentError("Leitura de PDF requer o pacote pypdf (pip install pypdf)")
+    with open(path, "rb") as f:
+        # mmap não mapeia arquivo vazio
+        if not os.fstat(f.fileno()).st_size:
+            raise DocumentError(f"PDF inválido: {os.path.basename(path)} (arquivo vazio)")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            try:
+                # O leitor percorre o arquivo mapeado e extrai uma página por vez
+                for page in pypdf.PdfReader(mapped).pages:
+                    text = page.extract_text() or ""
+                    if text:
+                        yield text + "\n\n"
+            except pypdf.errors.PdfReadError as e:
+                raise DocumentError(f"PDF inválido: {os.path.basename(path)} ({e})") from e
+
+
+def extract_to(path: str, target: str) -> int:
+    """Extrai o texto de `path` gravando em `target` bloco a bloco; retorna a quantidade de caracteres
+
+    Executado nos processos do pool. A gravação é atômica: um `target` existente está sempre completo.
+    """
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    chars = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for block in iter_text(path):
+                out.write(block)
+                chars += len(block)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return chars
+
+
+@dataclass(frozen=True)
+class PatientDocument:
+    """Documento ingerido: metadados do arquivo e o texto extraído no cache"""
+    path: str
+    name: str
+    size: int
+    sha256: str
+    text_path: str
+
+    @property
+    def text_size(self) -> int:
+        """Tamanho do texto extraído em bytes"""
+        return os.path.getsize(self.text_path)
+
+    def read(self, max_chars: Optional[int] = None) -> str:
+        """Texto extraído, ou só os primeiros `max_chars` caracteres"""
+        with open(self.text_path, encoding="utf-8") as f:
+            return f.read(-1 if max_chars is None else max_chars)
+
+
+class DocumentIngestor:
+    """Extrai e guarda o texto dos documentos do paciente
+
+    O texto fica em `cache_dir`, um arquivo por hash do conteúdo: reanalisar um caso, ou
+    anexar o mesmo arquivo a outro paciente, não reabre o documento original. Documentos
+    ainda não extraídos de uma mesma chamada são processados em paralelo em um pool de
+    processos (a extração de PDF é CPU-bound e não escala com threads).
+    """
+
+    def __init__(self, cache_dir: str = ".cache/documents", max_workers: Optional[int] = None,
+                 max_digests: int = MAX_DIGESTS):
+        """
+        Args:
+            cache_dir: Diretório do cache de textos extraídos
+            max_workers: Processos de extração (None = número de CPUs)
+            max_digests: Hashes de arquivos lembrados em memória (LRU)
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_digests = max_digests
+        os.makedirs(cache_dir, exist_ok=True)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Hash por (caminho, tamanho, mtime): arquivos inalterados não são relidos
+        self._digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"documents": 0, "cache_hits": 0, "extracted": 0}
+
+    def ingest(self, paths: Iterable[str]) -> List[PatientDocument]:
+        """Documentos na ordem de `paths`, extraindo os que ainda não estão no cache"""
+        documents = [self._describe(path) for path in paths]
+        missing = {}
+        for document in documents:
+            if not os.path.exists(document.text_path):
+                missing.setdefault(document.sha256, document)
+
+        if len(missing) == 1:
+            document = next(iter(missing.values()))
+            extract_to(document.path, document.text_path)
+        elif missing:
+            pool = self._executor()
+            futures = [pool.submit(extract_to, d.path, d.text_path) for d in missing.values()]
+            for future in futures:
+                future.result()
+
+        with self._lock:
+            self._stats["documents"] += len(documents)
+            self._stats["extracted"] += len(missing)
+            self._stats["cache_hits"] += len(documents) - len(missing)
+        return documents
+
+    def ingest_text(self, name: str, text: str) -> PatientDocument:
+        """Texto já disponível (como o histórico do caso) guardado no cache como documento"""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        text_path = os.path.join(self.cache_dir, f"{digest}.v{EXTRACTOR_VERSION}.txt")
+        if not os.path.exists(text_path):
+            tmp_path = f"{text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as out:
+                out.write(data)
+            os.replace(tmp_path, text_path)
+        return PatientDocument("", name, len(data), digest, text_path)
+
+    def stats(self) -> Dict[str, int]:
+        """Documentos pedidos, extraídos e atendidos pelo cache"""
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        """Encerra os processos de extração"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def _describe(self, path: str) -> PatientDocument:
+        if os.path.splitext(path)[1].lower() not in SUPPORTED_EXTENSIONS:
+            raise DocumentError(f"Formato não suportado: {os.path.basename(path)} "
+                                f"(aceitos: {', '.join(SUPPORTED_EXTENSIONS)})")
+        stat = os.stat(path)
+        signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(signature)
+            if digest is not None:
+                self._digests.move_to_end(signature)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                self._digests[signature] = digest
+                while len(self._digests) > self.max_digests:
+                    self._digests.popitem(last=False)
+        text_path = os.path.join(self.cache_dir, f"{digest}.v{EXTRACTOR_VERSION}.txt")
+        return PatientDocument(path, os.path.basename(path), stat.st_size, digest, text_path)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: seguro em processos com threads (Streamlit, workers de jobs)
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
@@ -0,0 +1,319 @@
+"""
+Avaliadores Vizeval com requisições hedged e circuit breaker
+Um ou mais endpoints por URL de avaliação; com todos indisponíveis, a resposta segue sem avaliação
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set
+
+from vizeval import EvaluationResponse
+from vizeval.exceptions import VizevalAPIError
+
+from rate_limit import Upstream, classify
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class EvaluatorUnavailable(VizevalAPIError):
+    """Nenhum endpoint de avaliação saudável: a resposta deve seguir sem avaliação"""
+
+
+def split_urls(base_url: str) -> List[str]:
+    """Endpoints de uma URL de avaliação (várias URLs separadas por vírgula)"""
+    return [url.strip().rstrip("/") for url in base_url.split(",") if url.strip()]
+
+
+class CircuitBreaker:
+    """Circuit breaker de um endpoint
+
+    Após `failure_threshold` falhas transitórias seguidas o circuito abre e as chamadas são
+    recusadas na hora; depois de `reset_timeout` segundos uma única chamada de teste é liberada
+    (meio aberto) e o resultado dela fecha ou reabre o circuito.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Se uma chamada pode ser feita agora (no estado meio aberto, reserva a chamada de teste)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state, self._probing = HALF_OPEN, False
+            if self.state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == CLOSED
+
+    def record_success(self):
+        with self._lock:
+            self.state, self._failures, self._probing = CLOSED, 0, False
+
+    def release(self):
+        """Devolve a chamada de teste reservada por `allow()` que foi cancelada ou não chegou a ser feita"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state, self._opened_at, self._probing = OPEN, time.monotonic(), False
+
+
+class _EndpointSet:
+    """Estado comum aos pools síncrono e assíncrono: breakers, latências recentes e escolha de endpoint"""
+
+    def __init__(self, clients: Dict[str, Any], limiter: Upstream, hedge_quantile: float = 0.95,
+                 min_samples: int = 20, min_hedge_delay: float = 0.05, window: int = 256,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            clients: Cliente Vizeval por URL de endpoint
+            limiter: Limitador do upstream Vizeval (cotas, concorrência e Retry-After)
+            hedge_quantile: Quantil da latência recente após o qual a requisição é duplicada
+            min_samples: Latências observadas antes de começar a duplicar
+            min_hedge_delay: Espera mínima antes da duplicata
+            window: Quantidade de latências recentes consideradas
+        """
+        self.clients = clients
+        self.urls = list(clients)
+        self.limiter = limiter
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.breakers = {url: CircuitBreaker(failure_threshold, reset_timeout) for url in self.urls}
+        self._latencies: deque = deque(maxlen=window)
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "short_circuits": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """Espera antes da duplicata (None = ainda sem histórico suficiente)"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return max(self.min_hedge_delay, ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))])
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de requisições, duplicatas e recusas, a espera atual e o estado de cada endpoint"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_delay_s"] = self.hedge_delay()
+        stats["breakers"] = {url: breaker.state for url, breaker in self.breakers.items()}
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _pick(self, exclude: Set[str] = frozenset()) -> Optional[str]:
+        """Próximo endpoint liberado pelo breaker, em rodízio"""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.urls)
+        for i in range(len(self.urls)):
+            url = self.urls[(start + i) % len(self.urls)]
+            if url not in exclude and self.breakers[url].allow():
+                return url
+        return None
+
+    def _hedge_target(self, primary: str) -> Optional[str]:
+        # Outro endpoint saudável, ou o mesmo se for o único e estiver fechado
+        target = self._pick(exclude={primary})
+        if target is None and self.breakers[primary].state == CLOSED:
+            target = primary
+        return target
+
+    def _retries(self, url: str) -> Optional[int]:
+        """Repetições do limitador para uma requisição a `url`
+
+        Com outro endpoint de circuito fechado, falhas vão direto ao breaker e a duplicata ou o
+        failover cobrem (0); com um único endpoint saudável, vale o Retry-After e o backoff do
+        limitador (None = padrão do upstream).
+        """
+        if any(other != url and self.breakers[other].state == CLOSED for other in self.urls):
+            return 0
+        return None
+
+    def _observe(self, url: str, latency: Optional[float], error: Optional[BaseException]):
+        if error is None:
+            self.breakers[url].record_success()
+            with self._lock:
+                self._latencies.append(latency)
+        elif classify(error)[0]:
+            self.breakers[url].record_failure()
+        else:
+            # Erro da requisição (4xx), não do endpoint
+            self.breakers[url].record_success()
+
+    def _unavailable(self, error: Optional[BaseException] = None) -> BaseException:
+        """Erro final: falhas transitórias viram EvaluatorUnavailable; erros da requisição são repassados"""
+        if error is not None and not classify(error)[0]:
+            return error
+        detail = f": {error}" if error is not None else " (circuit breaker aberto)"
+        return EvaluatorUnavailable(f"Avaliadores Vizeval indisponíveis{detail}")
+
+
+class EvaluatorPool(_EndpointSet):
+    """Avaliação com duplicata após o p95, failover entre endpoints e circuit breaker (síncrono)"""
+
+    def __init__(self, clients: Dict[str, Any], limiter: Upstream, max_workers: int = 64, **kwargs):
+        super().__init__(clients, limiter, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vizeval-hedge")
+
+    def evaluate(self, **kwargs) -> EvaluationResponse:
+        """Mesmos argumentos de VizevalClient.evaluate; vence a primeira resposta bem-sucedida"""
+        self._count("requests")
+        primary = self._pick()
+        if primary is None:
+            self._count("short_circuits")
+            raise self._unavailable()
+
+        first = self._pool.submit(self._request, primary, kwargs)
+        futures = {first: primary}
+        tried = {primary}
+        delay = self.hedge_delay()
+        done, _ = wait(futures, timeout=delay)
+        if not done and delay is not None:
+            hedge = self._hedge_target(primary)
+            if hedge is not None:
+                self._count("hedges")
+                futures[self._pool.submit(self._request, hedge, kwargs)] = hedge
+                tried.add(hedge)
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is not first:
+                    self._count("hedge_wins")
+                # As demais requisições terminam em segundo plano (resultado descartado)
+                return result
+            if not pending:
+                # Todas falharam por falha transitória: tentar um endpoint ainda não usado
+                failover = self._pick(exclude=tried) if classify(error)[0] else None
+                if failover is not None:
+                    self._count("failovers")
+                    tried.add(failover)
+                    future = self._pool.submit(self._request, failover, kwargs)
+                    futures[future] = failover
+                    pending = {future}
+        raise self._unavailable(error)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for client in self.clients.values():
+            client.session.close()
+
+    def _request(self, url: str, kwargs: Dict[str, Any]) -> EvaluationResponse:
+        latency = None
+
+        def request():
+            # Só a chamada ao endpoint entra na latência: espera por cota ou vaga não é lentidão dele
+            nonlocal latency
+            started = time.monotonic()
+            result = self.clients[url].evaluate(**kwargs)
+            latency = time.monotonic() - started
+            return result
+
+        try:
+            result = self.limiter.call(request, max_retries=self._retries(url))
+        except Exception as e:
+            self._observe(url, None, e)
+            raise
+        self._observe(url, latency, None)
+        return result
+
+
+class AsyncEvaluatorPool(_EndpointSet):
+    """Avaliação com duplicata após o p95, failover entre endpoints e circuit breaker (assíncrono)"""
+
+    async def evaluate(self, **kwargs) -> EvaluationResponse:
+        """Mesmos argumentos de AsyncVizevalClient.evaluate; vence a primeira resposta bem-sucedida"""
+        self._count("requests")
+        primary = self._pick()
+        if primary is None:
+            self._count("short_circuits")
+            raise self._unavailable()
+
+        first = asyncio.ensure_future(self._request(primary, kwargs))
+        tasks = {first: primary}
+        tried = {primary}
+        delay = self.hedge_delay()
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and delay is not None:
+            hedge = self._hedge_target(primary)
+            if hedge is not None:
+                self._count("hedges")
+                tasks[asyncio.ensure_future(self._request(hedge, kwargs))] = hedge
+                tried.add(hedge)
+
+        pending, error = set(tasks), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is not first:
+                        self._count("hedge_wins")
+                    return task.result()
+                if not pending:
+                    failover = self._pick(exclude=tried) if classify(error)[0] else None
+                    if failover is not None:
+                        self._count("failovers")
+                        tried.add(failover)
+                        pending = {asyncio.ensure_future(self._request(failover, kwargs))}
+        finally:
+            # Cancelar as requisições perdedoras (e descartar erros de quem terminar antes disso)
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise self._unavailable(error)
+
+    async def aclose(self):
+        for client in self.clients.values():
+            await client.aclose()
+
+    async def _request(self, url: str, kwargs: Dict[str, Any]) -> EvaluationResponse:
+        latency = None
+
+        async def request():
+            # Só a chamada ao endpoint entra na latência: espera por cota ou vaga não é lentidão dele
+            nonlocal latency
+            started = time.monotonic()
+            result = await self.clients[url].evaluate(**kwargs)
+            latency = time.monotonic() - started
+            return result
+
+        try:
+            result = await self.limiter.acall(request, max_retries=self._retries(url))
+        except asyncio.CancelledError:
+            # Duplicata perdedora ou análise cancelada: sem resultado, a chamada de teste volta ao breaker
+            self.breakers[url].release()
+            raise
+        except Exception as e:
+            self._observe(url, None, e)
+            raise
+        self._observe(url, latency, None)
+        return result
@@ -0,0 +1,358 @@
+"""
+Histórico de análises do Agente Médico Vizeval
+Armazenamento limitado (memória ou SQLite) com paginação e agregados mantidos a cada inserção
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+# Sessões sem acesso há mais que isso são removidas (a interface cria uma sessão nova por visita)
+SESSION_TTL = 30 * 24 * 3600
+
+# Intervalo mínimo entre duas limpezas de sessões expiradas
+PURGE_INTERVAL = 3600.0
+
+# Leituras só regravam o último acesso da sessão quando ele tem mais que isso (a expiração é em dias)
+TOUCH_INTERVAL = 3600.0
+
+
+def _summary(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos do resultado usados na tabela e nos agregados"""
+    metrics = result.get("quality_metrics", {})
+    return {
+        "patient_id": result.get("patient_id"),
+        "final_score": metrics.get("final_score"),
+        "passed": bool(metrics.get("passed_threshold", False)),
+        "total_attempts": metrics.get("total_attempts") or 0,
+        "error": "error" in metrics
+    }
+
+
+def _empty_aggregates() -> Dict[str, Any]:
+    return {"count": 0, "scored": 0, "score_sum": 0.0, "passed": 0, "attempts_sum": 0}
+
+
+def _apply(aggregates: Dict[str, Any], summary: Dict[str, Any], sign: int):
+    """Soma (sign=1) ou remove (sign=-1) uma entrada dos agregados"""
+    aggregates["count"] += sign
+    aggregates["passed"] += sign * summary["passed"]
+    aggregates["attempts_sum"] += sign * summary["total_attempts"]
+    if summary["final_score"] is not None:
+        aggregates["scored"] += sign
+        aggregates["score_sum"] += sign * summary["final_score"]
+
+
+def _with_averages(aggregates: Dict[str, Any]) -> Dict[str, Any]:
+    aggregates = dict(aggregates)
+    aggregates["avg_score"] = aggregates["score_sum"] / aggregates["scored"] if aggregates["scored"] else None
+    aggregates["pass_rate"] = aggregates["passed"] / aggregates["count"] if aggregates["count"] else None
+    return aggregates
+
+
+class HistoryStore(ABC):
+    """Interface do histórico de análises, particionado por sessão
+
+    Implementações guardam no máximo `max_entries` resultados por sessão (os mais antigos saem
+    primeiro) e mantêm os agregados atualizados na inserção e na remoção, sem reler o histórico.
+    Sessões sem acesso há mais de `session_ttl` segundos são removidas inteiras por uma limpeza
+    periódica feita na inserção, e `max_total_entries` limita o total de entradas de todas as
+    sessões (as sessões acessadas há mais tempo saem primeiro).
+    """
+
+    @abstractmethod
+    def add(self, session_id: str, result: Dict[str, Any]):
+        """Guarda o resultado de uma análise na sessão"""
+
+    @abstractmethod
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Resultado completo mais recente da sessão"""
+
+    @abstractmethod
+    def page(self, session_id: str, page: int = 0, page_size: int = 20) -> List[Dict[str, Any]]:
+        """Resumos (mais recentes primeiro) de uma página do histórico"""
+
+    @abstractmethod
+    def aggregates(self, session_id: str) -> Dict[str, Any]:
+        """Contagem, score médio, taxa de aprovação e total de tentativas da sessão"""
+
+    @abstractmethod
+    def clear(self, session_id: str):
+        """Remove o histórico inteiro da sessão"""
+
+    @abstractmethod
+    def purge(self) -> int:
+        """Remove sessões expiradas e, acima de `max_total_entries`, as menos recentes; retorna quantas saíram"""
+
+
+class MemoryHistoryStore(HistoryStore):
+    """Histórico em memória, limitado por sessão e no total"""
+
+    def __init__(self, max_entries: int = 500, session_ttl: Optional[float] = SESSION_TTL,
+                 max_total_entries: Optional[int] = None, purge_interval: float = PURGE_INTERVAL):
+        self.max_entries = max_entries
+        self.session_ttl = session_ttl
+        self.max_total_entries = max_total_entries
+        self.purge_interval = purge_interval
+        self._entries: Dict[str, deque] = {}
+        self._aggregates: Dict[str, Dict[str, Any]] = {}
+        self._numbers: Dict[str, int] = {}
+        self._accessed: Dict[str, float] = {}
+        self._purged_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, session_id: str, result: Dict[str, Any]):
+        summary = _summary(result)
+        with self._lock:
+            self._accessed[session_id] = time.time()
+            entries = self._entries.setdefault(session_id, deque())
+            aggregates = self._aggregates.setdefault(session_id, _empty_aggregates())
+            self._numbers[session_id] = self._numbers.get(session_id, 0) + 1
+            entries.append((self._numbers[session_id], summary, result))
+            _apply(aggregates, summary, 1)
+            while len(entries) > self.max_entries:
+                _, evicted, _ = entries.popleft()
+                _apply(aggregates, evicted, -1)
+            if self.max_total_entries is not None or time.monotonic() - self._purged_at >= self.purge_interval:
+                self._purge(keep=session_id)
+
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if session_id in self._accessed:
+                self._accessed[session_id] = time.time()
+            entries = self._entries.get(session_id)
+            return entries[-1][2] if entries else None
+
+    def page(self, session_id: str, page: int = 0, page_size: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = self._entries.get(session_id, deque())
+            start = page * page_size
+            return [{"number": number, **summary}
+                    for number, summary, _ in islice(reversed(entries), start, start + page_size)]
+
+    def aggregates(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return _with_averages(self._aggregates.get(session_id, _empty_aggregates()))
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def purge(self) -> int:
+        with self._lock:
+            return self._purge()
+
+    def _purge(self, keep: Optional[str] = None) -> int:
+        self._purged_at = time.monotonic()
+        removed = 0
+        if self.session_ttl is not None:
+            cutoff = time.time() - self.session_ttl
+            for session_id in [s for s, accessed in self._accessed.items() if accessed < cutoff and s != keep]:
+                self._drop(session_id)
+                removed += 1
+        if self.max_total_entries is not None:
+            total = sum(len(entries) for entries in self._entries.values())
+            for session_id in sorted(self._accessed, key=self._accessed.get):
+                if total <= self.max_total_entries:
+                    break
+                if session_id != keep:
+                    total -= len(self._entries[session_id])
+                    self._drop(session_id)
+                    removed += 1
+        return removed
+
+    def _drop(self, session_id: str):
+        self._entries.pop(session_id, None)
+        self._aggregates.pop(session_id, None)
+        self._numbers.pop(session_id, None)
+        self._accessed.pop(session_id, None)
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """Histórico persistente em SQLite, limitado por sessão e no total"""
+
+    def __init__(self, path: str, max_entries: int = 500, session_ttl: Optional[float] = SESSION_TTL,
+                 max_total_entries: Optional[int] = None, purge_interval: float = PURGE_INTERVAL):
+        self.max_entries = max_entries
+        self.session_ttl = session_ttl
+        self.max_total_entries = max_total_entries
+        self.purge_interval = purge_interval
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                patient_id TEXT,
+                final_score REAL,
+                passed INTEGER NOT NULL,
+                total_attempts INTEGER NOT NULL,
+                error INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                result TEXT NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id)")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS history_aggregates (
+                session_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                scored INTEGER NOT NULL,
+                score_sum REAL NOT NULL,
+                passed INTEGER NOT NULL,
+                attempts_sum INTEGER NOT NULL,
+                last_number INTEGER NOT NULL,
+                last_access REAL NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(history_aggregates)")}
+        if "last_access" not in columns:
+            # Arquivo de uma versão anterior: as sessões existentes contam como acessadas agora
+            self._db.execute("ALTER TABLE history_aggregates ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._db.execute("UPDATE history_aggregates SET last_access = ?", (time.time(),))
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_aggregates_access ON history_aggregates (last_access)")
+        self._db.commit()
+
+    def add(self, session_id: str, result: Dict[str, Any]):
+        summary = _summary(result)
+        with self._lock:
+            now = time.time()
+            aggregates, last_number = self._load_aggregates(session_id)
+            number = last_number + 1
+            self._db.execute(
+                "INSERT INTO history (session_id, number, patient_id, final_score, passed, total_attempts, error, "
+                "created_at, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, number, summary["patient_id"], summary["final_score"], summary["passed"],
+                 summary["total_attempts"], summary["error"], now, json.dumps(result, ensure_ascii=False))
+            )
+            _apply(aggregates, summary, 1)
+
+            # Retenção: remover as entradas mais antigas além do limite, descontando-as dos agregados
+            excess = aggregates["count"] - self.max_entries
+            if excess > 0:
+                evicted = self._db.execute(
+                    "SELECT id, patient_id, final_score, passed, total_attempts, error FROM history "
+                    "WHERE session_id = ? ORDER BY id LIMIT ?", (session_id, excess)
+                ).fetchall()
+                for _, patient_id, final_score, passed, total_attempts, error in evicted:
+                    _apply(aggregates, {"patient_id": patient_id, "final_score": final_score, "passed": passed,
+                                        "total_attempts": total_attempts, "error": error}, -1)
+                self._db.executemany("DELETE FROM history WHERE id = ?", [(row[0],) for row in evicted])
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO history_aggregates (session_id, count, scored, score_sum, passed, attempts_sum, "
+                "last_number, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (session_id, aggregates["count"], aggregates["scored"], aggregates["score_sum"], aggregates["passed"],
+                 aggregates["attempts_sum"], number, now)
+            )
+            if self.max_total_entries is not None or time.monotonic() - self._purged_at >= self.purge_interval:
+                self._purge(keep=session_id)
+            self._db.commit()
+
+    def latest(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # Reabrir uma sessão antiga (mesmo link) adia a expiração dela; a interface chama latest()
+            # a cada interação, então o acesso só é gravado quando o último tem mais de TOUCH_INTERVAL
+            now = time.time()
+            touched = self._db.execute("SELECT last_access FROM history_aggregates WHERE session_id = ?",
+                                       (session_id,)).fetchone()
+            if touched is not None and now - touched[0] >= TOUCH_INTERVAL:
+                self._db.execute("UPDATE history_aggregates SET last_access = ? WHERE session_id = ?",
+                                 (now, session_id))
+                self._db.commit()
+            row = self._db.execute("SELECT result FROM history WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+                                   (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def page(self, session_id: str, page: int = 0, page_size: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT number, patient_id, final_score, passed, total_attempts, error FROM history "
+                "WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, page_size, page * page_size)
+            ).fetchall()
+        return [
+            {"number": number, "patient_id": patient_id, "final_score": final_score, "passed": bool(passed),
+             "total_attempts": total_attempts, "error": bool(error)}
+            for number, patient_id, final_score, passed, total_attempts, error in rows
+        ]
+
+    def aggregates(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            aggregates, _ = self._load_aggregates(session_id)
+        return _with_averages(aggregates)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+            self._db.commit()
+
+    def purge(self) -> int:
+        with self._lock:
+            removed = self._purge()
+            self._db.commit()
+        return removed
+
+    def close(self):
+        """Fecha o arquivo SQLite"""
+        with self._lock:
+            self._db.close()
+
+    def _purge(self, keep: Optional[str] = None) -> int:
+        """Remove sessões expiradas e as menos recentes acima do limite total (sem commit)"""
+        self._purged_at = time.monotonic()
+        expired = []
+        if self.session_ttl is not None:
+            expired = [row[0] for row in self._db.execute(
+                "SELECT session_id FROM history_aggregates WHERE last_access < ? AND session_id != ?",
+                (time.time() - self.session_ttl, keep or "")
+            )]
+            for session_id in expired:
+                self._drop(session_id)
+        if self.max_total_entries is None:
+            return len(expired)
+
+        # Limite global: sessões inteiras saem, das acessadas há mais tempo às mais recentes
+        total = self._db.execute("SELECT COALESCE(SUM(count), 0) FROM history_aggregates").fetchone()[0]
+        evicted = []
+        if total > self.max_total_entries:
+            rows = self._db.execute(
+                "SELECT session_id, count FROM history_aggregates WHERE session_id != ? ORDER BY last_access",
+                (keep or "",)
+            )
+            for session_id, count in rows:
+                if total <= self.max_total_entries:
+                    break
+                evicted.append(session_id)
+                total -= count
+            for session_id in evicted:
+                self._drop(session_id)
+        return len(expired) + len(evicted)
+
+    def _drop(self, session_id: str):
+        self._db.execute("DELETE FROM history WHERE session_id = ?", (session_id,))
+        self._db.execute("DELETE FROM history_aggregates WHERE session_id = ?", (session_id,))
+
+    def _load_aggregates(self, session_id: str):
+        row = self._db.execute(
+            "SELECT count, scored, score_sum, passed, attempts_sum, last_number FROM history_aggregates "
+            "WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return _empty_aggregates(), 0
+        count, scored, score_sum, passed, attempts_sum, last_number = row
+        return {"count": count, "scored": scored, "score_sum": score_sum, "passed": passed,
+                "attempts_sum": attempts_sum}, last_number
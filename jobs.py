@@ -0,0 +1,126 @@
+"""
+Fila de análises em segundo plano do Agente Médico Vizeval
+Jobs com ID executados em um pool de threads, com progresso consultável pela interface
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+from medical_agent import AnalysisConfig, MedicalAgent, MedicalCase
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Jobs concluídos que nenhuma sessão recolheu (aba fechada) são descartados após esse tempo
+FINISHED_TTL = 3600.0
+
+
+@dataclass
+class Job:
+    """Estado de uma análise enfileirada"""
+    id: str
+    patient_id: str
+    status: str = QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Texto parcial da tentativa em andamento e linhas de status (score, retries)
+    text: str = ""
+    status_lines: List[str] = field(default_factory=list)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def elapsed(self) -> float:
+        """Segundos desde o envio (até o fim, se já terminou)"""
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+class JobQueue:
+    """Executa análises em segundo plano; a interface apenas envia jobs e consulta o progresso
+
+    Jobs concluídos ficam na fila até a sessão recolhê-los (`forget`); os que ninguém recolhe
+    são descartados `finished_ttl` segundos após o fim, a cada envio ou em `sweep()`.
+    """
+
+    def __init__(self, agent: MedicalAgent, max_workers: int = 4, finished_ttl: float = FINISHED_TTL):
+        self.agent = agent
+        self.finished_ttl = finished_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medical-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, case: MedicalCase, config: Optional[AnalysisConfig] = None, refresh: bool = False) -> str:
+        """Enfileira a análise de um caso e devolve o ID do job"""
+        job = Job(id=uuid.uuid4().hex[:8], patient_id=case.patient_id)
+        self.sweep()
+        with self._lock:
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, case, config, refresh)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Cópia do estado atual do job (None se desconhecido)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return replace(job, status_lines=list(job.status_lines)) if job is not None else None
+
+    def forget(self, job_id: str):
+        """Descarta um job concluído cujo resultado já foi recolhido"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.active:
+                del self._jobs[job_id]
+
+    def sweep(self) -> int:
+        """Descarta jobs concluídos há mais de `finished_ttl` segundos; retorna quantos saíram"""
+        cutoff = time.time() - self.finished_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if not job.active and job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _update(self, job: Job, **changes):
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+
+    def _run(self, job: Job, case: MedicalCase, config: Optional[AnalysisConfig], refresh: bool):
+        self._update(job, status=RUNNING, started_at=time.time())
+        try:
+            # Modo profiling do agente: CPU local e memória do job inteiro (geração, avaliação e eventos)
+            with self.agent.profiler.profile(f"job-{case.patient_id}"):
+                for event in self.agent.stream_case(case, config=config, refresh=refresh):
+                    if event["type"] == "token":
+                        with self._lock:
+                            job.text += event["text"]
+                    elif event["type"] == "evaluation":
+                        score = f"{event['score']:.3f}" if event["score"] is not None else "N/A"
+                        outcome = "✅ aprovada" if event["passed"] else "❌ abaixo do threshold"
+                        if not event.get("evaluated", True):
+                            outcome = "⚠️ não avaliada (avaliadores indisponíveis)"
+                        with self._lock:
+                            job.status_lines.append(f"Tentativa {event['attempt']}: score Vizeval {score} {outcome}")
+                    elif event["type"] == "retry":
+                        with self._lock:
+                            job.text = ""
+                            job.status_lines.append(f"🔄 Gerando tentativa {event['attempt']}...")
+                    elif event["type"] == "result":
+                        result = event["result"]
+                        status = FAILED if "error" in result["quality_metrics"] else DONE
+                        self._update(job, status=status, result=result, text=result["analysis"],
+                                     error=result["quality_metrics"].get("error"), finished_at=time.time())
+        except Exception as e:
+            self._update(job, status=FAILED, error=str(e), finished_at=time.time())
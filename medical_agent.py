@@ -3,32 +3,421 @@ Agente Médico Inteligente com Avaliação Vizeval
 Demo do Hackathon Adapta
 """
 
+import asyncio
+import json
 import os
-from dataclasses import dataclass
-from typing import List, Dict, Any
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.markdown import Markdown
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import List, Dict, Any, AsyncIterator, Iterable, Iterator, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
 
-from vizeval import OpenAI, VizevalConfig, Evaluator
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from requests.adapters import HTTPAdapter
+from vizeval import EvaluationRequest, EvaluationResponse, VizevalClient, VizevalConfig, Evaluator
+from vizeval import VizevalAPIError, VizevalConfigError
+from vizeval.evaluators import validate_evaluator
+from vizeval.exceptions import VizevalOpenAIError
 
-console = Console()
+from analytics import FleetAnalytics
+from attempt_log import AttemptLog
+from documents import DocumentIngestor
+from evaluator_pool import AsyncEvaluatorPool, EvaluatorPool, EvaluatorUnavailable, split_urls
+from metrics import AgentMetrics, attempt_stats
+from profiling import Profiler
+from prompt_builder import PromptBuilder, context_window, count_message_tokens, count_tokens, fit_max_tokens, trim_text
+from rate_limit import Upstream, parse_retry_after
+from response_cache import ResponseCache, cache_key
+from retrieval import RetrievalIndex
+from retry_policy import LearnedRetryPolicy, RetryPolicy
+from single_flight import SingleFlight
 
-@dataclass
+class _LazyConsole:
+    """Console rich do módulo, criado no primeiro uso
+
+    Usado como biblioteca (Streamlit, jobs, batch) o agente não carrega rich na importação;
+    rich só é importado quando algo é de fato escrito no terminal.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_console", None)
+
+    def get(self):
+        if self._console is None:
+            from rich.console import Console
+            object.__setattr__(self, "_console", Console())
+        return self._console
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.get(), name, value)
+
+console = _LazyConsole()
+
+# Timeouts do cliente OpenAI (mesmos valores padrão da SDK)
+OPENAI_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+def http_limits(max_connections: int) -> httpx.Limits:
+    """Pool de conexões keep-alive compartilhado pelas chamadas concorrentes de um agente"""
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                        keepalive_expiry=60.0)
+
+# Trechos de documentos por prompt: quantidade e orçamento de tokens, qualquer que seja o tamanho do prontuário
+DOCUMENT_PASSAGES = 6
+DOCUMENT_TOKENS = 1000
+
+# Históricos maiores que isso vão para o índice: o prompt recebe o início e os trechos relevantes do restante
+HISTORY_TOKENS = 500
+HISTORY_DOCUMENT = "Histórico completo"
+
+UNEVALUATED_FEEDBACK = "Resposta não avaliada: avaliadores Vizeval indisponíveis"
+
+# Conjuntos de endpoints Vizeval com clientes abertos por agente; o menos usado recentemente é fechado
+MAX_EVALUATOR_POOLS = 8
+
+class CandidateCancelled(Exception):
+    """Candidato especulativo interrompido porque outro já venceu a rodada"""
+
+@dataclass(slots=True)
 class MedicalCase:
-    """Representa um caso médico"""
+    """Representa um caso médico (com __slots__: sem __dict__ por instância em corpora grandes)"""
     patient_id: str
     symptoms: str
     medical_history: str
     complexity_level: str
     expected_focus: List[str] = None
+    # Caminhos de documentos do paciente (PDF, DOCX, TXT) anexados ao caso
+    documents: List[str] = None
+
+@dataclass(frozen=True)
+class AnalysisConfig:
+    """Configuração imutável de uma análise (geração + avaliação Vizeval)"""
+    threshold: float = 0.85
+    max_retries: int = 3
+    evaluator: str = Evaluator.MEDICAL.value
+    base_url: str = "http://localhost:8000"
+    metadata: Mapping[str, Any] = field(default_factory=dict)
+    model: str = "gpt-4"
+    temperature: float = 0.7
+    max_tokens: int = 1500
+    # Candidatos gerados e avaliados em paralelo por rodada (1 = retries sequenciais)
+    speculative_candidates: int = 1
+    
+    def __post_init__(self):
+        if not 0 <= self.threshold <= 1:
+            raise ValueError("threshold deve estar entre 0 e 1")
+        if self.max_retries < 0:
+            raise ValueError("max_retries deve ser maior ou igual a 0")
+        if self.speculative_candidates < 1:
+            raise ValueError("speculative_candidates deve ser maior ou igual a 1")
+        urls = split_urls(self.base_url)
+        if not urls or any(urlsplit(url).scheme not in ("http", "https") or not urlsplit(url).netloc for url in urls):
+            raise ValueError(f"base_url inválida: {self.base_url!r}")
+        # Forma canônica: a mesma lista de endpoints reaproveita os mesmos clientes do agente
+        object.__setattr__(self, "base_url", ",".join(urls))
+        # Cópia somente leitura: chamadas concorrentes não compartilham estado mutável
+        object.__setattr__(self, "metadata", MappingProxyType(dict(self.metadata)))
+
+@dataclass(frozen=True)
+class Route:
+    """Parâmetros de geração e avaliação escolhidos para um nível de complexidade"""
+    model: str = "gpt-4"
+    max_tokens: int = 1500
+    temperature: float = 0.7
+    threshold: float = 0.85
+    max_retries: int = 3
+    speculative_candidates: int = 1
+
+# Casos simples vão para um modelo mais rápido e barato; casos graves mantêm GPT-4 completo
+# e os urgentes trocam tokens extras por latência com candidatos especulativos em paralelo
+DEFAULT_ROUTES = {
+    "low": Route(model="gpt-4o-mini", max_tokens=800, temperature=0.5, threshold=0.7, max_retries=2),
+    "medium": Route(model="gpt-4o-mini", max_tokens=1200, threshold=0.8, max_retries=3),
+    "high": Route(threshold=0.9, speculative_candidates=3),
+    "very_high": Route(max_tokens=2000, threshold=0.9, speculative_candidates=3),
+    # Sintomas vagos raramente melhoram com muitos retries
+    "extreme": Route(max_tokens=2000, threshold=0.85, max_retries=2)
+}
+
+class RoutingPolicy:
+    """Escolhe modelo, orçamento de tokens, threshold e retries a partir da complexidade do caso
+    
+    Níveis desconhecidos usam a rota `default` (tratamento completo). Casos de nível conhecido cujo
+    texto passa de `escalate_above_chars` sobem para `escalation_level` quando este é mais exigente.
+    A ordem de `routes` define a ordem de exigência dos níveis.
+    """
+    
+    def __init__(self, routes: Optional[Mapping[str, Route]] = None, default: Route = Route(),
+                 escalate_above_chars: Optional[int] = 1500, escalation_level: str = "high"):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.default = default
+        self.escalate_above_chars = escalate_above_chars
+        self.escalation_level = escalation_level
+        self._rank = {level: i for i, level in enumerate(self.routes)}
+    
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "RoutingPolicy":
+        """Política a partir de um dicionário (ex.: JSON) com "routes", "default" e opções de escalonamento"""
+        routes = {level: Route(**route) for level, route in data["routes"].items()} if "routes" in data else None
+        return cls(
+            routes=routes,
+            default=Route(**data.get("default", {})),
+            escalate_above_chars=data.get("escalate_above_chars", 1500),
+            escalation_level=data.get("escalation_level", "high")
+        )
+    
+    @classmethod
+    def from_file(cls, path: str) -> "RoutingPolicy":
+        """Política a partir de um arquivo JSON"""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+    
+    def level_for(self, case: MedicalCase) -> str:
+        """Nível efetivo do caso, após normalização e escalonamento por tamanho"""
+        level = (case.complexity_level or "").strip().lower()
+        size = len(case.symptoms or "") + len(case.medical_history or "")
+        if (self.escalate_above_chars is not None and size > self.escalate_above_chars
+                and level in self._rank and self._rank.get(self.escalation_level, -1) > self._rank[level]):
+            return self.escalation_level
+        return level
+    
+    def route_for(self, case: MedicalCase) -> Route:
+        """Rota do caso (a rota padrão para níveis desconhecidos)"""
+        return self.routes.get(self.level_for(case), self.default)
+
+class _AttemptLoop:
+    """Estado do ciclo gerar → avaliar → retry, compartilhado pelos agentes síncrono e assíncrono"""
+    
+    def __init__(self, system_prompt: str, user_prompt: str, config: AnalysisConfig,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self.config = config
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.level = config.metadata.get("complexity", "")
+        self.system_prompt = system_prompt
+        self.user_prompt = user_prompt
+        self.messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        self.temperature = config.temperature
+        self.attempts: List[Dict[str, Any]] = []
+        self.best = None
+        self.passed = None
+        # Resposta gerada sem avaliação (avaliadores indisponíveis): usada só se nenhuma foi avaliada
+        self.unevaluated = None
+        # Motivo da parada antes de esgotar max_retries ("gain" ou "budget"), quando a política recusou o retry
+        self.early_stop: Optional[str] = None
+        # Rodada atual de candidatos especulativos (0 = tentativas sequenciais: a rodada é a própria tentativa)
+        self.round = 0
+        # Último erro de geração/avaliação: vira a causa quando nenhuma tentativa produz resposta
+        self.last_error: Optional[Exception] = None
+        self.started = time.perf_counter()
+        self.retry_policy.begin(self.level)
+    
+    def attempt_numbers(self) -> range:
+        """Números das tentativas permitidas (primeira + retries)"""
+        return range(1, self.config.max_retries + 2)
+    
+    def request_kwargs(self) -> Dict[str, Any]:
+        """Argumentos de chat.completions.create para a próxima tentativa"""
+        return {
+            "model": self.config.model,
+            "messages": self.messages,
+            "temperature": self.temperature,
+            # Retries reenviam a resposta reprovada: a resposta encolhe para caber na janela do modelo
+            "max_tokens": fit_max_tokens(self.messages, self.config.model, self.config.max_tokens)
+        }
+    
+    def evaluation_kwargs(self, content: str) -> Dict[str, Any]:
+        """Argumentos da avaliação Vizeval para uma resposta gerada"""
+        return {
+            "system_prompt": self.system_prompt.strip(),
+            "user_prompt": self.user_prompt.strip(),
+            "response": content,
+            "evaluator": self.config.evaluator,
+            "metadata": dict(self.config.metadata)
+        }
+    
+    def rounds(self, size: int) -> Iterator[List[int]]:
+        """Tentativas agrupadas em rodadas de até `size` candidatos simultâneos
+        
+        Os candidatos além do primeiro são chamadas extras como um retry: também passam pela
+        política. Se ela recusar, a primeira rodada tem um único candidato.
+        """
+        numbers = list(self.attempt_numbers())
+        start = 0
+        while start < len(numbers):
+            round_attempts = numbers[start:start + size]
+            if start:
+                if not self.retry_allowed(numbers[start - 1], len(round_attempts)):
+                    return
+            elif len(round_attempts) > 1:
+                allowed, _ = self.retry_policy.allow_retry(self.level, 0, None, self.config.threshold,
+                                                           len(round_attempts) - 1)
+                if not allowed:
+                    round_attempts = round_attempts[:1]
+            self.round += 1
+            yield round_attempts
+            start += len(round_attempts)
+    
+    def candidate_kwargs(self, offset: int) -> Dict[str, Any]:
+        """Argumentos de um candidato especulativo (temperature escalonada para diversificar)"""
+        kwargs = self.request_kwargs()
+        kwargs["temperature"] = min(0.9, self.temperature + 0.1 * offset) if self.temperature < 0.9 else self.temperature
+        return kwargs
+    
+    def record(self, attempt: int, content: str, evaluation: Optional[EvaluationResponse],
+               stats: Optional[Dict[str, Any]] = None) -> bool:
+        """Registra uma tentativa avaliada; retorna True quando o ciclo deve parar"""
+        if self.register(attempt, content, evaluation, stats):
+            return True
+        
+        if attempt <= self.config.max_retries:
+            if not self.retry_allowed(attempt):
+                return True
+            self.prepare_retry(content, evaluation)
+        return False
+    
+    def retry_allowed(self, attempt: int, calls: int = 1) -> bool:
+        """Consulta a política de retry antes de `calls` novas tentativas após `attempt`"""
+        best_score = self.best[1].score if self.best is not None else None
+        allowed, reason = self.retry_policy.allow_retry(self.level, attempt, best_score, self.config.threshold, calls)
+        if not allowed:
+            self.early_stop = reason
+        return allowed
+    
+    def register(self, attempt: int, content: str, evaluation: Optional[EvaluationResponse],
+                 stats: Optional[Dict[str, Any]] = None) -> bool:
+        """Guarda a tentativa (com latências e tokens) e a melhor resposta; retorna True se passou do threshold
+        
+        evaluation=None (avaliador indisponível) também encerra o ciclo: sem avaliação não há por que repetir.
+        """
+        round_number = self.round or attempt
+        if evaluation is None:
+            self.attempts.append({"attempt": attempt, "round": round_number, "score": None,
+                                  "feedback": UNEVALUATED_FEEDBACK, "evaluated": False, **(stats or {})})
+            if self.unevaluated is None:
+                self.unevaluated = (content, EvaluationResponse(evaluator=self.config.evaluator, score=None,
+                                                                feedback=UNEVALUATED_FEEDBACK))
+            return True
+        
+        self.attempts.append({"attempt": attempt, "round": round_number, "score": evaluation.score,
+                              "feedback": evaluation.feedback, **(stats or {})})
+        
+        if evaluation.score is not None and evaluation.score >= self.config.threshold:
+            self.passed = (content, evaluation)
+            return True
+        
+        if evaluation.score is not None and (self.best is None or evaluation.score > self.best[1].score):
+            self.best = (content, evaluation)
+        return False
+    
+    def prepare_retry(self, content: str, evaluation: EvaluationResponse):
+        """Próxima tentativa recebe a resposta reprovada e a crítica da avaliação"""
+        score_str = f"{evaluation.score:.3f}" if evaluation.score is not None else "N/A"
+        critique = {"role": "system", "content": (
+            "Sua última resposta foi reprovada pela avaliação de qualidade médica. "
+            f"Considerando o score {score_str}, reescreva a resposta anterior para melhorar a qualidade médica."
+        )}
+        messages = self.messages + [{"role": "assistant", "content": content}, critique]
+        if count_message_tokens(messages, self.config.model) + self.config.max_tokens > context_window(self.config.model):
+            # Sem espaço para reenviar a conversa inteira: recomeçar dos prompts originais com a crítica
+            messages = self.messages[:2] + [{"role": "assistant", "content": content}, critique]
+        self.messages = messages
+        if self.temperature < 0.9:
+            self.temperature = min(0.9, self.temperature + 0.1)
+    
+    def record_error(self, attempt: int, error: Exception) -> bool:
+        """Registra uma tentativa que falhou; retorna True quando o ciclo deve parar"""
+        self.last_error = error
+        # Com alguma resposta válida, usar a melhor obtida até agora
+        if self.best is not None:
+            return True
+        if attempt > self.config.max_retries:
+            raise VizevalOpenAIError(f"Todas as tentativas falharam: {str(error)}") from error
+        return False
+    
+    def discard(self, error: Exception):
+        """Candidato especulativo que falhou: os demais seguem, mas o erro fica guardado para outcome()"""
+        self.last_error = error
+    
+    def outcome(self) -> Dict[str, Any]:
+        """Resposta final: a primeira aprovada ou a de melhor score"""
+        final = self.passed or self.best or self.unevaluated
+        if final is None:
+            if self.last_error is not None:
+                raise VizevalOpenAIError(f"Todas as tentativas falharam: {str(self.last_error)}") from self.last_error
+            raise VizevalOpenAIError("Não foi possível obter nenhuma resposta válida")
+        
+        # Candidatos especulativos terminam fora de ordem
+        self.attempts.sort(key=lambda a: a["attempt"])
+        scores = [a["score"] for a in self.attempts if a["score"] is not None]
+        return {
+            "content": final[0],
+            "evaluation": final[1],
+            "attempts": self.attempts,
+            "passed": self.passed is not None,
+            "best_score": max(scores) if scores else None,
+            "evaluated": final is not self.unevaluated,
+            "model": self.config.model,
+            "threshold": self.config.threshold,
+            "max_retries": self.config.max_retries,
+            "early_stop": self.early_stop,
+            "elapsed_s": time.perf_counter() - self.started
+        }
+
+def add_queue_time(results: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+    """Soma ao resultado o tempo que o caso esperou por um worker livre"""
+    if "performance" in results:
+        results["performance"]["queue_s"] += seconds
+    return results
 
 class MedicalAgent:
     """Agente médico inteligente com avaliação automática via Vizeval"""
     
-    def __init__(self, openai_api_key: str, vizeval_api_key: str, vizeval_base_url: str = "http://localhost:8000"):
-        self.console = Console()
+    def __init__(self, openai_api_key: str, vizeval_api_key: str, vizeval_base_url: str = "http://localhost:8000",
+                 cache: Optional[ResponseCache] = None, openai_base_url: Optional[str] = None,
+                 routing: Optional[RoutingPolicy] = None, max_connections: int = 64,
+                 analytics: Optional[FleetAnalytics] = None, prompt_builder: Optional[PromptBuilder] = None,
+                 openai_limiter: Optional[Upstream] = None, vizeval_limiter: Optional[Upstream] = None,
+                 documents: Optional[DocumentIngestor] = None, retrieval: Optional[RetrievalIndex] = None,
+                 attempt_log: Optional[AttemptLog] = None, retry_policy: Optional[RetryPolicy] = None,
+                 profiler: Optional[Profiler] = None, max_evaluator_pools: int = MAX_EVALUATOR_POOLS):
+        self.console = console
+        self.cache = cache
+        self.routing = routing or RoutingPolicy()
+        self.metrics = AgentMetrics()
+        # Agregador da frota (pode ser compartilhado entre agentes e processos)
+        self.analytics = analytics
+        # Score, feedback, tokens e latência de cada tentativa, para o simulador what-if (whatif.py)
+        self.attempt_log = attempt_log
+        # Decide se uma análise reprovada ganha outra tentativa (padrão: até esgotar max_retries)
+        self.retry_policy = retry_policy or RetryPolicy()
+        # CPU local e memória de cada análise (modo profiling; desligado por padrão)
+        self.profiler = profiler or Profiler(enabled=False)
+        self.prompts = prompt_builder or PromptBuilder()
+        # Extração dos documentos anexados aos casos, com cache por hash do conteúdo (criados no primeiro uso),
+        # e índice BM25 dos trechos, consultado com os sintomas do caso
+        self._documents = documents
+        self._retrieval = retrieval
+        self._documents_lock = threading.Lock()
+        # Análises idênticas simultâneas compartilham uma única execução
+        self.flights = SingleFlight()
+        # None = endpoint padrão da OpenAI (ou OPENAI_BASE_URL)
+        self.openai_base_url = openai_base_url
+        # Conexões keep-alive por upstream: um agente atende várias sessões/threads ao mesmo tempo
+        self.max_connections = max_connections
+        # Toda chamada ao OpenAI e ao Vizeval passa pelo limitador do upstream (cotas, AIMD e Retry-After);
+        # agentes que recebem o mesmo Upstream dividem a mesma cota
+        self.openai_limiter = openai_limiter or Upstream("openai", max_concurrency=max_connections)
+        self.vizeval_limiter = vizeval_limiter or Upstream("vizeval", max_concurrency=max_connections)
         
         # Configurar Vizeval para usar API local
         self.vizeval_config = VizevalConfig(
@@ -40,87 +429,614 @@ class MedicalAgent:
             metadata={"agent": "medical_demo", "version": "1.0"}
         )
         
-        # Configurar cliente OpenAI com Vizeval
-        self.client = OpenAI(
-            api_key=openai_api_key,
-            vizeval_config=self.vizeval_config,
-        )
+        # Cliente OpenAI compartilhado; a configuração de avaliação viaja em cada chamada
+        self.client = self._create_openai_client(openai_api_key)
+        
+        # Clientes Vizeval por URL, criados sob demanda; só os `max_evaluator_pools` usados mais
+        # recentemente ficam abertos (a URL pode vir de cada análise)
+        self.max_evaluator_pools = max_evaluator_pools
+        self._evaluators: "OrderedDict[str, EvaluatorPool]" = OrderedDict()
+        # Análises em andamento por conjunto: um conjunto removido do cache só fecha quando fica ocioso
+        self._evaluator_leases: Dict[EvaluatorPool, int] = {}
+        self._evaluators_lock = threading.Lock()
         
         console.print("🏥 [bold green]Agente Médico Vizeval inicializado![/bold green]")
         console.print(f"🔗 API Vizeval: {vizeval_base_url}")
     
-    def analyze_case(self, case: MedicalCase) -> Dict[str, Any]:
-        """Analisa um caso médico usando o agente com avaliação Vizeval"""
-        console.print(f"\n🔍 [bold blue]Analisando caso: {case.patient_id}[/bold blue]")
-        
-        # Configurar threshold baseado na complexidade
-        thresholds = {"low": 0.7, "medium": 0.8, "high": 0.9}
-        
-        # Atualizar configuração dinamicamente
-        self.client.set_vizeval_config({
-            "api_key": self.vizeval_config.api_key,
-            "evaluator": "medical",
-            "threshold": thresholds[case.complexity_level],
-            "max_retries": 3,
-            "base_url": self.vizeval_config.base_url,
-            "metadata": {"patient_id": case.patient_id, "complexity": case.complexity_level}
-        })
-        
-        system_prompt = "Você é uma assistente médica de mentira. Você irá mentir sobre tudo para casos de teste. MINTA!"
-        
-        user_prompt = f"""
-Caso Médico - Paciente {case.patient_id}
-
-SINTOMAS: {case.symptoms}
-HISTÓRICO: {case.medical_history}
-
-Forneça análise médica incluindo:
-1. Avaliação dos sintomas
-2. Possíveis hipóteses diagnósticas  
-3. Exames necessários
-4. Orientações de cuidado
-5. Quando buscar atendimento médico
-"""
+    def config_for(self, case: MedicalCase) -> AnalysisConfig:
+        """Configuração padrão da análise, escolhida pela política de roteamento do agente"""
+        route = self.routing.route_for(case)
+        return AnalysisConfig(
+            threshold=route.threshold,
+            max_retries=route.max_retries,
+            evaluator=Evaluator.MEDICAL.value,
+            base_url=self.vizeval_config.base_url,
+            metadata={"patient_id": case.patient_id, "complexity": case.complexity_level},
+            model=route.model,
+            temperature=route.temperature,
+            max_tokens=route.max_tokens,
+            speculative_candidates=route.speculative_candidates
+        )
+    
+    def analyze_case(self, case: MedicalCase, config: Optional[AnalysisConfig] = None,
+                     show_progress: bool = True, refresh: bool = False) -> Dict[str, Any]:
+        """Analisa um caso médico usando o agente com avaliação Vizeval
         
+        refresh=True ignora o cache e substitui a entrada pela nova análise.
+        """
+        with self.profiler.profile(f"case-{case.patient_id}"):
+            console.print(f"\n🔍 [bold blue]Analisando caso: {case.patient_id}[/bold blue]")
+            
+            # Configuração própria desta chamada (não altera estado compartilhado)
+            if config is None:
+                config = self.config_for(case)
+            
+            system_prompt, user_prompt = self._build_prompts(case, config)
+            
+            key, cached = self._cache_lookup(system_prompt, user_prompt, config, refresh)
+            if cached is not None:
+                return cached
+            
+            results, coalesced = self.flights.do(
+                key or cache_key(system_prompt, user_prompt, config),
+                lambda: self._analyze_uncached(case, system_prompt, user_prompt, config, key, show_progress)
+            )
+            if coalesced:
+                self._observe_coalesced(case)
+            return results
+    
+    def _analyze_uncached(self, case: MedicalCase, system_prompt: str, user_prompt: str, config: AnalysisConfig,
+                          key: Optional[str], show_progress: bool) -> Dict[str, Any]:
+        """Executa o ciclo de tentativas de um caso e grava o resultado no cache"""
         try:
-            with console.status("[bold green]Gerando análise médica..."):
-                result = self.client.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.7,
-                    max_tokens=1500
-                )
-            
-            return {
-                "patient_id": case.patient_id,
-                "analysis": result.final_response.choices[0].message.content,
-                "quality_metrics": {
-                    "final_score": result.final_evaluation.score,
-                    "passed_threshold": result.passed_threshold,
-                    "total_attempts": result.total_attempts,
-                    "best_score": result.best_score,
-                    "feedback": result.final_evaluation.feedback
-                },
-                "attempt_history": [
-                    {"attempt": a.attempt_number, "score": a.score, "feedback": a.feedback}
-                    for a in result.attempts
-                ]
-            }
+            if show_progress:
+                with console.status("[bold green]Gerando análise médica..."):
+                    result = self._run_attempts(system_prompt, user_prompt, config)
+            else:
+                result = self._run_attempts(system_prompt, user_prompt, config)
+            
+            results = self._success_result(case, result)
+            # Respostas sem avaliação não vão para o cache: a próxima chamada tenta avaliar de novo
+            if key is not None and results["quality_metrics"]["evaluated"]:
+                self.cache.set(key, results)
+            return results
             
         except Exception as e:
             console.print(f"❌ [bold red]Erro: {str(e)}[/bold red]")
-            return {
-                "patient_id": case.patient_id,
-                "analysis": f"Erro na análise: {str(e)}",
-                "quality_metrics": {"error": str(e)},
-                "attempt_history": []
+            return self._error_result(case, e)
+    
+    def analyze_cases(self, cases: Iterable[MedicalCase], max_concurrency: int = 8,
+                      config: Optional[AnalysisConfig] = None, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Analisa vários casos em paralelo, devolvendo os resultados na ordem de entrada"""
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency deve ser maior ou igual a 1")
+        
+        def analyze(case: MedicalCase, queued_at: float) -> Dict[str, Any]:
+            started = time.perf_counter()
+            # Erros de um caso viram resultado de erro sem interromper os demais
+            try:
+                result = self.analyze_case(case, config=config, show_progress=False, refresh=refresh)
+            except Exception as e:
+                console.print(f"❌ [bold red]Erro em {case.patient_id}: {str(e)}[/bold red]")
+                return self._error_result(case, e)
+            return add_queue_time(result, started - queued_at)
+        
+        results: List[Optional[Dict[str, Any]]] = []
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="medical-agent") as pool:
+            pending = {}
+            
+            def drain(return_when):
+                done, _ = wait(pending, return_when=return_when)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+            
+            # Janela limitada de casos em andamento: a entrada (lista, gerador ou CaseStore)
+            # é percorrida conforme há vaga, sem materializar todos os casos
+            for index, case in enumerate(cases):
+                if len(pending) >= max_concurrency:
+                    drain(FIRST_COMPLETED)
+                results.append(None)
+                pending[pool.submit(analyze, case, time.perf_counter())] = index
+            drain(ALL_COMPLETED)
+        return results
+    
+    def stream_case(self, case: MedicalCase, config: Optional[AnalysisConfig] = None,
+                    refresh: bool = False) -> Iterator[Dict[str, Any]]:
+        """Analisa um caso produzindo eventos à medida que a resposta é gerada
+        
+        Eventos (campo "type"):
+        - token: trecho de texto da tentativa em andamento
+        - evaluation: score Vizeval da tentativa e se passou do threshold
+        - retry: início de uma nova tentativa (o texto anterior foi reprovado)
+        - result: resultado final, no mesmo formato de analyze_case
+        
+        As tentativas são sempre sequenciais: speculative_candidates não se aplica ao streaming.
+        """
+        if config is None:
+            config = self.config_for(case)
+        
+        system_prompt, user_prompt = self._build_prompts(case, config)
+        
+        key, cached = self._cache_lookup(system_prompt, user_prompt, config, refresh)
+        if cached is not None:
+            yield {"type": "token", "attempt": 1, "text": cached["analysis"]}
+            yield {"type": "result", "result": cached}
+            return
+        
+        flight_key = key or cache_key(system_prompt, user_prompt, config)
+        flight, leader = self.flights.begin(flight_key)
+        if not leader:
+            # Análise idêntica em andamento: aguardar o resultado dela em vez de gerar outra
+            self._observe_coalesced(case)
+            try:
+                results = flight.wait()
+            except Exception as e:
+                results = self._error_result(case, e)
+            yield {"type": "token", "attempt": 1, "text": results["analysis"]}
+            yield {"type": "result", "result": results}
+            return
+        
+        results = None
+        try:
+            for event in self._stream_attempts(case, system_prompt, user_prompt, config, key):
+                if event["type"] == "result":
+                    results = event["result"]
+                    break
+                yield event
+        finally:
+            # Liberar os seguidores mesmo se o consumidor abandonar o stream
+            error = None if results is not None else VizevalOpenAIError("Análise interrompida antes do fim")
+            self.flights.finish(flight_key, flight, results, error)
+        yield {"type": "result", "result": results}
+    
+    def _stream_attempts(self, case: MedicalCase, system_prompt: str, user_prompt: str, config: AnalysisConfig,
+                         key: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """Ciclo de tentativas em streaming; o último evento é sempre o resultado"""
+        try:
+            with self._evaluator_for(config.base_url) as evaluator:
+                loop = _AttemptLoop(system_prompt, user_prompt, config, self.retry_policy)
+                
+                for attempt in loop.attempt_numbers():
+                    if attempt > 1:
+                        yield {"type": "retry", "attempt": attempt}
+                    try:
+                        chunks = []
+                        usage = None
+                        first_token = None
+                        started = time.perf_counter()
+                        request_kwargs = loop.request_kwargs()
+                        reserved = self._token_estimate(request_kwargs)
+                        stream, lease = self.openai_limiter.start(
+                            lambda: self.client.chat.completions.create(**request_kwargs, stream=True,
+                                                                        stream_options={"include_usage": True}),
+                            reserved
+                        )
+                        # A vaga de concorrência fica ocupada enquanto a resposta é consumida
+                        try:
+                            for chunk in stream:
+                                usage = getattr(chunk, "usage", None) or usage
+                                text = chunk.choices[0].delta.content if chunk.choices else None
+                                if text:
+                                    if first_token is None:
+                                        first_token = time.perf_counter()
+                                    chunks.append(text)
+                                    yield {"type": "token", "attempt": attempt, "text": text}
+                        except BaseException as e:
+                            lease.done(e)
+                            raise
+                        lease.done()
+                        self._settle_tokens(reserved, usage)
+                        content = "".join(chunks)
+                        generated = time.perf_counter()
+                        evaluation = self._evaluate(evaluator, loop, content)
+                        stats = attempt_stats(usage, None, started, generated, time.perf_counter())
+                        stats["first_token_s"] = first_token - started if first_token is not None else None
+                    except Exception as e:
+                        if loop.record_error(attempt, e):
+                            break
+                        continue
+                    
+                    stop = loop.record(attempt, content, evaluation, stats)
+                    yield {
+                        "type": "evaluation",
+                        "attempt": attempt,
+                        "score": evaluation.score if evaluation is not None else None,
+                        "feedback": evaluation.feedback if evaluation is not None else UNEVALUATED_FEEDBACK,
+                        "passed": evaluation is not None and evaluation.score is not None
+                                  and evaluation.score >= config.threshold,
+                        "evaluated": evaluation is not None
+                    }
+                    if stop:
+                        break
+                
+                results = self._success_result(case, loop.outcome())
+                if key is not None and results["quality_metrics"]["evaluated"]:
+                    self.cache.set(key, results)
+        except Exception as e:
+            console.print(f"❌ [bold red]Erro: {str(e)}[/bold red]")
+            results = self._error_result(case, e)
+        
+        yield {"type": "result", "result": results}
+    
+    def stream_analysis(self, case: MedicalCase, config: Optional[AnalysisConfig] = None,
+                        refresh: bool = False) -> Dict[str, Any]:
+        """Analisa um caso exibindo a resposta em tempo real em um painel do terminal"""
+        from rich.console import Group
+        from rich.live import Live
+        from rich.markdown import Markdown
+        from rich.panel import Panel
+        from rich.text import Text
+        
+        console.print(f"\n🔍 [bold blue]Analisando caso: {case.patient_id}[/bold blue]")
+        
+        text = ""
+        status = ["Gerando análise médica..."]
+        results = None
+        
+        def render():
+            return Panel(
+                Group(Markdown(text or "…"), Text("\n" + "\n".join(status), style="dim")),
+                title=f"🏥 Análise Médica - {case.patient_id}",
+                border_style="blue"
+            )
+        
+        with Live(render(), console=console.get(), refresh_per_second=8) as live:
+            last_render = 0.0
+            for event in self.stream_case(case, config=config, refresh=refresh):
+                if event["type"] == "token":
+                    text += event["text"]
+                    # Re-renderizar Markdown a cada token é caro: limitar à taxa do Live
+                    if time.monotonic() - last_render < 0.125:
+                        continue
+                elif event["type"] == "evaluation":
+                    score = f"{event['score']:.3f}" if event["score"] is not None else "N/A"
+                    outcome = "✅ aprovada" if event["passed"] else "❌ abaixo do threshold"
+                    if not event.get("evaluated", True):
+                        outcome = "⚠️ não avaliada (avaliadores indisponíveis)"
+                    status.append(f"Tentativa {event['attempt']}: score {score} {outcome}")
+                elif event["type"] == "retry":
+                    text = ""
+                    status.append(f"🔄 Gerando tentativa {event['attempt']}...")
+                elif event["type"] == "result":
+                    results = event["result"]
+                    text = results["analysis"]
+                live.update(render())
+                last_render = time.monotonic()
+        
+        return results
+    
+    def _build_prompts(self, case: MedicalCase, config: AnalysisConfig) -> Tuple[str, str]:
+        """Monta os prompts de sistema (instruções fixas) e de usuário (dados do caso) dentro do orçamento"""
+        documents = self._case_documents(case, config)
+        if self._indexes_history(case, config):
+            # O restante do histórico chega pelos trechos recuperados junto com os documentos
+            case = replace(case, medical_history=trim_text(case.medical_history, HISTORY_TOKENS, config.model)[0])
+        prompt = self.prompts.build(case, config.model, config.max_tokens, documents)
+        if prompt.trimmed:
+            console.print(f"✂️ [yellow]Caso {case.patient_id} reduzido para caber no orçamento de tokens[/yellow]")
+        return prompt.system, prompt.user
+    
+    @property
+    def documents(self) -> DocumentIngestor:
+        with self._documents_lock:
+            if self._documents is None:
+                self._documents = DocumentIngestor()
+            return self._documents
+    
+    @property
+    def retrieval(self) -> RetrievalIndex:
+        with self._documents_lock:
+            if self._retrieval is None:
+                self._retrieval = RetrievalIndex()
+            return self._retrieval
+    
+    def _indexes_history(self, case: MedicalCase, config: AnalysisConfig) -> bool:
+        """Se o histórico do caso é longo o bastante para ser consultado no índice"""
+        return count_tokens(case.medical_history or "", config.model) > HISTORY_TOKENS
+    
+    def _case_documents(self, case: MedicalCase, config: AnalysisConfig) -> List[Tuple[str, str]]:
+        """(título, texto) dos trechos dos documentos do caso mais relevantes para os sintomas
+        
+        Documentos já extraídos e indexados vêm do cache e do índice; um histórico acima de
+        HISTORY_TOKENS também é indexado, como mais um documento do caso. O total de trechos é
+        limitado por DOCUMENT_PASSAGES e DOCUMENT_TOKENS em todas as tentativas.
+        """
+        documents = self.documents.ingest(case.documents) if case.documents else []
+        if self._indexes_history(case, config):
+            documents.append(self.documents.ingest_text(HISTORY_DOCUMENT, case.medical_history))
+        if not documents:
+            return []
+        self.retrieval.add(documents)
+        query = " ".join([case.symptoms or ""] + list(case.expected_focus or []))
+        passages = self.retrieval.search(query, documents, k=DOCUMENT_PASSAGES, max_tokens=DOCUMENT_TOKENS,
+                                         model=config.model)
+        return [(passage.title, passage.text) for passage in passages]
+    
+    def _cache_lookup(self, system_prompt: str, user_prompt: str, config: AnalysisConfig,
+                      refresh: bool) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Chave de cache da análise e o resultado já armazenado, se houver"""
+        if self.cache is None:
+            return None, None
+        
+        key = cache_key(system_prompt, user_prompt, config)
+        cached = None if refresh else self.cache.get(key)
+        if cached is not None:
+            console.print("⚡ [bold green]Análise recuperada do cache[/bold green]")
+        return key, cached
+    
+    def _observe_coalesced(self, case: MedicalCase):
+        """Registra uma chamada atendida por uma análise idêntica já em andamento"""
+        self.metrics.observe_coalesced()
+        console.print(f"🔗 [bold green]{case.patient_id}: aguardando análise idêntica em andamento[/bold green]")
+    
+    def _success_result(self, case: MedicalCase, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Resultado de uma análise concluída (também registrado nas métricas do agente)"""
+        attempts = result["attempts"]
+        results = {
+            "patient_id": case.patient_id,
+            "analysis": result["content"],
+            "quality_metrics": {
+                "final_score": result["evaluation"].score,
+                "passed_threshold": result["passed"],
+                "total_attempts": len(result["attempts"]),
+                "best_score": result["best_score"],
+                "feedback": result["evaluation"].feedback,
+                "evaluated": result["evaluated"],
+                "early_stop": result["early_stop"]
+            },
+            "attempt_history": [dict(a) for a in attempts],
+            "performance": {
+                "total_s": result["elapsed_s"],
+                "generation_s": sum(a.get("generation_s") or 0.0 for a in attempts),
+                "evaluation_s": sum(a.get("evaluation_s") or 0.0 for a in attempts),
+                "queue_s": sum(a.get("queue_s") or 0.0 for a in attempts),
+                "prompt_tokens": sum(a.get("prompt_tokens") or 0 for a in attempts),
+                "completion_tokens": sum(a.get("completion_tokens") or 0 for a in attempts)
             }
+        }
+        self.metrics.observe_result(results, case.complexity_level, result["model"])
+        self.retry_policy.observe(case.complexity_level, attempts)
+        if self.analytics is not None:
+            self._record_telemetry(self.analytics, results, case.complexity_level, result["model"], result["threshold"])
+        if self.attempt_log is not None:
+            self._record_telemetry(self.attempt_log, results, case.complexity_level, result["model"],
+                                   result["threshold"], result["max_retries"])
+        return results
+    
+    def _error_result(self, case: MedicalCase, error: Exception) -> Dict[str, Any]:
+        """Resultado padrão para uma análise que falhou"""
+        results = {
+            "patient_id": case.patient_id,
+            "analysis": f"Erro na análise: {str(error)}",
+            "quality_metrics": {"error": str(error)},
+            "attempt_history": []
+        }
+        self.metrics.observe_result(results, case.complexity_level, "")
+        if self.analytics is not None:
+            self._record_telemetry(self.analytics, results, case.complexity_level, "", None)
+        return results
+    
+    def _record_telemetry(self, store, *args):
+        """Registra a análise na frota ou no log de tentativas sem afetar o resultado
+        
+        O registro pode gravar no SQLite no caminho da requisição; se a gravação falhar (ex.: "database
+        is locked"), o lote continua pendente para a próxima e a análise segue válida.
+        """
+        try:
+            store.record(*args)
+        except Exception as e:
+            console.print(f"⚠️ [yellow]Telemetria não gravada ({type(store).__name__}): {e}[/yellow]")
+    
+    def close(self):
+        """Fecha as conexões HTTP do OpenAI e do Vizeval e grava o delta pendente da frota e das tentativas"""
+        if self.analytics is not None:
+            self.analytics.flush()
+        if self.attempt_log is not None:
+            self.attempt_log.flush()
+        if self._documents is not None:
+            self._documents.close()
+        if self._retrieval is not None:
+            self._retrieval.close()
+        self.profiler.close()
+        self.client.close()
+        with self._evaluators_lock:
+            for evaluator in self._evaluators.values():
+                evaluator.close()
+            self._evaluators.clear()
+    
+    def _create_openai_client(self, api_key: str) -> OpenAI:
+        """Cria o cliente OpenAI usado na geração, com pool de conexões keep-alive"""
+        http_client = httpx.Client(limits=http_limits(self.max_connections), timeout=OPENAI_TIMEOUT,
+                                   follow_redirects=True)
+        # Retentativas ficam a cargo do limitador do agente (max_retries=0 na SDK)
+        return OpenAI(api_key=api_key, base_url=self.openai_base_url, http_client=http_client, max_retries=0)
+    
+    def _create_evaluator(self, base_url: str) -> VizevalClient:
+        """Cria o cliente Vizeval para uma URL, com pool de conexões keep-alive do tamanho do agente"""
+        evaluator = VizevalClient(api_key=self.vizeval_config.api_key, base_url=base_url)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        evaluator.session.mount("http://", adapter)
+        evaluator.session.mount("https://", adapter)
+        return evaluator
+    
+    @contextmanager
+    def _evaluator_for(self, base_url: str) -> Iterator[EvaluatorPool]:
+        """Avaliadores reutilizáveis para a URL informada (várias URLs separadas por vírgula), durante uma análise"""
+        evaluator, idle = self._lease_evaluator(base_url)
+        for evicted in idle:
+            evicted.close()
+        try:
+            yield evaluator
+        finally:
+            if self._release_evaluator(base_url, evaluator):
+                evaluator.close()
+    
+    def _lease_evaluator(self, base_url: str) -> Tuple[EvaluatorPool, List[EvaluatorPool]]:
+        """Conjunto de avaliadores da URL (criado se preciso) e os conjuntos ociosos que saíram do cache"""
+        idle = []
+        with self._evaluators_lock:
+            evaluator = self._evaluators.get(base_url)
+            if evaluator is None:
+                evaluator = self._create_evaluator_pool({url: self._create_evaluator(url) for url in split_urls(base_url)})
+                self._evaluators[base_url] = evaluator
+                while len(self._evaluators) > self.max_evaluator_pools:
+                    _, evicted = self._evaluators.popitem(last=False)
+                    if evicted not in self._evaluator_leases:
+                        idle.append(evicted)
+            else:
+                self._evaluators.move_to_end(base_url)
+            self._evaluator_leases[evaluator] = self._evaluator_leases.get(evaluator, 0) + 1
+        return evaluator, idle
+    
+    def _release_evaluator(self, base_url: str, evaluator: EvaluatorPool) -> bool:
+        """Encerra o uso de um conjunto; True quando ele saiu do cache e ficou ocioso (deve ser fechado)"""
+        with self._evaluators_lock:
+            leases = self._evaluator_leases.pop(evaluator) - 1
+            if leases:
+                self._evaluator_leases[evaluator] = leases
+                return False
+            return self._evaluators.get(base_url) is not evaluator
+    
+    def _create_evaluator_pool(self, clients: Dict[str, VizevalClient]) -> EvaluatorPool:
+        """Endpoints com duplicata após o p95, failover e circuit breaker, atrás do limitador do Vizeval"""
+        return EvaluatorPool(clients, self.vizeval_limiter, max_workers=self.max_connections)
+    
+    def _generate_and_evaluate(self, evaluator: EvaluatorPool, loop: _AttemptLoop, request_kwargs: Dict[str, Any],
+                               queued_at: Optional[float] = None,
+                               cancel: Optional[threading.Event] = None) -> Tuple[str, EvaluationResponse, Dict[str, Any]]:
+        """Uma tentativa: gera a resposta, avalia no Vizeval e mede latências e tokens
+        
+        Com `cancel` (candidatos especulativos), a resposta é lida em streaming e a tentativa é
+        abandonada com CandidateCancelled assim que o evento é sinalizado: a geração é fechada
+        entre dois trechos e a avaliação não é feita.
+        """
+        started = time.perf_counter()
+        reserved = self._token_estimate(request_kwargs)
+        if cancel is None:
+            response = self.openai_limiter.call(lambda: self.client.chat.completions.create(**request_kwargs), reserved)
+            content, usage = response.choices[0].message.content or "", response.usage
+        else:
+            content, usage = self._generate_cancellable(request_kwargs, reserved, cancel)
+        self._settle_tokens(reserved, usage)
+        generated = time.perf_counter()
+        if cancel is not None and cancel.is_set():
+            raise CandidateCancelled()
+        evaluation = self._evaluate(evaluator, loop, content)
+        return content, evaluation, attempt_stats(usage, queued_at, started, generated, time.perf_counter())
+    
+    def _generate_cancellable(self, request_kwargs: Dict[str, Any], reserved: int,
+                              cancel: threading.Event) -> Tuple[str, Any]:
+        """Geração em streaming interrompida quando `cancel` é sinalizado; retorna (conteúdo, usage)"""
+        if cancel.is_set():
+            raise CandidateCancelled()
+        stream, lease = self.openai_limiter.start(
+            lambda: self.client.chat.completions.create(**request_kwargs, stream=True,
+                                                        stream_options={"include_usage": True}),
+            reserved
+        )
+        chunks = []
+        usage = None
+        try:
+            for chunk in stream:
+                if cancel.is_set():
+                    # Fecha a conexão: o OpenAI para de gerar (e de cobrar) o restante da resposta
+                    stream.close()
+                    raise CandidateCancelled()
+                usage = getattr(chunk, "usage", None) or usage
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    chunks.append(text)
+        except CandidateCancelled:
+            lease.done()
+            raise
+        except BaseException as e:
+            lease.done(e)
+            raise
+        lease.done()
+        return "".join(chunks), usage
+    
+    def _evaluate(self, evaluator: EvaluatorPool, loop: _AttemptLoop, content: str) -> Optional[EvaluationResponse]:
+        """Avaliação Vizeval da resposta (None quando nenhum avaliador está disponível)"""
+        try:
+            return evaluator.evaluate(**loop.evaluation_kwargs(content))
+        except EvaluatorUnavailable as e:
+            console.print(f"⚠️ [yellow]{e} - resposta segue sem avaliação[/yellow]")
+            return None
+    
+    def _token_estimate(self, request_kwargs: Dict[str, Any]) -> int:
+        """Tokens reservados na cota do OpenAI: prompt medido + resposta máxima"""
+        return count_message_tokens(request_kwargs["messages"], request_kwargs["model"]) + request_kwargs["max_tokens"]
+    
+    def _settle_tokens(self, reserved: int, usage: Any):
+        """Devolve à cota a parte da reserva que a resposta não usou"""
+        total = getattr(usage, "total_tokens", None)
+        if total is not None:
+            self.openai_limiter.refund(reserved - total)
+    
+    def _run_attempts(self, system_prompt: str, user_prompt: str, config: AnalysisConfig) -> Dict[str, Any]:
+        """Gera e avalia respostas até atingir o threshold ou esgotar as tentativas"""
+        if config.speculative_candidates > 1:
+            return self._run_speculative(system_prompt, user_prompt, config)
+        
+        with self._evaluator_for(config.base_url) as evaluator:
+            loop = _AttemptLoop(system_prompt, user_prompt, config, self.retry_policy)
+            
+            for attempt in loop.attempt_numbers():
+                try:
+                    content, evaluation, stats = self._generate_and_evaluate(evaluator, loop, loop.request_kwargs())
+                except Exception as e:
+                    if loop.record_error(attempt, e):
+                        break
+                    continue
+                
+                if loop.record(attempt, content, evaluation, stats):
+                    break
+            
+            return loop.outcome()
+    
+    def _run_speculative(self, system_prompt: str, user_prompt: str, config: AnalysisConfig) -> Dict[str, Any]:
+        """Gera candidatos em paralelo por rodada e retorna o primeiro que passar do threshold"""
+        with self._evaluator_for(config.base_url) as evaluator:
+            loop = _AttemptLoop(system_prompt, user_prompt, config, self.retry_policy)
+            pool = ThreadPoolExecutor(max_workers=config.speculative_candidates, thread_name_prefix="medical-agent-candidate")
+            # Sinalizado quando a análise termina: candidatos ainda em andamento param de gerar e não são avaliados
+            cancel = threading.Event()
+            
+            try:
+                for round_attempts in loop.rounds(config.speculative_candidates):
+                    futures = {
+                        pool.submit(self._generate_and_evaluate, evaluator, loop, loop.candidate_kwargs(offset),
+                                    time.perf_counter(), cancel): attempt
+                        for offset, attempt in enumerate(round_attempts)
+                    }
+                    pending = set(futures)
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            try:
+                                content, evaluation, stats = future.result()
+                            except Exception as e:
+                                # Candidato com erro é descartado; os demais seguem
+                                loop.discard(e)
+                                continue
+                            if loop.register(futures[future], content, evaluation, stats):
+                                return loop.outcome()
+                    
+                    # Rodada sem aprovação: a próxima parte da melhor resposta até agora
+                    if loop.best is not None:
+                        loop.prepare_retry(*loop.best)
+                
+                return loop.outcome()
+            finally:
+                # Não esperar candidatos que ficaram para trás: os que já começaram param no próximo trecho
+                cancel.set()
+                pool.shutdown(wait=False, cancel_futures=True)
     
     def display_results(self, results: Dict[str, Any]):
         """Exibe os resultados da análise"""
+        from rich.markdown import Markdown
+        from rich.panel import Panel
+        
         # Análise médica
         analysis_panel = Panel(
             Markdown(results["analysis"]),
@@ -129,20 +1045,356 @@ Forneça análise médica incluindo:
         )
         console.print(analysis_panel)
         
-        # Métricas de qualidade
+        self.display_metrics(results)
+    
+    def display_metrics(self, results: Dict[str, Any]):
+        """Exibe as métricas de qualidade da análise"""
         if "error" not in results["quality_metrics"]:
             metrics = results["quality_metrics"]
             
+            from rich.table import Table
+            
             metrics_table = Table(title="📊 Métricas de Qualidade Vizeval")
             metrics_table.add_column("Métrica", style="cyan")
             metrics_table.add_column("Valor", style="green")
             
-            metrics_table.add_row("Score Final", f"{metrics['final_score']:.3f}")
+            metrics_table.add_row("Score Final", f"{metrics['final_score']:.3f}" if metrics['final_score'] is not None
+                                  else "⚠️ Não avaliada")
             metrics_table.add_row("Passou Threshold", "✅ Sim" if metrics['passed_threshold'] else "❌ Não")
             metrics_table.add_row("Total Tentativas", str(metrics['total_attempts']))
             metrics_table.add_row("Melhor Score", f"{metrics['best_score']:.3f}" if metrics['best_score'] else "N/A")
+            if metrics.get("early_stop"):
+                reason = "ganho esperado baixo" if metrics["early_stop"] == "gain" else "orçamento de retries esgotado"
+                metrics_table.add_row("Parada Antecipada", reason)
             
             console.print(metrics_table)
+            self.display_performance(results)
+    
+    def display_performance(self, results: Dict[str, Any]):
+        """Exibe latência e tokens de cada tentativa e os totais do caso"""
+        performance = results.get("performance")
+        if performance is None:
+            return
+        
+        def seconds(value: Optional[float]) -> str:
+            return f"{value:.2f}s" if value is not None else "N/A"
+        
+        def tokens(value: Optional[int]) -> str:
+            return str(value) if value is not None else "N/A"
+        
+        from rich.table import Table
+        
+        table = Table(title="⏱️ Latência e Tokens por Tentativa")
+        table.add_column("Tentativa", style="cyan")
+        for column in ("Fila", "Geração", "Avaliação", "Tokens prompt", "Tokens resposta"):
+            table.add_column(column, style="green", justify="right")
+        
+        for attempt in results["attempt_history"]:
+            table.add_row(str(attempt["attempt"]), seconds(attempt.get("queue_s")), seconds(attempt.get("generation_s")),
+                          seconds(attempt.get("evaluation_s")), tokens(attempt.get("prompt_tokens")),
+                          tokens(attempt.get("completion_tokens")))
+        table.add_row("Total", seconds(performance["queue_s"]), seconds(performance["generation_s"]),
+                      seconds(performance["evaluation_s"]), tokens(performance["prompt_tokens"]),
+                      tokens(performance["completion_tokens"]), style="bold")
+        table.caption = f"Tempo total da análise: {seconds(performance['total_s'])}"
+        
+        console.print(table)
+
+class AsyncVizevalClient:
+    """Cliente assíncrono para o endpoint de avaliação da API Vizeval"""
+    
+    def __init__(self, api_key: str, base_url: str = "https://api.vizeval.com", timeout: float = 30.0,
+                 max_connections: int = 64):
+        if not api_key:
+            raise VizevalConfigError("api_key é obrigatório")
+        
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={'Content-Type': 'application/json', 'User-Agent': 'Vizeval-SDK/0.1.0'},
+            timeout=timeout,
+            limits=http_limits(max_connections)
+        )
+    
+    async def evaluate(self, system_prompt: str, user_prompt: str, response: str, evaluator: str = "medical",
+                       metadata: Optional[Dict[str, Any]] = None, async_mode: bool = False) -> EvaluationResponse:
+        """Avalia uma resposta usando a API Vizeval sem bloquear o event loop"""
+        if not validate_evaluator(evaluator):
+            raise VizevalConfigError(f"Evaluator '{evaluator}' não é válido")
+        
+        request_data = EvaluationRequest(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            response=response,
+            evaluator=evaluator,
+            metadata=metadata or {},
+            api_key=self.api_key,
+            async_mode=async_mode
+        )
+        
+        try:
+            http_response = await self.http.post("/evaluation/", content=request_data.model_dump_json())
+        except httpx.HTTPError as e:
+            raise VizevalAPIError(f"Erro de conexão com a API Vizeval: {str(e)}")
+        
+        if http_response.status_code != 201:
+            try:
+                error_data = http_response.json()
+            except ValueError:
+                error_data = {}
+            error_message = f"Erro na API Vizeval: {http_response.status_code}"
+            if "detail" in error_data:
+                error_message = f"{error_message} - {error_data['detail']}"
+            error = VizevalAPIError(error_message, status_code=http_response.status_code, response_data=error_data)
+            error.retry_after = parse_retry_after(http_response.headers)
+            raise error
+        
+        try:
+            return EvaluationResponse(**http_response.json())
+        except ValueError as e:
+            raise VizevalAPIError(f"Erro ao parsear resposta da API: {str(e)}")
+    
+    async def aclose(self):
+        """Fecha as conexões HTTP"""
+        await self.http.aclose()
+
+class AsyncMedicalAgent(MedicalAgent):
+    """Agente médico assíncrono: geração e avaliação Vizeval sem bloquear threads"""
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+    
+    async def analyze_case(self, case: MedicalCase, config: Optional[AnalysisConfig] = None,
+                           refresh: bool = False) -> Dict[str, Any]:
+        """Analisa um caso médico de forma assíncrona"""
+        async with self.profiler.aprofile(f"case-{case.patient_id}"):
+            return await self._analyze_case(case, config, refresh)
+    
+    async def _analyze_case(self, case: MedicalCase, config: Optional[AnalysisConfig],
+                            refresh: bool) -> Dict[str, Any]:
+        console.print(f"\n🔍 [bold blue]Analisando caso: {case.patient_id}[/bold blue]")
+        
+        if config is None:
+            config = self.config_for(case)
+        
+        if case.documents or self._indexes_history(case, config):
+            # Hash, extração e indexação de documentos são bloqueantes: fora do event loop
+            system_prompt, user_prompt = await asyncio.to_thread(self._build_prompts, case, config)
+        else:
+            system_prompt, user_prompt = self._build_prompts(case, config)
+        
+        # Cache, analytics e registro de tentativas usam SQLite: fora do event loop, para não travar os outros casos
+        key, cached = await asyncio.to_thread(self._cache_lookup, system_prompt, user_prompt, config, refresh)
+        if cached is not None:
+            return cached
+        
+        results, coalesced = await self.flights.do_async(
+            key or cache_key(system_prompt, user_prompt, config),
+            lambda: self._analyze_uncached(case, system_prompt, user_prompt, config, key)
+        )
+        if coalesced:
+            self._observe_coalesced(case)
+        return results
+    
+    async def _analyze_uncached(self, case: MedicalCase, system_prompt: str, user_prompt: str,
+                                config: AnalysisConfig, key: Optional[str]) -> Dict[str, Any]:
+        """Executa o ciclo de tentativas de um caso e grava o resultado no cache"""
+        try:
+            result = await self._run_attempts(system_prompt, user_prompt, config)
+            results = await asyncio.to_thread(self._success_result, case, result)
+            if key is not None and results["quality_metrics"]["evaluated"]:
+                await asyncio.to_thread(self.cache.set, key, results)
+            return results
+        except Exception as e:
+            console.print(f"❌ [bold red]Erro: {str(e)}[/bold red]")
+            return await asyncio.to_thread(self._error_result, case, e)
+    
+    async def analyze_cases(self, cases: Iterable[MedicalCase], max_concurrency: int = 8,
+                            config: Optional[AnalysisConfig] = None, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Analisa vários casos concorrentemente, devolvendo os resultados na ordem de entrada"""
+        results: Dict[int, Dict[str, Any]] = {}
+        async for index, result in self.as_completed(cases, max_concurrency=max_concurrency, config=config,
+                                                     refresh=refresh):
+            results[index] = result
+        return [results[index] for index in range(len(results))]
+    
+    async def as_completed(self, cases: Iterable[MedicalCase], max_concurrency: int = 8,
+                           config: Optional[AnalysisConfig] = None,
+                           refresh: bool = False) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Produz (índice do caso, resultado) à medida que cada análise termina
+        
+        Os casos são lidos de `cases` conforme há vaga na janela de `max_concurrency` análises,
+        então a entrada pode ser um gerador ou um CaseStore com milhões de casos.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency deve ser maior ou igual a 1")
+        
+        async def analyze(index: int, case: MedicalCase, queued_at: float) -> Tuple[int, Dict[str, Any]]:
+            started = time.perf_counter()
+            # Erros de um caso viram resultado de erro sem interromper os demais
+            try:
+                result = await self.analyze_case(case, config=config, refresh=refresh)
+            except Exception as e:
+                console.print(f"❌ [bold red]Erro em {case.patient_id}: {str(e)}[/bold red]")
+                return index, await asyncio.to_thread(self._error_result, case, e)
+            return index, add_queue_time(result, started - queued_at)
+        
+        pending = set()
+        remaining = enumerate(cases)
+        try:
+            while True:
+                for index, case in remaining:
+                    pending.add(asyncio.ensure_future(analyze(index, case, time.perf_counter())))
+                    if len(pending) >= max_concurrency:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            # Consumidor abandonou a iteração: cancelar o que ainda está em andamento
+            for task in pending:
+                task.cancel()
+    
+    def stream_case(self, *args, **kwargs):
+        raise TypeError("AsyncMedicalAgent não tem streaming síncrono: use MedicalAgent.stream_case")
+    
+    def stream_analysis(self, *args, **kwargs):
+        raise TypeError("AsyncMedicalAgent não tem streaming síncrono: use MedicalAgent.stream_analysis")
+    
+    def close(self):
+        raise TypeError("Os clientes do AsyncMedicalAgent são assíncronos: use await agent.aclose()")
+    
+    async def aclose(self):
+        """Fecha os clientes HTTP do OpenAI e do Vizeval e grava o delta pendente da frota e das tentativas"""
+        def flush():
+            if self.analytics is not None:
+                self.analytics.flush()
+            if self.attempt_log is not None:
+                self.attempt_log.flush()
+            if self._documents is not None:
+                self._documents.close()
+            if self._retrieval is not None:
+                self._retrieval.close()
+            self.profiler.close()
+        
+        # Gravações em SQLite e em disco e pool de processos: fora do event loop
+        await asyncio.to_thread(flush)
+        await self.client.close()
+        for evaluator in self._evaluators.values():
+            await evaluator.aclose()
+        self._evaluators.clear()
+    
+    def _create_openai_client(self, api_key: str) -> AsyncOpenAI:
+        """Cria o cliente OpenAI assíncrono usado na geração, com pool de conexões keep-alive"""
+        http_client = httpx.AsyncClient(limits=http_limits(self.max_connections), timeout=OPENAI_TIMEOUT,
+                                        follow_redirects=True)
+        return AsyncOpenAI(api_key=api_key, base_url=self.openai_base_url, http_client=http_client, max_retries=0)
+    
+    def _create_evaluator(self, base_url: str) -> AsyncVizevalClient:
+        """Cria o cliente Vizeval assíncrono para uma URL"""
+        return AsyncVizevalClient(api_key=self.vizeval_config.api_key, base_url=base_url,
+                                  max_connections=self.max_connections)
+    
+    @asynccontextmanager
+    async def _evaluator_for(self, base_url: str) -> AsyncIterator[AsyncEvaluatorPool]:
+        """Avaliadores reutilizáveis para a URL informada (várias URLs separadas por vírgula), durante uma análise"""
+        evaluator, idle = self._lease_evaluator(base_url)
+        for evicted in idle:
+            await evicted.aclose()
+        try:
+            yield evaluator
+        finally:
+            if self._release_evaluator(base_url, evaluator):
+                await evaluator.aclose()
+    
+    def _create_evaluator_pool(self, clients: Dict[str, AsyncVizevalClient]) -> AsyncEvaluatorPool:
+        """Endpoints com duplicata após o p95, failover e circuit breaker, atrás do limitador do Vizeval"""
+        return AsyncEvaluatorPool(clients, self.vizeval_limiter)
+    
+    async def _evaluate(self, evaluator: AsyncEvaluatorPool, loop: _AttemptLoop,
+                        content: str) -> Optional[EvaluationResponse]:
+        """Avaliação Vizeval da resposta (None quando nenhum avaliador está disponível)"""
+        try:
+            return await evaluator.evaluate(**loop.evaluation_kwargs(content))
+        except EvaluatorUnavailable as e:
+            console.print(f"⚠️ [yellow]{e} - resposta segue sem avaliação[/yellow]")
+            return None
+    
+    async def _generate_and_evaluate(self, evaluator: AsyncEvaluatorPool, loop: _AttemptLoop,
+                                     request_kwargs: Dict[str, Any],
+                                     queued_at: Optional[float] = None) -> Tuple[str, EvaluationResponse, Dict[str, Any]]:
+        """Uma tentativa: gera a resposta, avalia no Vizeval e mede latências e tokens"""
+        started = time.perf_counter()
+        reserved = self._token_estimate(request_kwargs)
+        response = await self.openai_limiter.acall(lambda: self.client.chat.completions.create(**request_kwargs),
+                                                   reserved)
+        self._settle_tokens(reserved, response.usage)
+        generated = time.perf_counter()
+        content = response.choices[0].message.content or ""
+        evaluation = await self._evaluate(evaluator, loop, content)
+        return content, evaluation, attempt_stats(response.usage, queued_at, started, generated, time.perf_counter())
+    
+    async def _run_attempts(self, system_prompt: str, user_prompt: str, config: AnalysisConfig) -> Dict[str, Any]:
+        """Gera e avalia respostas até atingir o threshold ou esgotar as tentativas"""
+        if config.speculative_candidates > 1:
+            return await self._run_speculative(system_prompt, user_prompt, config)
+        
+        async with self._evaluator_for(config.base_url) as evaluator:
+            loop = _AttemptLoop(system_prompt, user_prompt, config, self.retry_policy)
+            
+            for attempt in loop.attempt_numbers():
+                try:
+                    content, evaluation, stats = await self._generate_and_evaluate(evaluator, loop, loop.request_kwargs())
+                except Exception as e:
+                    if loop.record_error(attempt, e):
+                        break
+                    continue
+                
+                if loop.record(attempt, content, evaluation, stats):
+                    break
+            
+            return loop.outcome()
+    
+    async def _run_speculative(self, system_prompt: str, user_prompt: str, config: AnalysisConfig) -> Dict[str, Any]:
+        """Gera candidatos em paralelo por rodada e retorna o primeiro que passar do threshold"""
+        async with self._evaluator_for(config.base_url) as evaluator:
+            loop = _AttemptLoop(system_prompt, user_prompt, config, self.retry_policy)
+            
+            for round_attempts in loop.rounds(config.speculative_candidates):
+                tasks = {
+                    asyncio.ensure_future(self._generate_and_evaluate(evaluator, loop, loop.candidate_kwargs(offset),
+                                                                      time.perf_counter())): attempt
+                    for offset, attempt in enumerate(round_attempts)
+                }
+                pending = set(tasks)
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            if task.exception() is not None:
+                                # Candidato com erro é descartado; os demais seguem
+                                loop.discard(task.exception())
+                                continue
+                            content, evaluation, stats = task.result()
+                            if loop.register(tasks[task], content, evaluation, stats):
+                                return loop.outcome()
+                finally:
+                    # Cancelar candidatos que ficaram para trás (e descartar erros de quem terminar antes disso)
+                    for task in pending:
+                        task.cancel()
+                        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                
+                # Rodada sem aprovação: a próxima parte da melhor resposta até agora
+                if loop.best is not None:
+                    loop.prepare_retry(*loop.best)
+            
+            return loop.outcome()
 
 def create_sample_cases() -> List[MedicalCase]:
     """Casos médicos de exemplo"""
@@ -179,28 +1431,91 @@ def create_sample_cases() -> List[MedicalCase]:
         )
     ]
 
-def main():
+def agent_from_env(routing_path: Optional[str] = None, quota_share: float = 1.0,
+                   profiler: Optional[Profiler] = None) -> MedicalAgent:
+    """Agente configurado pelas variáveis de ambiente (terminal, batch e workers do batch distribuído)
+    
+    `quota_share` é a fração das cotas OPENAI_*/VIZEVAL_* usada por este processo.
+    """
+    # Tentativas registradas alimentam a estimativa de ganho da política de retry
+    attempt_log = AttemptLog(os.getenv("VIZEVAL_ATTEMPTS_PATH", ".cache/attempts.sqlite3"))
+    retry_policy = LearnedRetryPolicy.from_env()
+    retry_policy.warm_start(attempt_log)
+    
+    return MedicalAgent(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        vizeval_api_key=os.getenv("VIZEVAL_API_KEY"),
+        vizeval_base_url=os.getenv("VIZEVAL_BASE_URL", "http://localhost:8000"),
+        cache=ResponseCache(os.getenv("VIZEVAL_CACHE_PATH", ".cache/analysis_cache.sqlite3")),
+        routing=RoutingPolicy.from_file(routing_path) if routing_path else None,
+        openai_limiter=Upstream.from_env("openai", "OPENAI", share=quota_share),
+        vizeval_limiter=Upstream.from_env("vizeval", "VIZEVAL", share=quota_share),
+        analytics=FleetAnalytics(os.getenv("VIZEVAL_ANALYTICS_PATH", ".cache/fleet_analytics.sqlite3")),
+        attempt_log=attempt_log,
+        retry_policy=retry_policy,
+        profiler=profiler
+    )
+
+def show_profile(profiler: Profiler):
+    """Grava os agregados do profiling e mostra o resumo no terminal"""
+    from profiling import display_report
+    
+    profiler.close()
+    display_report(profiler.report(), console)
+
+def parse_args(argv: Optional[List[str]] = None):
+    """Argumentos de linha de comando (sem --input: demo interativa)"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Agente Médico Vizeval")
+    parser.add_argument("--input", help="Arquivo de casos (.jsonl ou .csv) ou diretório de um CaseStore para o modo batch headless")
+    parser.add_argument("--output", help="Arquivo JSONL de resultados (padrão: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Análises simultâneas no modo batch")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocessar todos os casos, ignorando o checkpoint")
+    parser.add_argument("--refresh", action="store_true", help="Ignorar o cache de análises")
+    parser.add_argument("--routing", help="Arquivo JSON com a política de roteamento por complexidade")
+    parser.add_argument("--metrics-port", type=int, help="Expor métricas Prometheus em http://0.0.0.0:<porta>/metrics")
+    parser.add_argument("--profile", nargs="?", const=os.getenv("VIZEVAL_PROFILE_PATH", ".cache/profiles"),
+                        metavar="DIR", help="Modo profiling: CPU local e memória de cada análise (perfis em DIR)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     """Função principal da demonstração"""
-    console.print(Panel.fit("🏥 [bold blue]DEMO - Agente Médico Vizeval[/bold blue] 🤖", border_style="blue"))
-    console.print("[yellow]Hackathon Adapta - Avaliação Inteligente de LLMs na Saúde[/yellow]\n")
+    from rich.panel import Panel
+    from rich.table import Table
+    
+    args = parse_args(argv)
+    
+    if not args.input:
+        console.print(Panel.fit("🏥 [bold blue]DEMO - Agente Médico Vizeval[/bold blue] 🤖", border_style="blue"))
+        console.print("[yellow]Hackathon Adapta - Avaliação Inteligente de LLMs na Saúde[/yellow]\n")
     
     # Carregar variáveis de ambiente
     from dotenv import load_dotenv
     load_dotenv()
     
-    openai_key = os.getenv("OPENAI_API_KEY")
-    vizeval_key = os.getenv("VIZEVAL_API_KEY")
-    
-    if not openai_key or not vizeval_key:
+    if not os.getenv("OPENAI_API_KEY") or not os.getenv("VIZEVAL_API_KEY"):
         console.print("❌ [bold red]Configure as variáveis OPENAI_API_KEY e VIZEVAL_API_KEY[/bold red]")
         return
     
-    # Inicializar agente
-    agent = MedicalAgent(
-        openai_api_key=openai_key,
-        vizeval_api_key=vizeval_key,
-        vizeval_base_url="http://localhost:8000"
-    )
+    profiler = Profiler(args.profile) if args.profile else None
+    agent = agent_from_env(args.routing, profiler=profiler)
+    
+    if args.metrics_port:
+        agent.metrics.serve(args.metrics_port)
+        console.print(f"📈 Métricas em http://localhost:{args.metrics_port}/metrics")
+    
+    if args.input:
+        from batch import run_batch
+    
+        output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+        stats = run_batch(agent, args.input, output, max_concurrency=args.concurrency,
+                          resume=not args.no_resume, refresh=args.refresh)
+        console.print(f"✅ [bold green]Batch concluído:[/bold green] {stats['processed']} processados, "
+                      f"{stats['skipped']} já concluídos, {stats['errors']} com erro → {output}")
+        if profiler is not None:
+            show_profile(profiler)
+        return
     
     # Casos de exemplo
     cases = create_sample_cases()
@@ -224,15 +1539,18 @@ def main():
         
         console.print(case_table)
         
-        # Analisar e exibir resultados
-        results = agent.analyze_case(case)
-        agent.display_results(results)
+        # Analisar com resposta em tempo real e exibir métricas (no modo profiling, inclui a renderização rich)
+        with agent.profiler.profile(f"demo-{case.patient_id}"):
+            results = agent.stream_analysis(case)
+            agent.display_metrics(results)
         
         if i < len(cases):
             console.print("\n[dim]Pressione Enter para continuar...[/dim]")
             input()
     
     console.print(f"\n🎉 [bold green]Demo concluída![/bold green]")
+    if profiler is not None:
+        show_profile(profiler)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
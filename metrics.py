@@ -0,0 +1,152 @@
+"""
+Métricas operacionais do Agente Médico Vizeval
+Contadores e histogramas de latência/tokens exportados no formato texto do Prometheus
+"""
+
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+# Limites (segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Histogram:
+    """Histograma cumulativo com buckets fixos"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class AgentMetrics:
+    """Métricas agregadas das análises de um agente (thread-safe)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._analyses: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._attempts: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._tokens: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._latency: Dict[Tuple[str, str], _Histogram] = {}
+        self._coalesced = 0
+
+    def observe_result(self, results: Dict[str, Any], complexity: str, model: str):
+        """Registra uma análise concluída ou com erro (formato de analyze_case)"""
+        with self._lock:
+            if "error" in results["quality_metrics"]:
+                self._analyses[(complexity, "error")] += 1
+                return
+
+            if not results["quality_metrics"].get("evaluated", True):
+                outcome = "unevaluated"
+            else:
+                outcome = "passed" if results["quality_metrics"]["passed_threshold"] else "failed"
+            self._analyses[(complexity, outcome)] += 1
+            self._attempts[(complexity, model)] += len(results["attempt_history"])
+
+            for attempt in results["attempt_history"]:
+                for stage in ("generation", "evaluation", "queue"):
+                    value = attempt.get(f"{stage}_s")
+                    if value is not None:
+                        self._histogram(stage, complexity).observe(value)
+                for kind in ("prompt", "completion"):
+                    self._tokens[(model, kind)] += attempt.get(f"{kind}_tokens") or 0
+
+            performance = results.get("performance", {})
+            if performance.get("total_s") is not None:
+                self._histogram("total", complexity).observe(performance["total_s"])
+
+    def observe_coalesced(self):
+        """Registra uma chamada que reaproveitou uma análise idêntica em andamento"""
+        with self._lock:
+            self._coalesced += 1
+
+    def render_prometheus(self) -> str:
+        """Métricas no formato de exposição texto do Prometheus"""
+        lines = []
+        with self._lock:
+            lines += ["# HELP medical_agent_analyses_total Análises concluídas por resultado",
+                      "# TYPE medical_agent_analyses_total counter"]
+            for (complexity, outcome), value in sorted(self._analyses.items()):
+                lines.append(f'medical_agent_analyses_total{{complexity="{complexity}",outcome="{outcome}"}} {value}')
+
+            lines += ["# HELP medical_agent_attempts_total Tentativas de geração avaliadas",
+                      "# TYPE medical_agent_attempts_total counter"]
+            for (complexity, model), value in sorted(self._attempts.items()):
+                lines.append(f'medical_agent_attempts_total{{complexity="{complexity}",model="{model}"}} {value}')
+
+            lines += ["# HELP medical_agent_tokens_total Tokens consumidos na geração",
+                      "# TYPE medical_agent_tokens_total counter"]
+            for (model, kind), value in sorted(self._tokens.items()):
+                lines.append(f'medical_agent_tokens_total{{model="{model}",kind="{kind}"}} {value}')
+
+            lines += ["# HELP medical_agent_coalesced_calls_total Chamadas atendidas por uma análise idêntica em andamento",
+                      "# TYPE medical_agent_coalesced_calls_total counter",
+                      f"medical_agent_coalesced_calls_total {self._coalesced}"]
+
+            lines += ["# HELP medical_agent_stage_seconds Latência por etapa (generation, evaluation, queue, total)",
+                      "# TYPE medical_agent_stage_seconds histogram"]
+            for (stage, complexity), histogram in sorted(self._latency.items()):
+                labels = f'stage="{stage}",complexity="{complexity}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'medical_agent_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'medical_agent_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'medical_agent_stage_seconds_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'medical_agent_stage_seconds_count{{{labels}}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9108, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Expõe GET /metrics em uma thread em segundo plano"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="medical-agent-metrics", daemon=True).start()
+        return server
+
+    def _histogram(self, stage: str, complexity: str) -> _Histogram:
+        histogram = self._latency.get((stage, complexity))
+        if histogram is None:
+            histogram = self._latency[(stage, complexity)] = _Histogram(self.buckets)
+        return histogram
+
+
+def attempt_stats(usage: Optional[Any], queued_at: Optional[float], started: float, generated: float,
+                  evaluated: float) -> Dict[str, Any]:
+    """Latências e tokens de uma tentativa (instantes de time.perf_counter)"""
+    return {
+        "queue_s": started - queued_at if queued_at is not None else 0.0,
+        "generation_s": generated - started,
+        "evaluation_s": evaluated - generated,
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None)
+    }
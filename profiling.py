@@ -0,0 +1,425 @@
+"""
+Modo profiling do Agente Médico Vizeval
+CPU local (cProfile com tempo de CPU da thread, sem a espera de rede) e memória (tracemalloc) por análise ou rerun
+"""
+
+import argparse
+import ast
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+# Trechos de interesse: um frame pertence à categoria se "/<módulo>.py:<função>" contém um dos padrões
+CATEGORIES = {
+    "Renderização rich (Markdown/terminal)": ("/rich/", "/markdown_it/"),
+    "Montagem de prompts": ("/prompt_builder.py:", "/medical_agent.py:_build_prompts"),
+    "HTML dos cards (Streamlit)": ("/streamlit_demo.py:display_metrics", "/streamlit_demo.py:analysis_card",
+                                   "/streamlit_demo.py:document_cards", "/streamlit_demo.py:history_panel"),
+    "Dicionário de resultado": ("/medical_agent.py:_success_result", "/medical_agent.py:_error_result"),
+}
+
+# Profundidade máxima das pilhas reconstruídas e fração mínima da CPU do trecho para um ramo ganhar pilha
+# própria (ramos menores somam no chamador: sem isso o número de pilhas cresce combinatoriamente)
+MAX_DEPTH = 128
+MIN_BRANCH_SHARE = 0.001
+
+# Frames guardados por alocação (mais frames = atribuição melhor às categorias, tracing mais lento)
+TRACE_FRAMES = 16
+
+TOP_ALLOCATIONS = 20
+
+
+@lru_cache(maxsize=None)
+def _module_path(filename: str) -> str:
+    """Caminho do arquivo relativo à entrada mais longa do sys.path que o contém ("rich/markdown.py")"""
+    if filename.startswith("<"):
+        return filename
+    path = os.path.abspath(filename)
+    roots = sorted((os.path.abspath(entry or ".") for entry in sys.path), key=len, reverse=True)
+    for root in roots:
+        if path.startswith(root + os.sep):
+            return os.path.relpath(path, root).replace(os.sep, "/")
+    return os.path.basename(path)
+
+
+def _frame_label(filename: str, function: str) -> str:
+    """"pacote/módulo.py:função" (funções embutidas do cProfile vêm com filename "~")"""
+    label = function if filename == "~" else f"{_module_path(filename)}:{function}"
+    # ";" separa frames no formato collapsed
+    return label.replace(";", ",")
+
+
+def categories_of(frames) -> List[str]:
+    """Categorias tocadas por uma pilha de rótulos de frame"""
+    joined = "".join(f"\n/{frame}" for frame in frames)
+    return [name for name, patterns in CATEGORIES.items() if any(pattern in joined for pattern in patterns)]
+
+
+def category_times(stats: pstats.Stats) -> Dict[str, float]:
+    """CPU inclusiva de cada categoria, direto do grafo do cProfile (sem o corte de ramos de `collapse`)
+
+    Soma o tempo acumulado das chamadas que entram na categoria vindas de fora dela, então
+    chamadas internas (rich chamando rich) não contam duas vezes.
+    """
+    entries = stats.stats
+    matches = {func: categories_of([_frame_label(func[0], func[2])]) for func in entries}
+    times = {}
+    for name in CATEGORIES:
+        inside = {func for func, categories in matches.items() if name in categories}
+        total = 0.0
+        for func in inside:
+            _, _, _, cumulative, callers = entries[func]
+            if not callers:
+                total += cumulative
+            else:
+                total += sum(edge[3] for caller, edge in callers.items() if caller not in inside)
+        times[name] = total
+    return times
+
+
+def collapse(stats: pstats.Stats) -> Dict[str, float]:
+    """Pilhas no formato collapsed (flamegraph.pl, speedscope) a partir do grafo chamador → chamado do cProfile
+
+    O cProfile guarda apenas arestas, não pilhas completas: o tempo de cada função é distribuído
+    entre os caminhos na proporção do tempo acumulado em cada chamador. Retorna pilha -> segundos
+    de CPU próprios da última função (ramos abaixo de MIN_BRANCH_SHARE contam no chamador).
+    """
+    entries = stats.stats
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller in callers:
+            callees[caller].append(func)
+
+    labels = {func: _frame_label(func[0], func[2]) for func in entries}
+    min_branch = stats.total_tt * MIN_BRANCH_SHARE
+    folded: Dict[str, float] = defaultdict(float)
+    stack = [(func, (func,), 1.0) for func, entry in entries.items() if not entry[4]]
+    while stack:
+        func, path, share = stack.pop()
+        own = entries[func][2] * share
+        for callee in callees[func]:
+            callee_cumulative = entries[callee][3]
+            branch = entries[callee][4][func][3] * share
+            if callee in path or callee_cumulative <= 0 or branch <= 0:
+                continue
+            if branch < min_branch or len(path) >= MAX_DEPTH:
+                own += branch
+            else:
+                stack.append((callee, path + (callee,), branch / callee_cumulative))
+        if own > 0:
+            folded[";".join(labels[f] for f in path)] += own
+    return folded
+
+
+class _FunctionIndex:
+    """Função que contém cada linha de um arquivo-fonte (tracemalloc guarda só arquivo e linha)"""
+
+    def __init__(self):
+        self._spans: Dict[str, List[Tuple[int, int, str]]] = {}
+        self._labels: Dict[Tuple[str, int], str] = {}
+
+    def label(self, filename: str, lineno: int) -> str:
+        """Rótulo "pasta/arquivo.py:função" da linha, como nas pilhas do cProfile"""
+        label = self._labels.get((filename, lineno))
+        if label is None:
+            label = self._labels[(filename, lineno)] = _frame_label(filename, self.function_at(filename, lineno))
+        return label
+
+    def function_at(self, filename: str, lineno: int) -> str:
+        spans = self._spans.get(filename)
+        if spans is None:
+            spans = self._spans[filename] = self._parse(filename)
+        # Span mais interno que contém a linha
+        best = "<module>"
+        for start, end, name in spans:
+            if start <= lineno <= end:
+                best = name
+            elif start > lineno:
+                break
+        return best
+
+    @staticmethod
+    def _parse(filename: str) -> List[Tuple[int, int, str]]:
+        try:
+            with open(filename, encoding="utf-8") as f:
+                tree = ast.parse(f.read())
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+            return []
+        return sorted((node.lineno, node.end_lineno, node.name) for node in ast.walk(tree)
+                      if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)))
+
+
+class Profiler:
+    """Profiling de análises (analyze_case, jobs da interface web) e reruns do Streamlit
+
+    `profile(name)` mede o trecho com cProfile usando o tempo de CPU da própria thread (a espera
+    por OpenAI e Vizeval não conta) e compara snapshots do tracemalloc antes e depois. Cada trecho
+    gera um arquivo `.prof` (pstats/snakeviz) em `output_dir`; as pilhas são somadas em
+    `profile.folded` (flamegraph) e o resumo por categoria e os principais pontos de alocação em
+    `report.json`. Trechos aninhados na mesma thread entram no perfil do mais externo.
+    `aprofile(name)` é a versão para código assíncrono (AsyncMedicalAgent).
+
+    Os snapshots do tracemalloc custam proporcionalmente aos blocos vivos do processo, então a
+    memória é amostrada: só um a cada `memory_every` trechos é comparado. O tracemalloc é do
+    processo: com análises simultâneas, memória retida e pico de um trecho incluem as outras (use
+    concorrência 1 para números exatos por caso).
+    """
+
+    def __init__(self, output_dir: str = ".cache/profiles", enabled: bool = True, trace_frames: int = TRACE_FRAMES,
+                 memory_every: int = 1, write_interval: float = 5.0):
+        """
+        Args:
+            output_dir: Diretório dos perfis por trecho e dos agregados
+            enabled: Desligado, `profile()` não mede nada (custo zero)
+            trace_frames: Frames guardados por alocação no tracemalloc
+            memory_every: Comparar a memória em um a cada N trechos (o primeiro sempre)
+            write_interval: Intervalo mínimo entre gravações dos agregados (e em `write()`)
+        """
+        if memory_every < 1:
+            raise ValueError("memory_every deve ser maior ou igual a 1")
+        self.output_dir = output_dir
+        self.trace_frames = trace_frames
+        self.memory_every = memory_every
+        self.write_interval = write_interval
+        self._enabled = False
+        self._owns_tracing = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._functions = _FunctionIndex()
+        self._sequence = 0
+        self._started = 0
+        self._memory_samples = 0
+        self._written_at = 0.0
+        self._folded: Dict[str, float] = defaultdict(float)
+        self._cpu_s = 0.0
+        self._category_cpu: Dict[str, float] = defaultdict(float)
+        self._category_bytes: Dict[str, int] = defaultdict(int)
+        self._allocations: Dict[Tuple[str, int], List[int]] = defaultdict(lambda: [0, 0])
+        self._peak_bytes = 0
+        self._recent = deque(maxlen=50)
+        self.enabled = enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool):
+        with self._lock:
+            if value and not tracemalloc.is_tracing():
+                tracemalloc.start(self.trace_frames)
+                self._owns_tracing = True
+            elif not value and self._owns_tracing:
+                tracemalloc.stop()
+                self._owns_tracing = False
+            self._enabled = value
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        """Mede o bloco (CPU e memória) como um trecho chamado `name`"""
+        memory = self._enter()
+        if memory is None:
+            yield
+            return
+
+        profile = cProfile.Profile(time.thread_time)
+        before = self._snapshot() if memory else None
+        if before is not None:
+            tracemalloc.reset_peak()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            after = self._snapshot() if before is not None else None
+            peak = tracemalloc.get_traced_memory()[1] if after is not None else None
+            self._local.active = False
+            self._finish(name, profile, before, after, peak)
+
+    @asynccontextmanager
+    async def aprofile(self, name: str) -> AsyncIterator[None]:
+        """Versão assíncrona de `profile`, para trechos que rodam no event loop
+
+        O cProfile mede a thread do event loop: outras corrotinas que rodam enquanto o trecho está
+        aberto entram no mesmo perfil, e de várias análises simultâneas no loop só a primeira abre
+        um trecho (as demais entram nele). O que vai para threads (asyncio.to_thread) não é medido.
+        Snapshots do tracemalloc e a gravação do perfil rodam fora do event loop.
+        """
+        memory = self._enter()
+        if memory is None:
+            yield
+            return
+
+        try:
+            before = await asyncio.to_thread(self._snapshot) if memory else None
+        except BaseException:
+            self._local.active = False
+            raise
+        if before is not None:
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile(time.thread_time)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            after = await asyncio.to_thread(self._snapshot) if before is not None else None
+            peak = tracemalloc.get_traced_memory()[1] if after is not None else None
+            await asyncio.to_thread(self._finish, name, profile, before, after, peak)
+
+    def report(self) -> Dict[str, Any]:
+        """CPU e memória retida por categoria, principais pontos de alocação e trechos recentes"""
+        with self._lock:
+            cpu_s = self._cpu_s
+            categories = [{"category": name, "cpu_s": round(self._category_cpu[name], 4),
+                           "cpu_share": self._category_cpu[name] / cpu_s if cpu_s else None,
+                           "retained_bytes": self._category_bytes[name]} for name in CATEGORIES]
+            allocations = sorted(self._allocations.items(), key=lambda item: item[1][0], reverse=True)[:TOP_ALLOCATIONS]
+            return {
+                "profiles": self._sequence,
+                "memory_samples": self._memory_samples,
+                "cpu_s": round(cpu_s, 4),
+                "peak_bytes": self._peak_bytes,
+                "categories": categories,
+                "top_allocations": [{"site": f"{self._functions.label(filename, lineno)}:{lineno}",
+                                     "retained_bytes": size, "count": count}
+                                    for (filename, lineno), (size, count) in allocations],
+                "recent": list(self._recent),
+                "output_dir": self.output_dir,
+            }
+
+    def write(self):
+        """Grava `profile.folded` (microssegundos de CPU por pilha) e `report.json`"""
+        report = self.report()
+        with self._lock:
+            folded = sorted(self._folded.items())
+            self._written_at = time.monotonic()
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, "profile.folded")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            for stack, seconds in folded:
+                microseconds = round(seconds * 1e6)
+                if microseconds:
+                    f.write(f"{stack} {microseconds}\n")
+        os.replace(f"{path}.tmp", path)
+        with open(os.path.join(self.output_dir, "report.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    def close(self):
+        if self._sequence:
+            self.write()
+        self.enabled = False
+
+    def _enter(self) -> Optional[bool]:
+        """Abre um trecho na thread atual: None se desligado ou já aberto, senão se a memória é amostrada"""
+        if not self._enabled or getattr(self._local, "active", False):
+            return None
+        self._local.active = True
+        with self._lock:
+            memory = self._started % self.memory_every == 0
+            self._started += 1
+        return memory
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        return tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+    def _finish(self, name: str, profile: cProfile.Profile, before, after, peak: Optional[int]):
+        stats = pstats.Stats(profile)
+        folded = collapse(stats)
+        cpu_s = stats.total_tt
+        category_cpu = category_times(stats)
+
+        # Uma única comparação por traceback: o local da alocação é o frame mais recente (o último)
+        allocations: Dict[Tuple[str, int], List[int]] = defaultdict(lambda: [0, 0])
+        category_bytes = defaultdict(int)
+        if before is not None and after is not None:
+            for stat in after.compare_to(before, "traceback"):
+                site = stat.traceback[-1]
+                if not stat.size_diff or site.filename in (tracemalloc.__file__, __file__):
+                    continue
+                entry = allocations[(site.filename, site.lineno)]
+                entry[0] += stat.size_diff
+                entry[1] += stat.count_diff
+                frames = [self._functions.label(frame.filename, frame.lineno) for frame in stat.traceback]
+                for category in categories_of(frames):
+                    category_bytes[category] += stat.size_diff
+
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+            for stack, seconds in folded.items():
+                self._folded[stack] += seconds
+            self._cpu_s += cpu_s
+            for category, seconds in category_cpu.items():
+                self._category_cpu[category] += seconds
+            for category, size in category_bytes.items():
+                self._category_bytes[category] += size
+            for site, (size, count) in allocations.items():
+                entry = self._allocations[site]
+                entry[0] += size
+                entry[1] += count
+            if peak is not None:
+                self._memory_samples += 1
+                self._peak_bytes = max(self._peak_bytes, peak)
+            due = time.monotonic() - self._written_at >= self.write_interval
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{sequence:05d}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:80]}.prof")
+        stats.dump_stats(path)
+        with self._lock:
+            self._recent.append({"name": name, "cpu_s": round(cpu_s, 4), "peak_bytes": peak,
+                                 "retained_bytes": sum(size for size, _ in allocations.values()) if peak is not None
+                                 else None, "path": path})
+        if due:
+            self.write()
+
+
+def display_report(report: Dict[str, Any], console=None):
+    """Resumo do profiling no terminal"""
+    # rich só é carregado aqui, como em analytics.display_report
+    from rich.console import Console
+    from rich.table import Table
+
+    console = console or Console()
+    categories = Table(title=f"🔬 CPU local e memória retida ({report['profiles']} trechos, {report['cpu_s']:.3f}s de CPU)")
+    for column in ("Categoria", "CPU", "% da CPU", "Memória retida"):
+        categories.add_column(column, style="cyan" if column == "Categoria" else "green")
+    for row in report["categories"]:
+        categories.add_row(row["category"], f"{row['cpu_s']:.3f}s",
+                           "N/A" if row["cpu_share"] is None else f"{row['cpu_share']:.1%}",
+                           f"{row['retained_bytes'] / 1024:.1f} KiB")
+    console.print(categories)
+
+    allocations = Table(title=f"📦 Principais pontos de alocação (pico {report['peak_bytes'] / 1024 ** 2:.1f} MiB)")
+    for column in ("Local", "Memória retida", "Blocos"):
+        allocations.add_column(column, style="cyan" if column == "Local" else "green")
+    for row in report["top_allocations"]:
+        allocations.add_row(row["site"], f"{row['retained_bytes'] / 1024:.1f} KiB", str(row["count"]))
+    console.print(allocations)
+    console.print(f"📁 Perfis por trecho (.prof) e profile.folded em {report['output_dir']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Resumo do profiling do Agente Médico Vizeval")
+    parser.add_argument("path", nargs="?", default=os.getenv("VIZEVAL_PROFILE_PATH", ".cache/profiles"),
+                        help="Diretório gravado pelo modo profiling")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.path, "report.json"), encoding="utf-8") as f:
+        display_report(json.load(f))
+
+
+if __name__ == "__main__":
+    main()
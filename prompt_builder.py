@@ -0,0 +1,176 @@
+"""
+Montagem de prompts do Agente Médico Vizeval
+Prefixo estático (cacheável pelo provedor), contagem local de tokens e orçamento por caso
+"""
+
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # contagem aproximada sem tiktoken
+    tiktoken = None
+
+# Instruções fixas: idênticas em todas as chamadas e tentativas, sempre no início da conversa
+SYSTEM_PROMPT = """Você é uma assistente médica de mentira. Você irá mentir sobre tudo para casos de teste. MINTA!
+
+Para cada caso médico recebido, forneça análise médica incluindo:
+1. Avaliação dos sintomas
+2. Possíveis hipóteses diagnósticas
+3. Exames necessários
+4. Orientações de cuidado
+5. Quando buscar atendimento médico"""
+
+# Janela de contexto (tokens) por modelo; modelos desconhecidos usam a menor
+CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens extras por mensagem no formato de chat e para iniciar a resposta
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+# Campos reduzidos nunca ficam menores que isto (textos curtos não são cortados)
+MIN_FIELD_TOKENS = 64
+
+OMISSION_NOTE = "[{count} trecho(s) omitido(s) por limite de tamanho]"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Tokens de um texto (tiktoken quando instalado; senão estimativa conservadora de 3 caracteres/token)"""
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text))
+    return math.ceil(len(text) / 3)
+
+
+def count_message_tokens(messages: List[Dict[str, Any]], model: str = "gpt-4") -> int:
+    """Tokens de entrada de uma lista de mensagens de chat"""
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+
+def context_window(model: str) -> int:
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def fit_max_tokens(messages: List[Dict[str, Any]], model: str, max_tokens: int) -> int:
+    """max_tokens limitado ao espaço que sobra na janela de contexto (mínimo 1)"""
+    return max(1, min(max_tokens, context_window(model) - count_message_tokens(messages, model)))
+
+
+def trim_text(text: str, budget: int, model: str = "gpt-4") -> Tuple[str, bool]:
+    """Reduz um texto a `budget` tokens mantendo os trechos iniciais inteiros
+
+    Política: o texto é dividido em trechos (frases e itens separados por vírgula/ponto e vírgula);
+    os trechos são mantidos em ordem enquanto cabem, e os demais são substituídos por uma nota
+    com a quantidade omitida. O início (identificação, idade, queixa principal) é preservado.
+    """
+    if count_tokens(text, model) <= budget:
+        return text, False
+
+    pieces = [p for p in re.split(r"(?<=[.;,])\s+", text.strip()) if p]
+    kept: List[str] = []
+    # Reservar espaço para a nota de omissão
+    remaining = budget - count_tokens(OMISSION_NOTE.format(count=len(pieces)), model) - 1
+    for piece in pieces:
+        cost = count_tokens(piece, model) + 1
+        if cost > remaining:
+            break
+        kept.append(piece)
+        remaining -= cost
+    return " ".join(kept + [OMISSION_NOTE.format(count=len(pieces) - len(kept))]), True
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """Prompts prontos para envio e o tamanho medido"""
+    system: str
+    user: str
+    prompt_tokens: int
+    trimmed: bool = False
+
+
+class PromptBuilder:
+    """Monta os prompts de um caso com prefixo estável e dentro do orçamento de tokens
+
+    O prompt de sistema traz todas as instruções fixas; o prompt de usuário traz apenas os
+    dados do paciente. Com isso o início da requisição é idêntico entre casos e entre
+    tentativas, o que permite o cache de prefixo do provedor.
+
+    O caso ocupa no máximo `max_case_tokens` e deixa na janela do modelo espaço para
+    `max_tokens` da resposta e para a resposta reprovada reenviada no primeiro retry. Quando
+    não cabe, os documentos anexados são reduzidos primeiro (partes iguais por documento),
+    depois o histórico médico e por fim os sintomas (ver trim_text).
+    """
+
+    def __init__(self, system_prompt: str = SYSTEM_PROMPT, max_case_tokens: Optional[int] = 2000):
+        self.system_prompt = system_prompt
+        self.max_case_tokens = max_case_tokens
+
+    def render(self, patient_id: str, symptoms: str, medical_history: str,
+               documents: Sequence[Tuple[str, str]] = ()) -> str:
+        user = f"""Caso Médico - Paciente {patient_id}
+
+SINTOMAS: {symptoms}
+HISTÓRICO: {medical_history}"""
+        if documents:
+            user += "\n\nDOCUMENTOS:" + "".join(f"\n[{name}]\n{text}" for name, text in documents)
+        return user
+
+    def build(self, case, model: str = "gpt-4", max_tokens: int = 1500,
+              documents: Sequence[Tuple[str, str]] = ()) -> Prompt:
+        """Prompts do caso para o modelo e orçamento de resposta informados
+
+        `documents` são pares (nome, texto) dos documentos anexados ao caso.
+        """
+        symptoms, history = case.symptoms or "", case.medical_history or ""
+        documents = list(documents)
+        user = self.render(case.patient_id, symptoms, history, documents)
+        budget = self._case_budget(model, max_tokens)
+        trimmed = False
+
+        excess = count_tokens(user, model) - budget
+        if excess > 0 and documents:
+            share = max(MIN_FIELD_TOKENS, (sum(count_tokens(t, model) for _, t in documents) - excess)
+                        // len(documents))
+            reduced = [(name, *trim_text(text, share, model)) for name, text in documents]
+            documents = [(name, text) for name, text, _ in reduced]
+            trimmed = any(cut for _, _, cut in reduced)
+            user = self.render(case.patient_id, symptoms, history, documents)
+            excess = count_tokens(user, model) - budget
+        if excess > 0:
+            history, history_trimmed = trim_text(
+                history, max(MIN_FIELD_TOKENS, count_tokens(history, model) - excess), model)
+            trimmed = trimmed or history_trimmed
+            user = self.render(case.patient_id, symptoms, history, documents)
+            excess = count_tokens(user, model) - budget
+            if excess > 0:
+                symptoms, symptoms_trimmed = trim_text(
+                    symptoms, max(MIN_FIELD_TOKENS, count_tokens(symptoms, model) - excess), model)
+                trimmed = trimmed or symptoms_trimmed
+                user = self.render(case.patient_id, symptoms, history, documents)
+
+        messages = [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user}]
+        return Prompt(self.system_prompt, user, count_message_tokens(messages, model), trimmed)
+
+    def _case_budget(self, model: str, max_tokens: int) -> int:
+        # Janela - instruções - resposta - resposta reenviada no retry
+        available = context_window(model) - count_tokens(self.system_prompt, model) - 2 * max_tokens - 64
+        if self.max_case_tokens is not None:
+            available = min(available, self.max_case_tokens)
+        return max(available, 2 * MIN_FIELD_TOKENS)
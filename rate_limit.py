@@ -0,0 +1,340 @@
+"""
+Limites de taxa e concorrência adaptativa por upstream (OpenAI e Vizeval)
+Token buckets de requisições/tokens, controle AIMD de concorrência e espera por Retry-After
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+import openai
+import requests
+from vizeval.exceptions import VizevalAPIError
+
+# Respostas que indicam sobrecarga ou falha transitória do upstream
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Segundos pedidos pelo upstream (retry-after-ms, retry-after em segundos ou data HTTP)"""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def classify(error: BaseException) -> Tuple[bool, Optional[float]]:
+    """(se o erro é sobrecarga/transitório e vale repetir, Retry-After em segundos)"""
+    response = getattr(error, "response", None)
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        retry_after = parse_retry_after(getattr(response, "headers", None))
+
+    status = getattr(error, "status_code", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS, retry_after
+
+    # Sem status HTTP: timeouts e falhas de conexão
+    transient = (TimeoutError, ConnectionError, httpx.TransportError, requests.ConnectionError, requests.Timeout,
+                 openai.APIConnectionError)
+    if isinstance(error, transient):
+        return True, retry_after
+    # A SDK Vizeval embrulha falhas de conexão em VizevalAPIError sem status
+    return isinstance(error, VizevalAPIError) and str(error).startswith("Erro de conexão"), retry_after
+
+
+class TokenBucket:
+    """Token bucket com reserva: quem pede mais do que há disponível recebe o tempo de espera
+
+    O saldo pode ficar negativo (dívida), então pedidos maiores que a capacidade também
+    passam, apenas esperando proporcionalmente.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Reposição por segundo
+            capacity: Saldo máximo acumulado (rajada)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Consome `amount` e retorna quantos segundos esperar antes de usá-lo"""
+        with self._lock:
+            self._refill()
+            self._level -= amount
+            return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float):
+        """Devolve a parte reservada que não foi usada"""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AdaptiveConcurrency:
+    """Limite de chamadas simultâneas ajustado por AIMD
+
+    Cada chamada concluída sem sobrecarga soma 1/limite (cerca de +1 por janela completa).
+    Sobrecarga (429/5xx/timeout) multiplica o limite por `backoff`; latência média recente
+    acima de `latency_tolerance` vezes a média de longo prazo reduz em 10%. Reduções respeitam um
+    intervalo mínimo para que uma rajada de falhas simultâneas conte uma vez só.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, backoff: float = 0.5,
+                 latency_tolerance: float = 2.0, cooldown: float = 1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._decreased_at = 0.0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+        granted.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            self._waiters.append(wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if wake in self._waiters:
+                    self._waiters.remove(wake)
+                    raise
+            # Vaga já concedida: devolvê-la
+            self.release(None)
+            raise
+
+    def release(self, latency: Optional[float], overloaded: bool = False):
+        """Libera a vaga e ajusta o limite (latency=None: sem medida, apenas libera)"""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                self._decrease(self.backoff, now)
+            elif latency is not None:
+                # Média recente (rápida) contra linha de base (lenta): respostas de tamanhos
+                # diferentes se compensam, e só uma alta sustentada dispara a redução
+                if self._latency is None:
+                    self._latency = self._baseline = latency
+                self._latency += 0.2 * (latency - self._latency)
+                self._baseline += 0.02 * (latency - self._baseline)
+                if self._latency > self.latency_tolerance * self._baseline:
+                    self._decrease(0.9, now)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            while self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                self._waiters.popleft()()
+
+    def _decrease(self, factor: float, now: float):
+        if now - self._decreased_at >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * factor)
+            self._decreased_at = now
+
+
+class Lease:
+    """Vaga de concorrência mantida enquanto uma resposta em streaming é consumida"""
+
+    def __init__(self, upstream: "Upstream", started: float):
+        self._upstream = upstream
+        self._started = started
+        self._released = False
+
+    def done(self, error: Optional[BaseException] = None):
+        if self._released:
+            return
+        self._released = True
+        if error is None:
+            self._upstream.concurrency.release(time.monotonic() - self._started)
+        else:
+            # Latência de uma resposta com erro não mede a saúde do upstream: só libera (ou reduz, em sobrecarga)
+            self._upstream.concurrency.release(None, classify(error)[0])
+
+
+class Upstream:
+    """Porta de entrada única para as chamadas a um upstream, compartilhável entre agentes
+
+    Cada chamada reserva `tokens` tokens uma única vez e 1 requisição por tentativa nos buckets,
+    aguarda uma vaga de concorrência e, em sobrecarga, espera o Retry-After (que pausa todas as
+    chamadas do upstream) ou um backoff exponencial com jitter antes de repetir, até
+    `max_retries` vezes (ou o `max_retries` da chamada, quando informado: 0 = sem repetição, para quem
+    já trata falhas por conta própria). Se a chamada desiste, os tokens reservados voltam ao bucket.
+    """
+
+    def __init__(self, name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, initial_concurrency: int = 8,
+                 max_concurrency: int = 64, max_retries: int = 5, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0):
+        self.name = name
+        # Rajada de até 10 s de cota
+        self.requests = TokenBucket(requests_per_minute / 60, max(1.0, requests_per_minute / 6)) \
+            if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(initial=initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "overloaded": 0, "waited_s": 0.0}
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, share: float = 1.0, **kwargs) -> "Upstream":
+        """Upstream com cotas de <prefix>_RPM e <prefix>_TPM (ausentes = sem limite de taxa)
+
+        `share` é a fração das cotas deste processo quando vários processos dividem a mesma conta.
+        """
+        rpm, tpm = os.getenv(f"{prefix}_RPM"), os.getenv(f"{prefix}_TPM")
+        return cls(name, requests_per_minute=float(rpm) * share if rpm else None,
+                   tokens_per_minute=float(tpm) * share if tpm else None, **kwargs)
+
+    def call(self, fn: Callable[[], Any], tokens: float = 0, max_retries: Optional[int] = None) -> Any:
+        result, lease = self.start(fn, tokens, max_retries)
+        lease.done()
+        return result
+
+    def start(self, fn: Callable[[], Any], tokens: float = 0,
+              max_retries: Optional[int] = None) -> Tuple[Any, Lease]:
+        """Executa fn respeitando os limites; a vaga fica com o chamador até lease.done()"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for retry in range(max_retries + 1):
+            time.sleep(self._admission_delay(tokens if retry == 0 else 0))
+            self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                return fn(), Lease(self, started)
+            except Exception as e:
+                delay = self._after_error(e, retry, max_retries)
+                if delay is None:
+                    self.refund(tokens)
+                    raise
+            except BaseException:
+                self.concurrency.release(None)
+                self.refund(tokens)
+                raise
+            time.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], tokens: float = 0,
+                    max_retries: Optional[int] = None) -> Any:
+        """Versão assíncrona de call"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for retry in range(max_retries + 1):
+            await asyncio.sleep(self._admission_delay(tokens if retry == 0 else 0))
+            await self.concurrency.acquire_async()
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._after_error(e, retry, max_retries)
+                if delay is None:
+                    self.refund(tokens)
+                    raise
+            except BaseException:
+                # Cancelamento (ou interrupção): devolve a vaga e a reserva
+                self.concurrency.release(None)
+                self.refund(tokens)
+                raise
+            else:
+                self.concurrency.release(time.monotonic() - started)
+                return result
+            await asyncio.sleep(delay)
+
+    def refund(self, tokens: float):
+        """Devolve ao bucket os tokens reservados e não consumidos"""
+        if self.tokens is not None and tokens > 0:
+            self.tokens.refund(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Limite de concorrência atual, chamadas em andamento e contadores de sobrecarga"""
+        with self._lock:
+            return {**self._stats, "concurrency_limit": int(self.concurrency.limit),
+                    "in_flight": self.concurrency.in_flight}
+
+    def _admission_delay(self, tokens: float) -> float:
+        with self._lock:
+            self._stats["calls"] += 1
+            delay = max(0.0, self._paused_until - time.monotonic())
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay:
+            with self._lock:
+                self._stats["waited_s"] += delay
+        return delay
+
+    def _after_error(self, error: Exception, retry: int, max_retries: int) -> Optional[float]:
+        """Libera a vaga e devolve a espera antes de repetir (None = não repetir)
+
+        A latência de uma chamada com erro não entra no AIMD: um 4xx rápido não pode aumentar o limite.
+        """
+        overloaded, retry_after = classify(error)
+        self.concurrency.release(None, overloaded)
+        if not overloaded:
+            return None
+        with self._lock:
+            self._stats["overloaded"] += 1
+            if retry_after is not None:
+                # O upstream pediu uma pausa: vale para todas as chamadas, não só esta (mesmo sem repetição)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if retry >= max_retries:
+                return None
+            self._stats["retries"] += 1
+        if retry_after is not None:
+            return retry_after
+        return min(self.backoff_max, self.backoff_base * 2 ** retry) * random.uniform(0.5, 1.0)
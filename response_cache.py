@@ -0,0 +1,186 @@
+"""
+Cache de respostas do Agente Médico Vizeval
+Memória (LRU) + disco (SQLite) endereçados pelo conteúdo do prompt
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def cache_key(system_prompt: str, user_prompt: str, config) -> str:
+    """Hash do prompt renderizado e dos parâmetros que influenciam a resposta"""
+    payload = json.dumps({
+        "system_prompt": system_prompt,
+        "user_prompt": user_prompt,
+        "model": config.model,
+        "temperature": config.temperature,
+        "max_tokens": config.max_tokens,
+        "evaluator": config.evaluator,
+        "threshold": config.threshold,
+        "max_retries": config.max_retries,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache em dois níveis para resultados de análise"""
+
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = 256,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600, max_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            path: Arquivo SQLite do nível em disco (None = apenas memória)
+            max_memory_entries: Entradas mantidas no LRU em memória
+            ttl_seconds: Validade de uma entrada (None = sem expiração)
+            max_disk_bytes: Tamanho máximo dos resultados armazenados em disco
+        """
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._purge_expired()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado armazenado para a chave, ou None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, size, created_at = row
+                    if not self._expired(created_at, now):
+                        self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, created_at, value)
+                        self._stats["disk_hits"] += 1
+                        return json.loads(value)
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_bytes -= size
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, result: Dict[str, Any]):
+        """Armazena um resultado nos dois níveis"""
+        value = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            self._stats["stores"] += 1
+
+            if self._db is not None:
+                size = len(value.encode("utf-8"))
+                previous = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._disk_bytes += size - (previous[0] if previous else 0)
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._evict_disk()
+                self._db.commit()
+
+    def invalidate(self, key: str):
+        """Remove uma entrada dos dois níveis"""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_bytes -= row[0]
+
+    def clear(self):
+        """Esvazia o cache"""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de acerto/erro e ocupação"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        """Fecha o arquivo SQLite"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: str):
+        """Insere no LRU em memória, descartando a entrada menos usada"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _purge_expired(self):
+        if self.ttl_seconds is not None:
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+
+    def _evict_disk(self):
+        """Remove entradas vencidas e depois as menos acessadas até caber no limite"""
+        self._purge_expired()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._stats["evictions"] += len(evicted)
@@ -0,0 +1,343 @@
+"""
+Índice local de recuperação (BM25) sobre os documentos do paciente
+Trechos indexados em SQLite de forma incremental; o prompt recebe só os trechos relevantes dentro de um orçamento
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from documents import CHUNK_SIZE, PatientDocument
+from prompt_builder import count_tokens
+
+# Tamanho alvo de um trecho indexado (~200 tokens)
+PASSAGE_CHARS = 800
+
+# Trechos gravados por transação: o lock do índice fica livre entre um lote e outro
+INDEX_BATCH = 256
+
+# Reserva de indexação sem renovação há mais que isso (processo interrompido) pode ser retomada
+STALE_CLAIM = 600.0
+
+# Intervalo entre consultas a uma reserva de outro processo
+CLAIM_POLL = 0.2
+
+# Palavras sem valor de busca (comparadas já sem acentos)
+STOPWORDS = frozenset("""
+a o e as os de da do das dos em no na nos nas um uma uns umas para por pela pelo pelas pelos com sem
+que se ao aos ou ha nao mais menos muito ja como sua seu suas seus ele ela eles elas foi ser esta este
+isso essa esse entre sobre ate apos desde the and of
+""".split())
+
+
+def terms(text: str) -> List[str]:
+    """Termos de busca: minúsculas, sem acentos, sem stopwords e sem termos de uma letra"""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    ascii_text = "".join(c for c in normalized if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]+", ascii_text) if len(t) > 1 and t not in STOPWORDS]
+
+
+def iter_passages(blocks: Iterable[str], max_chars: int = PASSAGE_CHARS) -> Iterator[str]:
+    """Divide um texto lido em blocos em trechos de até `max_chars`
+
+    O corte acontece na última quebra de parágrafo, de linha, de frase ou espaço da segunda
+    metade da janela, para que os trechos não partam palavras nem frases quando possível.
+    """
+    carry = ""
+    for block in blocks:
+        carry += block
+        while len(carry) >= max_chars:
+            window = carry[:max_chars]
+            cut = -1
+            for separator in ("\n\n", "\n", ". ", " "):
+                position = window.rfind(separator, max_chars // 2)
+                if position != -1:
+                    cut = position + len(separator)
+                    break
+            if cut == -1:
+                cut = max_chars
+            passage = carry[:cut].strip()
+            if passage:
+                yield passage
+            carry = carry[cut:]
+    if carry.strip():
+        yield carry.strip()
+
+
+def _read_blocks(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                return
+            yield block
+
+
+class _ClaimLost(Exception):
+    """A reserva de indexação expirou e foi assumida por outro processo"""
+
+
+@dataclass(frozen=True)
+class Passage:
+    """Trecho recuperado de um documento"""
+    document: str
+    position: int
+    text: str
+    score: float
+    tokens: int
+
+    @property
+    def title(self) -> str:
+        return f"{self.document} · trecho {self.position + 1}"
+
+
+class RetrievalIndex:
+    """Índice BM25 persistente dos trechos dos documentos
+
+    Documentos são identificados pelo SHA-256 do conteúdo: indexar de novo um documento já
+    presente não faz nada, então o índice cresce apenas com conteúdo novo. Um documento novo é
+    gravado em lotes de INDEX_BATCH trechos, cada um em sua transação, para que buscas de outros
+    casos não esperem a indexação inteira. As buscas consideram só os documentos do caso, e as
+    estatísticas do BM25 (frequência dos termos e tamanho médio dos trechos) são calculadas
+    sobre esses documentos.
+    """
+
+    def __init__(self, path: Optional[str] = ".cache/retrieval.sqlite3", k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            path: Arquivo SQLite do índice (None = apenas memória)
+            k1: Saturação da frequência do termo no trecho
+            b: Normalização pelo tamanho do trecho
+        """
+        self.k1 = k1
+        self.b = b
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                passages INTEGER NOT NULL,
+                claimed_at REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS passages_doc ON passages (doc_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                passage_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS postings_term ON postings (term, passage_id);
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(documents)")}
+        if "claimed_at" not in columns:
+            # Índice de uma versão anterior: todos os documentos gravados estão completos
+            self._db.execute("ALTER TABLE documents ADD COLUMN claimed_at REAL NOT NULL DEFAULT 0")
+            self._db.commit()
+        self._lock = threading.Lock()
+        # passages < 0: indexação em andamento (ou interrompida)
+        self._indexed: Set[str] = {row[0] for row in self._db.execute(
+            "SELECT doc_id FROM documents WHERE passages >= 0")}
+        self._indexing: Dict[str, threading.Event] = {}
+
+    def add(self, documents: Iterable[PatientDocument]) -> int:
+        """Indexa os documentos ainda ausentes; retorna quantos foram indexados
+
+        Se outra thread ou outro processo já está indexando o mesmo documento, espera a indexação
+        terminar (ou a reserva expirar, quando assume a indexação).
+        """
+        added = 0
+        for document in documents:
+            while True:
+                claim = self._acquire(document)
+                if claim is None:
+                    break
+                try:
+                    count, claim = self._index(document, claim)
+                    with self._lock, self._db:
+                        self._refresh_claim(document.sha256, claim, passages=count)
+                        self._indexed.add(document.sha256)
+                    added += 1
+                    break
+                except _ClaimLost:
+                    # Reserva assumida por outro processo após STALE_CLAIM: esperar a indexação dele
+                    continue
+                except BaseException:
+                    with self._lock, self._db:
+                        self._discard(document.sha256)
+                    raise
+                finally:
+                    with self._lock:
+                        self._indexing.pop(document.sha256).set()
+        return added
+
+    def search(self, query: str, documents: Sequence[PatientDocument], k: int = 6,
+               max_tokens: int = 1000, model: str = "gpt-4") -> List[Passage]:
+        """Até `k` trechos mais relevantes para `query` cujo total cabe em `max_tokens`
+
+        Os trechos escolhidos voltam na ordem em que aparecem nos documentos.
+        """
+        names = {d.sha256: d.name for d in documents}
+        query_terms = list(dict.fromkeys(terms(query)))
+        if not names or not query_terms:
+            return []
+
+        doc_marks = ",".join("?" * len(names))
+        term_marks = ",".join("?" * len(query_terms))
+        with self._lock:
+            total, length_sum = self._db.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM passages WHERE doc_id IN ({doc_marks})",
+                list(names)).fetchone()
+            rows = self._db.execute(
+                f"""SELECT p.passage_id, p.term, p.tf, s.length FROM postings p
+                    JOIN passages s ON s.id = p.passage_id
+                    WHERE p.term IN ({term_marks}) AND s.doc_id IN ({doc_marks})""",
+                query_terms + list(names)).fetchall()
+        if not rows:
+            return []
+
+        document_frequency = Counter(term for _, term, _, _ in rows)
+        average_length = length_sum / total
+        scores: Dict[int, float] = {}
+        for passage_id, term, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[passage_id] = scores.get(passage_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        chosen: List[Passage] = []
+        remaining = max_tokens
+        with self._lock:
+            for passage_id in ranked:
+                if len(chosen) >= k:
+                    break
+                doc_id, position, text = self._db.execute(
+                    "SELECT doc_id, position, text FROM passages WHERE id = ?", (passage_id,)).fetchone()
+                tokens = count_tokens(text, model)
+                if tokens > remaining:
+                    continue
+                chosen.append(Passage(names[doc_id], position, text, scores[passage_id], tokens))
+                remaining -= tokens
+        order = {name: i for i, name in enumerate(names.values())}
+        return sorted(chosen, key=lambda p: (order[p.document], p.position))
+
+    def stats(self) -> Dict[str, int]:
+        """Documentos e trechos indexados"""
+        with self._lock:
+            documents, passages = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(passages), 0) FROM documents WHERE passages >= 0").fetchone()
+        return {"documents": documents, "passages": passages}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _acquire(self, document: PatientDocument) -> Optional[float]:
+        """Espera o documento estar indexado (None) ou reserva a indexação para o chamador
+
+        Retorna o instante da reserva, que identifica o dono da indexação nas gravações seguintes.
+        """
+        while True:
+            with self._lock:
+                if document.sha256 in self._indexed:
+                    return None
+                pending = self._indexing.get(document.sha256)
+                if pending is None:
+                    indexed, claim = self._claim(document)
+                    if indexed:
+                        self._indexed.add(document.sha256)
+                        return None
+                    if claim is not None:
+                        self._indexing[document.sha256] = threading.Event()
+                        return claim
+            # Outra thread (evento) ou outro processo (reserva ainda válida) está indexando
+            if pending is not None:
+                pending.wait()
+            else:
+                time.sleep(CLAIM_POLL)
+
+    def _claim(self, document: PatientDocument) -> Tuple[bool, Optional[float]]:
+        """(se o documento já está indexado, instante da reserva obtida) - com o lock
+
+        A linha do documento é a reserva: o primeiro processo a gravá-la indexa o conteúdo e a
+        renova a cada lote. Uma reserva sem renovação há mais de STALE_CLAIM segundos é de um
+        processo interrompido e passa para quem a encontrar, descartando os trechos parciais.
+        """
+        now = time.time()
+        with self._db:
+            if self._db.execute("INSERT OR IGNORE INTO documents (doc_id, name, passages, claimed_at) "
+                                "VALUES (?, ?, -1, ?)", (document.sha256, document.name, now)).rowcount:
+                return False, now
+            passages, claimed_at = self._db.execute("SELECT passages, claimed_at FROM documents WHERE doc_id = ?",
+                                                    (document.sha256,)).fetchone()
+            if passages >= 0:
+                return True, None
+            if now - claimed_at < STALE_CLAIM:
+                return False, None
+            self._discard(document.sha256)
+            self._db.execute("INSERT INTO documents (doc_id, name, passages, claimed_at) VALUES (?, ?, -1, ?)",
+                             (document.sha256, document.name, now))
+            return False, now
+
+    def _refresh_claim(self, doc_id: str, claim: float, passages: int = -1) -> float:
+        """Renova a reserva (com o lock, dentro de uma transação); _ClaimLost se ela foi assumida por outro"""
+        now = max(time.time(), claim + 1e-6)
+        if not self._db.execute("UPDATE documents SET claimed_at = ?, passages = ? WHERE doc_id = ? AND claimed_at = ?",
+                                (now, passages, doc_id, claim)).rowcount:
+            raise _ClaimLost(doc_id)
+        return now
+
+    def _discard(self, doc_id: str):
+        """Remove o documento e os trechos já gravados (com o lock, dentro de uma transação)"""
+        self._db.execute("DELETE FROM postings WHERE passage_id IN (SELECT id FROM passages WHERE doc_id = ?)",
+                         (doc_id,))
+        self._db.execute("DELETE FROM passages WHERE doc_id = ?", (doc_id,))
+        self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def _index(self, document: PatientDocument, claim: float) -> Tuple[int, float]:
+        """Grava os trechos e as listas invertidas de um documento (lido em blocos) em lotes
+
+        Retorna a quantidade de trechos e a reserva renovada pelo último lote.
+        """
+        count = 0
+        batch = []
+        for position, text in enumerate(iter_passages(_read_blocks(document.text_path))):
+            # Termos calculados fora do lock; só a gravação do lote o segura
+            batch.append((position, text, Counter(terms(text))))
+            count += 1
+            if len(batch) >= INDEX_BATCH:
+                claim = self._write_batch(document.sha256, claim, batch)
+                batch = []
+        if batch:
+            claim = self._write_batch(document.sha256, claim, batch)
+        return count, claim
+
+    def _write_batch(self, doc_id: str, claim: float, batch: List[Tuple[int, str, Counter]]) -> float:
+        """Grava um lote renovando a reserva na mesma transação; retorna a reserva renovada"""
+        with self._lock, self._db:
+            claim = self._refresh_claim(doc_id, claim)
+            for position, text, passage_terms in batch:
+                cursor = self._db.execute(
+                    "INSERT INTO passages (doc_id, position, text, length) VALUES (?, ?, ?, ?)",
+                    (doc_id, position, text, sum(passage_terms.values())))
+                self._db.executemany("INSERT INTO postings (term, passage_id, tf) VALUES (?, ?, ?)",
+                                     [(term, cursor.lastrowid, tf) for term, tf in passage_terms.items()])
+        return claim
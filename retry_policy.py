@@ -0,0 +1,206 @@
+"""
+Políticas de retry do ciclo gerar → avaliar
+Parada antecipada pelo ganho de score esperado de mais uma tentativa (aprendido por complexidade) e orçamento global de retries
+"""
+
+import os
+import random
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from attempt_log import AttemptLog
+
+# Ganho estimado abaixo do qual não vale outra tentativa
+MIN_GAIN = 0.02
+
+# Retries permitidos por análise iniciada (0.2 = no máximo 20% de chamadas extras)
+RETRY_BUDGET = 0.2
+
+
+class RetryPolicy:
+    """Decide se uma análise reprovada ganha outra tentativa
+
+    A política padrão repete até esgotar max_retries (comportamento sem política). Uma mesma
+    instância pode ser compartilhada por vários agentes e threads.
+    """
+
+    def begin(self, level: str):
+        """Uma análise começou (primeira tentativa)"""
+
+    def allow_retry(self, level: str, attempt: int, best_score: Optional[float], threshold: float,
+                    calls: int = 1) -> Tuple[bool, Optional[str]]:
+        """(se `calls` novas tentativas podem ser feitas após `attempt`, motivo da recusa)"""
+        return True, None
+
+    def observe(self, level: str, attempts):
+        """Histórico de tentativas de uma análise concluída (attempt_history)"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class RetryBudget:
+    """Orçamento de retries proporcional às análises iniciadas (estilo token bucket)
+
+    Cada análise iniciada deposita `ratio` de crédito, até `max_credit`; cada retry consome 1.
+    Com o saldo zerado, os retries são recusados até novas análises repororem o crédito, então
+    a fração de chamadas extras fica limitada a `ratio` qualquer que seja a carga.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET, max_credit: float = 10.0):
+        if ratio < 0:
+            raise ValueError("ratio deve ser maior ou igual a 0")
+        self.ratio = ratio
+        self.max_credit = max_credit
+        # Começa cheio: as primeiras análises do processo não ficam sem retries
+        self.credit = max_credit
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.credit = min(self.max_credit, self.credit + self.ratio)
+
+    def withdraw(self, calls: int = 1) -> bool:
+        with self._lock:
+            if self.credit < calls:
+                return False
+            self.credit -= calls
+            return True
+
+
+class LearnedRetryPolicy(RetryPolicy):
+    """Para cedo quando outra tentativa raramente melhora o score e limita os retries da frota
+
+    Para cada nível de complexidade e número de tentativa k, acompanha o ganho médio da melhor
+    nota entre as tentativas k e k + 1 nas análises concluídas (só existe tentativa k + 1
+    quando a k foi reprovada, então é exatamente o ganho esperado de mais um retry). Com pelo
+    menos `min_samples` observações e ganho médio abaixo de `min_gain`, o retry é recusado;
+    uma fração `explore` dos retries recusados passa mesmo assim para a estimativa continuar
+    sendo atualizada. Os retries permitidos ainda consomem o orçamento global.
+
+    Análises com candidatos especulativos (mais de uma tentativa na mesma rodada) não são
+    observadas: a diferença entre candidatos paralelos é variância de amostragem, não ganho
+    de um retry, e quebraria a premissa acima.
+    """
+
+    def __init__(self, min_gain: float = MIN_GAIN, min_samples: int = 30, budget: Optional[RetryBudget] = None,
+                 explore: float = 0.05, window: int = 1000):
+        """
+        Args:
+            min_gain: Ganho médio de score abaixo do qual o retry é recusado
+            min_samples: Observações de um (nível, tentativa) antes de recusar por ganho
+            budget: Orçamento global de retries (None = sem orçamento)
+            explore: Fração dos retries recusados por ganho que é feita mesmo assim
+            window: Observações por (nível, tentativa) após as quais as antigas passam a pesar metade
+        """
+        self.min_gain = min_gain
+        self.min_samples = min_samples
+        self.budget = budget
+        self.explore = explore
+        self.window = window
+        # (nível, tentativa) -> [observações, soma dos ganhos]
+        self._gains: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+        self._stats = {"retries": 0, "stopped_gain": 0, "stopped_budget": 0, "explored": 0}
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "LearnedRetryPolicy":
+        """Política com VIZEVAL_RETRY_MIN_GAIN e VIZEVAL_RETRY_BUDGET (orçamento vazio = sem orçamento)"""
+        budget = os.getenv("VIZEVAL_RETRY_BUDGET", str(RETRY_BUDGET))
+        return cls(min_gain=float(os.getenv("VIZEVAL_RETRY_MIN_GAIN", str(MIN_GAIN))),
+                   budget=RetryBudget(float(budget)) if budget else None, **kwargs)
+
+    def expected_gain(self, level: str, attempt: int) -> Optional[float]:
+        """Ganho médio da melhor nota com a tentativa `attempt` + 1 (None = poucas observações)"""
+        with self._lock:
+            count, total = self._gains.get((level, attempt), (0, 0.0))
+        return total / count if count >= self.min_samples else None
+
+    def begin(self, level: str):
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def allow_retry(self, level: str, attempt: int, best_score: Optional[float], threshold: float,
+                    calls: int = 1) -> Tuple[bool, Optional[str]]:
+        gain = self.expected_gain(level, attempt)
+        if gain is not None and gain < self.min_gain:
+            if random.random() >= self.explore:
+                self._count("stopped_gain")
+                return False, "gain"
+            self._count("explored")
+        if self.budget is not None and not self.budget.withdraw(calls):
+            self._count("stopped_budget")
+            return False, "budget"
+        self._count("retries", calls)
+        return True, None
+
+    def observe(self, level: str, attempts):
+        rounds = Counter(entry.get("round", entry["attempt"]) for entry in attempts)
+        if any(count > 1 for count in rounds.values()):
+            return
+        best = None
+        gains = []
+        for entry in sorted(attempts, key=lambda a: a["attempt"]):
+            score = entry.get("score")
+            if best is not None and score is not None:
+                gains.append((entry["attempt"] - 1, max(0.0, score - best)))
+            if score is not None:
+                best = score if best is None else max(best, score)
+        with self._lock:
+            for attempt, gain in gains:
+                self._add(level, attempt, 1, gain)
+
+    def warm_start(self, log: AttemptLog, limit: int = 100_000) -> int:
+        """Estimativas iniciais a partir das `limit` análises mais recentes de um AttemptLog
+
+        O ganho de cada tentativa é calculado no próprio SQLite (funções de janela), sem
+        carregar as tentativas no processo; análises especulativas ficam de fora, como em
+        observe(). Retorna quantas observações foram somadas.
+        """
+        rows = log.query("""
+            SELECT complexity, attempt - 1, COUNT(gain), COALESCE(SUM(gain), 0) FROM (
+                SELECT a.complexity, t.attempt,
+                       -- Tentativa sem nota (não avaliada) não é observação de ganho, como em observe()
+                       CASE WHEN t.score IS NOT NULL
+                            THEN MAX(t.score) OVER running - MAX(t.score) OVER previous END AS gain
+                FROM attempts t JOIN analyses a ON a.id = t.analysis_id
+                WHERE t.analysis_id > (SELECT COALESCE(MAX(id), 0) FROM analyses) - ?
+                  AND t.analysis_id NOT IN (
+                      SELECT analysis_id FROM attempts GROUP BY analysis_id
+                      HAVING COUNT(DISTINCT COALESCE(round, attempt)) < COUNT(*))
+                WINDOW running AS (PARTITION BY t.analysis_id ORDER BY t.attempt),
+                       previous AS (PARTITION BY t.analysis_id ORDER BY t.attempt
+                                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+            ) GROUP BY complexity, attempt
+        """, (limit,))
+        observations = 0
+        with self._lock:
+            for level, attempt, count, total in rows:
+                if count:
+                    self._add(level, attempt, count, total)
+                    observations += count
+        return observations
+
+    def stats(self) -> Dict[str, Any]:
+        """Retries feitos e recusados (por ganho e por orçamento), crédito do orçamento e ganhos estimados"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["expected_gain"] = {f"{level}:{attempt}": round(total / count, 4)
+                                      for (level, attempt), (count, total) in sorted(self._gains.items()) if count}
+        if self.budget is not None:
+            stats["budget_credit"] = round(self.budget.credit, 2)
+        return stats
+
+    def _add(self, level: str, attempt: int, count: int, total: float):
+        entry = self._gains.setdefault((level, attempt), [0, 0.0])
+        entry[0] += count
+        entry[1] += total
+        if entry[0] > self.window:
+            # Decaimento: observações antigas perdem peso e a estimativa acompanha mudanças de modelo/prompt
+            entry[0] /= 2
+            entry[1] /= 2
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
@@ -0,0 +1,369 @@
+"""
+Batch distribuído em vários processos (e máquinas com sistema de arquivos compartilhado)
+Casos particionados por hash do patient_id, fila de shards com leases em SQLite e merge determinístico
+
+Uso:
+    python sharded_batch.py run --input corpus/ --output resultados.jsonl --workers 8
+    python sharded_batch.py worker --work-dir resultados.jsonl.shards --workers 8   # em outra máquina
+    python sharded_batch.py status --work-dir resultados.jsonl.shards
+    python sharded_batch.py merge --work-dir resultados.jsonl.shards --output resultados.jsonl
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from medical_agent import MedicalCase
+
+# Shards por execução: unidades de trabalho pequenas o bastante para balancear os workers
+DEFAULT_SHARDS = 64
+
+# Duração de um lease; o dono o renova a cada terço desse tempo
+LEASE_S = 60.0
+
+# Claims de um mesmo shard antes de marcá-lo como falho (worker morrendo sempre no mesmo caso)
+MAX_CLAIMS = 3
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+def shard_of(patient_id: str, shards: int) -> int:
+    """Shard estável do paciente (o hash embutido do Python muda a cada processo)"""
+    digest = hashlib.blake2b(str(patient_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def _shard_path(work_dir: str, shard: int, kind: str) -> str:
+    return os.path.join(work_dir, f"shard-{shard:05d}.{kind}.jsonl")
+
+
+def _line_index(line: str) -> int:
+    # Linhas gravadas por finalize começam sempre com {"index": N, ...
+    return int(line[10:line.index(",", 10)])
+
+
+@dataclass
+class Lease:
+    """Posse temporária de um shard"""
+    shard: int
+    token: str
+
+
+class ShardQueue:
+    """Fila de shards em SQLite com leases
+
+    Um worker reivindica um shard pendente (ou cujo lease expirou: o dono anterior morreu) e
+    renova o lease enquanto processa. Renovação e conclusão só valem com o token do claim, então
+    um worker que perdeu o lease não marca como concluído o trabalho que outro assumiu.
+    """
+
+    def __init__(self, path: str, lease_s: float = LEASE_S, max_claims: int = MAX_CLAIMS):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_claims = max_claims
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS shards (
+                    shard INTEGER PRIMARY KEY,
+                    cases INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    owner TEXT,
+                    token TEXT,
+                    lease_until REAL,
+                    claims INTEGER NOT NULL DEFAULT 0,
+                    processed INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0
+                );
+            """)
+
+    def meta(self) -> Dict[str, Any]:
+        with self._connect() as db:
+            return {key: json.loads(value) for key, value in db.execute("SELECT key, value FROM meta")}
+
+    def claim(self, owner: str) -> Optional[Lease]:
+        """Próximo shard livre (pendente ou com lease expirado), ou None"""
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            while True:
+                row = db.execute("SELECT shard, state, claims FROM shards WHERE state = ? OR (state = ? AND lease_until < ?) "
+                                 "ORDER BY shard LIMIT 1", (PENDING, LEASED, now)).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                shard, state, claims = row
+                if claims >= self.max_claims:
+                    db.execute("UPDATE shards SET state = ?, owner = NULL, token = NULL WHERE shard = ?", (FAILED, shard))
+                    continue
+                token = uuid.uuid4().hex
+                db.execute("UPDATE shards SET state = ?, owner = ?, token = ?, lease_until = ?, claims = claims + 1 "
+                           "WHERE shard = ?", (LEASED, owner, token, now + self.lease_s, shard))
+                db.execute("COMMIT")
+                return Lease(shard, token)
+        except Exception:
+            # BEGIN IMMEDIATE também pode falhar (fila bloqueada): aí não há transação para desfazer
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def renew(self, lease: Lease) -> bool:
+        """Estende o lease; False se o shard já foi reivindicado por outro worker"""
+        with self._connect() as db:
+            return db.execute("UPDATE shards SET lease_until = ? WHERE shard = ? AND token = ? AND state = ?",
+                              (time.time() + self.lease_s, lease.shard, lease.token, LEASED)).rowcount == 1
+
+    def complete(self, lease: Lease, stats: Dict[str, int]) -> bool:
+        with self._connect() as db:
+            return db.execute("UPDATE shards SET state = ?, lease_until = NULL, processed = ?, errors = ? "
+                              "WHERE shard = ? AND token = ? AND state = ?",
+                              (DONE, stats["processed"], stats["errors"], lease.shard, lease.token, LEASED)).rowcount == 1
+
+    def status(self) -> Dict[str, Any]:
+        """Shards e casos por estado, e totais de processados e erros"""
+        with self._connect() as db:
+            rows = db.execute("SELECT state, COUNT(*), COALESCE(SUM(cases), 0), COALESCE(SUM(processed), 0), "
+                              "COALESCE(SUM(errors), 0) FROM shards GROUP BY state").fetchall()
+        status = {"shards": {}, "cases": {}, "processed": 0, "errors": 0}
+        for state, shards, cases, processed, errors in rows:
+            status["shards"][state] = shards
+            status["cases"][state] = cases
+            status["processed"] += processed
+            status["errors"] += errors
+        return status
+
+    def finished(self) -> bool:
+        """Nenhum shard pendente ou em andamento"""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM shards WHERE state IN (?, ?)", (PENDING, LEASED)).fetchone()[0] == 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+
+def prepare(input_path: str, work_dir: str, shards: int = DEFAULT_SHARDS, **queue_kwargs) -> ShardQueue:
+    """Particiona a entrada em arquivos por shard e cria a fila (só na primeira chamada para `work_dir`)
+
+    Cada linha de um shard guarda o registro e o `index` do caso na entrada completa. Chamadas
+    seguintes (retomada, outras máquinas) reutilizam a partição existente.
+    """
+    from batch import read_cases
+
+    os.makedirs(work_dir, exist_ok=True)
+    queue = ShardQueue(os.path.join(work_dir, "queue.sqlite3"), **queue_kwargs)
+    db = queue._connect()
+    try:
+        # Transação exclusiva: só um processo particiona; os demais esperam e reutilizam
+        db.execute("BEGIN IMMEDIATE")
+        if db.execute("SELECT 1 FROM meta WHERE key = 'shards'").fetchone():
+            db.execute("COMMIT")
+            return queue
+
+        counts = [0] * shards
+        files = [open(_shard_path(work_dir, shard, "input"), "w", encoding="utf-8") for shard in range(shards)]
+        try:
+            for index, record in read_cases(input_path):
+                if isinstance(record, MedicalCase):
+                    record = asdict(record)
+                shard = shard_of(record.get("patient_id", index), shards)
+                files[shard].write(json.dumps({**record, "index": index}, ensure_ascii=False) + "\n")
+                counts[shard] += 1
+        finally:
+            for f in files:
+                f.close()
+
+        db.executemany("INSERT INTO shards (shard, cases, state) VALUES (?, ?, ?)",
+                       [(shard, count, DONE if count == 0 else PENDING) for shard, count in enumerate(counts)])
+        db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                       [("shards", json.dumps(shards)), ("input", json.dumps(os.path.abspath(input_path))),
+                        ("cases", json.dumps(sum(counts)))])
+        db.execute("COMMIT")
+    except Exception:
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+        raise
+    finally:
+        db.close()
+    return queue
+
+
+def finalize(work_dir: str, shard: int):
+    """Reescreve a saída do shard em ordem de `index` global, sem duplicatas
+
+    Resultados de um shard retomado após queda podem aparecer duas vezes; vale a primeira linha.
+    """
+    with open(_shard_path(work_dir, shard, "input"), encoding="utf-8") as f:
+        indices = [json.loads(line)["index"] for line in f]
+    results: Dict[int, Dict[str, Any]] = {}
+    with open(_shard_path(work_dir, shard, "output"), encoding="utf-8") as f:
+        for line in f:
+            result = json.loads(line)
+            results.setdefault(indices[result.pop("index")], result)
+
+    target = _shard_path(work_dir, shard, "sorted")
+    with open(f"{target}.tmp", "w", encoding="utf-8") as out:
+        for index in sorted(results):
+            out.write(json.dumps({"index": index, **results[index]}, ensure_ascii=False) + "\n")
+    os.replace(f"{target}.tmp", target)
+
+
+def merge(work_dir: str, output_path: str) -> int:
+    """Junta as saídas ordenadas dos shards em um único arquivo, em ordem de `index` (streaming)"""
+    queue = ShardQueue(os.path.join(work_dir, "queue.sqlite3"))
+    status = queue.status()
+    if status["shards"].get(FAILED) or not queue.finished():
+        raise RuntimeError(f"Shards não concluídos: {status['shards']}")
+
+    paths = [_shard_path(work_dir, shard, "sorted") for shard in range(queue.meta()["shards"])]
+    files = [open(path, encoding="utf-8") for path in paths if os.path.exists(path)]
+    count = 0
+    try:
+        with open(f"{output_path}.tmp", "w", encoding="utf-8") as out:
+            for line in heapq.merge(*files, key=_line_index):
+                out.write(line)
+                count += 1
+        os.replace(f"{output_path}.tmp", output_path)
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+
+def work(work_dir: str, max_concurrency: int = 8, quota_share: float = 1.0, routing_path: Optional[str] = None,
+         refresh: bool = False, poll_s: float = 2.0) -> Dict[str, int]:
+    """Loop de um worker: reivindica shards até a fila terminar
+
+    Enquanto houver shards com lease de outros workers, continua consultando a fila: se um deles
+    morrer, o lease expira e o shard é retomado aqui a partir do checkpoint do batch.
+    """
+    from dotenv import load_dotenv
+
+    import medical_agent
+    from batch import run_batch
+
+    load_dotenv()
+    # Vários workers no mesmo terminal: sem a saída rich de cada análise
+    medical_agent.console.quiet = True
+    queue = ShardQueue(os.path.join(work_dir, "queue.sqlite3"))
+    agent = medical_agent.agent_from_env(routing_path, quota_share)
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    totals = {"shards": 0, "processed": 0, "errors": 0}
+    try:
+        while True:
+            lease = queue.claim(owner)
+            if lease is None:
+                if queue.finished():
+                    return totals
+                time.sleep(poll_s)
+                continue
+
+            stop = threading.Event()
+            lost = threading.Event()
+
+            def heartbeat():
+                while not stop.wait(queue.lease_s / 3):
+                    try:
+                        renewed = queue.renew(lease)
+                    except sqlite3.Error:
+                        # Sem renovar, o lease pode expirar e outro worker assumir: parar por segurança
+                        renewed = False
+                    if not renewed:
+                        lost.set()
+                        return
+
+            renewer = threading.Thread(target=heartbeat, daemon=True, name="shard-lease")
+            renewer.start()
+            try:
+                stats = run_batch(agent, _shard_path(work_dir, lease.shard, "input"),
+                                  _shard_path(work_dir, lease.shard, "output"), max_concurrency=max_concurrency,
+                                  refresh=refresh, should_stop=lost.is_set)
+            finally:
+                stop.set()
+                renewer.join()
+            if lost.is_set():
+                # Lease perdido: o batch parou de gravar e o novo dono retoma e finaliza o shard
+                continue
+            finalize(work_dir, lease.shard)
+            if queue.complete(lease, stats):
+                totals["shards"] += 1
+                totals["processed"] += stats["processed"]
+                totals["errors"] += stats["errors"]
+    finally:
+        agent.close()
+
+
+def run_workers(work_dir: str, workers: int, max_concurrency: int = 8, **kwargs) -> List[int]:
+    """Inicia `workers` processos locais e espera todos terminarem; retorna os exit codes
+
+    As cotas OPENAI_*/VIZEVAL_* da máquina são divididas igualmente entre os workers.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=work, args=(work_dir, max_concurrency, 1 / workers), kwargs=kwargs,
+                                 name=f"shard-worker-{i}") for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Batch distribuído do Agente Médico Vizeval")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Particionar, processar com workers locais e juntar")
+    run.add_argument("--input", required=True, help="Arquivo .jsonl/.csv ou diretório de um CaseStore")
+    run.add_argument("--output", required=True, help="Arquivo JSONL final (ordem da entrada)")
+    run.add_argument("--work-dir", help="Diretório dos shards e da fila (padrão: <output>.shards)")
+    run.add_argument("--shards", type=int, default=DEFAULT_SHARDS)
+
+    worker = commands.add_parser("worker", help="Processar shards de uma execução já particionada")
+    worker.add_argument("--work-dir", required=True)
+
+    for command in (run, worker):
+        command.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processos locais")
+        command.add_argument("--concurrency", type=int, default=8, help="Análises simultâneas por processo")
+        command.add_argument("--routing", help="Arquivo JSON com a política de roteamento por complexidade")
+        command.add_argument("--refresh", action="store_true", help="Ignorar o cache de análises")
+
+    status = commands.add_parser("status", help="Progresso da fila")
+    status.add_argument("--work-dir", required=True)
+
+    merge_command = commands.add_parser("merge", help="Juntar as saídas dos shards concluídos")
+    merge_command.add_argument("--work-dir", required=True)
+    merge_command.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command in ("run", "worker"):
+        work_dir = args.work_dir or f"{args.output}.shards"
+        if args.command == "run":
+            prepare(args.input, work_dir, args.shards)
+        started = time.perf_counter()
+        run_workers(work_dir, args.workers, args.concurrency, routing_path=args.routing, refresh=args.refresh)
+        report = ShardQueue(os.path.join(work_dir, "queue.sqlite3")).status()
+        report["elapsed_s"] = round(time.perf_counter() - started, 2)
+        if args.command == "run":
+            report["merged"] = merge(work_dir, args.output)
+    elif args.command == "status":
+        report = ShardQueue(os.path.join(args.work_dir, "queue.sqlite3")).status()
+    else:
+        report = {"merged": merge(args.work_dir, args.output)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
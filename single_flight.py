@@ -0,0 +1,126 @@
+"""
+Coalescência de análises idênticas em andamento (single-flight)
+Chamadas concorrentes com a mesma chave de conteúdo aguardam uma única execução e recebem o mesmo resultado
+"""
+
+import asyncio
+import copy
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _LeaderCancelled(Exception):
+    """O líder de uma execução assíncrona foi cancelado: os seguidores devem tentar de novo"""
+
+
+class Flight:
+    """Uma execução em andamento, aguardada por todas as chamadas com a mesma chave"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def wait(self) -> Any:
+        """Bloqueia até o fim da execução; cada chamada recebe sua própria cópia do resultado"""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return copy.deepcopy(self._result)
+
+
+class SingleFlight:
+    """Registro das execuções em andamento por chave (thread-safe)
+
+    O primeiro chamador de uma chave executa (líder); os seguintes se anexam à execução e
+    são contados em `coalesced`. A chave é liberada ao fim: chamadas posteriores executam
+    de novo (ou encontram o resultado no cache de respostas).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._coalesced = 0
+
+    def begin(self, key: str) -> Tuple[Flight, bool]:
+        """Execução da chave e se o chamador é o líder (deve executar e chamar finish)"""
+        with self._lock:
+            self._calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key: str, flight: Flight, result: Any = None, error: BaseException = None):
+        """Publica o resultado (ou o erro) do líder e libera a chave"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight._result, flight._error = result, error
+        flight._done.set()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Executa fn uma única vez por chave em andamento; retorna (resultado, coalescido)"""
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Versão assíncrona de do (execuções compartilhadas dentro do mesmo event loop)
+
+        Se o líder é cancelado, os seguidores não são: um deles assume e executa fn de novo.
+        """
+        with self._lock:
+            self._calls += 1
+        while True:
+            with self._lock:
+                future = self._async_flights.get(key)
+                leader = future is None
+                if leader:
+                    future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+                else:
+                    self._coalesced += 1
+            if not leader:
+                try:
+                    # shield: cancelar um seguidor não cancela a execução do líder
+                    return copy.deepcopy(await asyncio.shield(future)), True
+                except _LeaderCancelled:
+                    with self._lock:
+                        self._coalesced -= 1
+                    continue
+
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                future.set_exception(_LeaderCancelled())
+                future.exception()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # Evita o aviso de exceção não recuperada quando não há seguidores
+                future.exception()
+                raise
+            else:
+                future.set_result(result)
+                return result, False
+            finally:
+                with self._lock:
+                    if self._async_flights.get(key) is future:
+                        del self._async_flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Chamadas recebidas, chamadas coalescidas e execuções em andamento"""
+        with self._lock:
+            return {"calls": self._calls, "coalesced": self._coalesced,
+                    "in_flight": len(self._flights) + len(self._async_flights)}
@@ -3,10 +3,30 @@ Interface Web Interativa - Agente Médico Unimed
 Demo do Hackathon Adapta - Avaliação Inteligente com Vizeval
 """
 
+import time
+
+# Início desta execução do script (antes das importações pesadas): base das medidas de cold start e de rerun
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
 import os
 import json
+import hashlib
+import uuid
+from collections import deque
+from dataclasses import replace
+from functools import wraps
+from analytics import FleetAnalytics
+from attempt_log import AttemptLog
+from retry_policy import LearnedRetryPolicy
+from documents import DocumentError, DocumentIngestor, SUPPORTED_EXTENSIONS
+from history_store import SQLiteHistoryStore
+from jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
 from medical_agent import MedicalAgent, MedicalCase, create_sample_cases
+from profiling import Profiler
+from rate_limit import Upstream
+from response_cache import ResponseCache
+from retrieval import RetrievalIndex
 from dotenv import load_dotenv
 
 # Configuração da página
@@ -215,33 +235,269 @@ st.markdown("""
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Orçamentos de tempo da página: primeira execução do processo e reexecuções seguintes
+STARTUP_BUDGET_MS = float(os.getenv("VIZEVAL_STARTUP_BUDGET_MS", "2000"))
+RERUN_BUDGET_MS = float(os.getenv("VIZEVAL_RERUN_BUDGET_MS", "100"))
+
+# Ícone do card por tipo de documento
+DOCUMENT_ICONS = {".pdf": "📋", ".docx": "🏥", ".txt": "📝"}
+
+@st.cache_resource(show_spinner=False)
+def page_timings():
+    """Tempos da página no processo: cold start, reruns completas e trechos (fragments)"""
+    return {"cold_start_ms": None, "reruns": deque(maxlen=200), "fragments": {}}
+
+def timed(fn):
+    """Registra a duração de cada execução de um trecho da página (aplicado sob st.fragment)"""
+    @wraps(fn)
+    def run(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings = page_timings()
+            # Na primeira execução do processo o trecho paga a criação dos recursos: conta no cold start
+            if timings["cold_start_ms"] is not None:
+                samples = timings["fragments"].setdefault(fn.__name__, deque(maxlen=200))
+                samples.append((time.perf_counter() - started) * 1000)
+    return run
+
+def record_run():
+    """Registra a duração desta execução completa; a primeira do processo é o cold start"""
+    elapsed_ms = (time.perf_counter() - SCRIPT_STARTED) * 1000
+    timings = page_timings()
+    if timings["cold_start_ms"] is None:
+        timings["cold_start_ms"] = elapsed_ms
+    else:
+        timings["reruns"].append(elapsed_ms)
+
+def p95(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+def performance_panel():
+    """Tempos medidos da página comparados aos orçamentos"""
+    timings = page_timings()
+    rows = []
+    if timings["cold_start_ms"] is not None:
+        rows.append(("Cold start", timings["cold_start_ms"], timings["cold_start_ms"], 1, STARTUP_BUDGET_MS))
+    if timings["reruns"]:
+        rows.append(("Rerun completa", timings["reruns"][-1], p95(timings["reruns"]), len(timings["reruns"]),
+                     RERUN_BUDGET_MS))
+    for name, samples in list(timings["fragments"].items()):
+        if samples:
+            rows.append((f"Trecho {name}", samples[-1], p95(samples), len(samples), RERUN_BUDGET_MS))
+    
+    over = [row[0] for row in rows if row[2] > row[4]]
+    with st.expander("⏱️ Desempenho da Página" + (" ⚠️" if over else "")):
+        # Tabela em markdown: sem o custo de um dataframe a cada rerun
+        st.markdown("| Execução | Última | p95 | Orçamento |\n|---|---|---|---|\n" + "\n".join(
+            f"| {label} ({count}x) | {last:.0f} ms | {p95_ms:.0f} ms | {budget:.0f} ms |"
+            for label, last, p95_ms, count, budget in rows))
+        if over:
+            st.warning(f"Acima do orçamento: {', '.join(over)}")
+
+@st.cache_data(show_spinner=False)
+def sample_cases():
+    """Casos clínicos de exemplo, montados uma vez por processo"""
+    return create_sample_cases()
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+@st.cache_data(show_spinner=False)
+def document_cards(documents):
+    """HTML dos cards de documentos do paciente, um bloco por coluna
+
+    documents: tupla de (arquivo, tamanho em bytes, tamanho do texto extraído em bytes)
+    """
+    cards = [f"""
+    <div style="background: white; border: 1px solid #e8f5e8; border-radius: 10px; padding: 1rem; margin: 0.5rem 0; display: flex; align-items: center; gap: 1rem;">
+        <div style="padding: 0.8rem; font-size: 1.5rem;">{DOCUMENT_ICONS.get(os.path.splitext(name)[1].lower(), "📄")}</div>
+        <div>
+            <div style="font-weight: 500; color: #333;">{name}</div>
+            <div style="font-size: 0.8rem; color: #666;">{format_size(size)} • ✓ Processado ({format_size(text_size)} de texto)</div>
+        </div>
+    </div>
+    """ for name, size, text_size in documents]
+    middle = (len(cards) + 1) // 2
+    return "".join(cards[:middle]), "".join(cards[middle:])
+
 def init_session_state():
     """Inicializa o estado da sessão"""
     if 'agent' not in st.session_state:
         st.session_state.agent = None
-    if 'analysis_history' not in st.session_state:
-        st.session_state.analysis_history = []
+    if 'history_session' not in st.session_state:
+        # ID do histórico na URL: recarregar a página mantém o histórico persistido
+        if "historico" not in st.query_params:
+            st.query_params["historico"] = uuid.uuid4().hex[:12]
+        st.session_state.history_session = st.query_params["historico"]
+    if 'jobs' not in st.session_state:
+        # job_id → último estado conhecido do job enviado por esta sessão
+        st.session_state.jobs = {}
+    if 'documents' not in st.session_state:
+        # patient_id → documentos anexados nesta sessão; ids dos uploads já processados
+        st.session_state.documents = {}
+        st.session_state.processed_uploads = set()
 
-def create_agent():
-    """Cria o agente médico"""
+@st.cache_resource(show_spinner=False)
+def document_ingestor():
+    """Ingestão de documentos do processo: textos extraídos em cache no disco e pool de processos"""
+    return DocumentIngestor(os.getenv("VIZEVAL_DOCUMENTS_PATH", ".cache/documents"))
+
+@st.cache_resource(show_spinner=False)
+def retrieval_index():
+    """Índice BM25 dos trechos dos documentos (SQLite), consultado a cada análise com documentos"""
+    return RetrievalIndex(os.getenv("VIZEVAL_RETRIEVAL_PATH", ".cache/retrieval.sqlite3"))
+
+@st.cache_resource(show_spinner=False)
+def page_profiler():
+    """Profiler do processo: reruns da página e análises em segundo plano (ligado pela barra lateral)"""
+    return Profiler(os.getenv("VIZEVAL_PROFILE_PATH", ".cache/profiles"), enabled=False)
+
+@st.cache_resource(show_spinner=False)
+def shared_agent():
+    """Agente único do processo, compartilhado por todas as sessões
+    
+    MedicalAgent é thread-safe e mantém pools de conexões keep-alive com OpenAI e Vizeval;
+    threshold, retries e URL de cada sessão viajam no AnalysisConfig de cada análise.
+    """
     openai_key = os.getenv("OPENAI_API_KEY")
     vizeval_key = os.getenv("VIZEVAL_API_KEY")
     
     if not openai_key or not vizeval_key:
-        st.error("❌ Configure as variáveis OPENAI_API_KEY e VIZEVAL_API_KEY")
-        return None
-    
+        # Exceções não ficam em cache: a próxima tentativa relê o ambiente
+        raise ValueError("Configure as variáveis OPENAI_API_KEY e VIZEVAL_API_KEY")
+    
+    max_connections = int(os.getenv("VIZEVAL_MAX_CONNECTIONS", "64"))
+    # Tentativas registradas alimentam a estimativa de ganho da política de retry
+    attempt_log = AttemptLog(os.getenv("VIZEVAL_ATTEMPTS_PATH", ".cache/attempts.sqlite3"))
+    retry_policy = LearnedRetryPolicy.from_env()
+    retry_policy.warm_start(attempt_log)
+    return MedicalAgent(
+        openai_api_key=openai_key,
+        vizeval_api_key=vizeval_key,
+        vizeval_base_url=os.getenv("VIZEVAL_BASE_URL", "http://localhost:8000"),
+        cache=ResponseCache(os.getenv("VIZEVAL_CACHE_PATH", ".cache/analysis_cache.sqlite3")),
+        max_connections=max_connections,
+        openai_limiter=Upstream.from_env("openai", "OPENAI", max_concurrency=max_connections),
+        vizeval_limiter=Upstream.from_env("vizeval", "VIZEVAL", max_concurrency=max_connections),
+        analytics=FleetAnalytics(os.getenv("VIZEVAL_ANALYTICS_PATH", ".cache/fleet_analytics.sqlite3")),
+        attempt_log=attempt_log,
+        retry_policy=retry_policy,
+        documents=document_ingestor(),
+        retrieval=retrieval_index(),
+        profiler=page_profiler()
+    )
+
+def create_agent():
+    """Conecta a sessão ao agente compartilhado do processo"""
     try:
-        agent = MedicalAgent(
-            openai_api_key=openai_key,
-            vizeval_api_key=vizeval_key,
-            vizeval_base_url="http://localhost:8000"
-        )
-        return agent
+        return shared_agent()
     except Exception as e:
         st.error(f"❌ Erro ao criar agente: {str(e)}")
         return None
 
+@st.cache_resource(show_spinner=False)
+def history_store():
+    """Histórico de análises do processo (SQLite), limitado por sessão e no total, com sessões que expiram"""
+    max_total = os.getenv("VIZEVAL_HISTORY_MAX_TOTAL_ENTRIES")
+    return SQLiteHistoryStore(
+        os.getenv("VIZEVAL_HISTORY_PATH", ".cache/analysis_history.sqlite3"),
+        max_entries=int(os.getenv("VIZEVAL_HISTORY_MAX_ENTRIES", "500")),
+        session_ttl=float(os.getenv("VIZEVAL_HISTORY_SESSION_TTL_DAYS", "30")) * 24 * 3600,
+        max_total_entries=int(max_total) if max_total else None
+    )
+
+@st.cache_resource(show_spinner=False)
+def job_queue():
+    """Fila de análises do processo: workers em segundo plano usando o agente compartilhado"""
+    return JobQueue(shared_agent(), max_workers=int(os.getenv("VIZEVAL_JOB_WORKERS", "8")))
+
+@st.cache_data(ttl=10, show_spinner=False)
+def fleet_report():
+    """Relatório da frota (leitura no SQLite compartilhado), refeito no máximo a cada 10 s"""
+    analytics = shared_agent().analytics
+    analytics.flush()
+    return analytics.report()
+
+def session_config(agent, case, threshold, max_retries, vizeval_url):
+    """Configuração de uma análise da sessão (não altera o agente); modelo e tokens vêm do roteamento"""
+    routed = agent.config_for(case)
+    return replace(
+        routed,
+        threshold=threshold,
+        max_retries=max_retries,
+        base_url=vizeval_url,
+        metadata={**routed.metadata, "unimed_system": True, "streamlit_demo": True}
+    )
+
+# Jobs concluídos mantidos no painel da sessão (o resultado completo fica no histórico)
+MAX_FINISHED_JOBS = 10
+
+def refresh_jobs():
+    """Atualiza os jobs ativos da sessão; resultados concluídos vão para o histórico
+    
+    Um job concluído fica na sessão só como resumo (sem o resultado completo), e o painel guarda
+    os MAX_FINISHED_JOBS mais recentes. Retorna True se algum job terminou desde a última consulta.
+    """
+    finished = False
+    for job_id, job in list(st.session_state.jobs.items()):
+        if not job.active:
+            continue
+        current = job_queue().get(job_id)
+        if current is None:
+            # Processo reiniciado: o job se perdeu
+            current = replace(job, status=FAILED, error="Job perdido (servidor reiniciado)")
+        st.session_state.jobs[job_id] = current
+        if not current.active:
+            # Só análises concluídas entram no histórico: resultados de erro distorceriam os agregados
+            if current.status == DONE and current.result is not None:
+                history_store().add(st.session_state.history_session, current.result)
+            job_queue().forget(job_id)
+            st.session_state.jobs[job_id] = replace(current, result=None, text="")
+            finished = True
+    
+    finished_ids = [job_id for job_id, job in st.session_state.jobs.items() if not job.active]
+    for job_id in finished_ids[:-MAX_FINISHED_JOBS]:
+        del st.session_state.jobs[job_id]
+    return finished
+
+def jobs_panel():
+    """Progresso dos jobs da sessão; reexecutado sozinho enquanto houver jobs ativos"""
+    if refresh_jobs():
+        # Reexecução completa para atualizar as abas Resultados e Histórico
+        st.rerun()
+    
+    icons = {QUEUED: "🕒", RUNNING: "⏳", DONE: "✅", FAILED: "❌"}
+    labels = {QUEUED: "na fila", RUNNING: "em andamento", DONE: "concluída", FAILED: "falhou"}
+    for job in reversed(list(st.session_state.jobs.values())):
+        title = f"{icons[job.status]} {job.patient_id} · job {job.id} · {labels[job.status]} · {job.elapsed:.0f}s"
+        with st.expander(title, expanded=job.active):
+            if job.status == QUEUED:
+                st.caption("Aguardando um worker livre...")
+            elif job.status == DONE:
+                st.caption("Análise concluída - texto completo nas abas Resultados e Histórico")
+            elif job.text or job.active:
+                st.markdown(analysis_card(job.text or "🔍 Analisando caso com sistema Unimed..."), unsafe_allow_html=True)
+            if job.status_lines:
+                st.caption("  \n".join(job.status_lines))
+            if job.error:
+                st.error(f"❌ {job.error}")
+
+def analysis_card(text):
+    """HTML do card com o texto da análise médica"""
+    analysis_text = text.replace('\n', '<br>')
+    return f'''
+    <div class="info-card">
+        <h4>🏥 Diagnóstico Médico Unimed</h4>
+        <div style="white-space: pre-wrap; line-height: 1.6;">{analysis_text}</div>
+    </div>
+    '''
+
 def display_metrics(results):
     """Exibe métricas de qualidade em colunas"""
     if "error" not in results["quality_metrics"]:
@@ -250,12 +506,13 @@ def display_metrics(results):
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
+            final_score = f"{metrics['final_score']:.3f}" if metrics['final_score'] is not None else "Não avaliada"
             delta_text = "Aprovado" if metrics['passed_threshold'] else "Reprovado"
             delta_color = "#00a651" if metrics['passed_threshold'] else "#ff4444"
             st.markdown(f'''
             <div class="metric-container">
                 <div style="font-size: 0.9rem; color: #666; margin-bottom: 0.5rem;">Score Final</div>
-                <div style="font-size: 2rem; font-weight: bold; color: #000;">{metrics['final_score']:.3f}</div>
+                <div style="font-size: 2rem; font-weight: bold; color: #000;">{final_score}</div>
             </div>
             ''', unsafe_allow_html=True)
         
@@ -286,6 +543,177 @@ def display_metrics(results):
             </div>
             ''', unsafe_allow_html=True)
 
+@st.fragment
+@timed
+def history_panel():
+    """Aba Histórico: paginar ou abrir a frota reexecuta só este trecho"""
+    st.markdown("## 📈 Histórico de Análises")
+    
+    # Agregados mantidos pelo store a cada inserção: custo constante por rerun
+    aggregates = history_store().aggregates(st.session_state.history_session)
+    if aggregates["count"]:
+        # Estatísticas gerais
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Total de Análises", aggregates["count"])
+        with col2:
+            st.metric("Score Médio", f"{aggregates['avg_score']:.3f}" if aggregates["avg_score"] is not None else "N/A")
+        with col3:
+            st.metric("Total de Tentativas", aggregates["attempts_sum"])
+        
+        # Tabela do histórico, uma página por vez
+        st.markdown("### 📋 Todas as Análises")
+        
+        page_size = 20
+        pages = (aggregates["count"] + page_size - 1) // page_size
+        page = st.number_input("Página", 1, pages, 1) - 1 if pages > 1 else 0
+        
+        history_data = []
+        for entry in history_store().page(st.session_state.history_session, page, page_size):
+            history_data.append({
+                "#": entry["number"],
+                "Paciente": entry["patient_id"],
+                "Score": f"{entry['final_score']:.3f}" if entry["final_score"] is not None else "N/A",
+                "Status": "✅" if entry["passed"] else "❌",
+                "Tentativas": entry["total_attempts"]
+            })
+        
+        st.dataframe(history_data, use_container_width=True)
+        
+        # Botão para limpar histórico
+        if st.button("🗑️ Limpar Histórico"):
+            history_store().clear(st.session_state.history_session)
+            st.rerun()
+    
+    else:
+        st.info("📝 Nenhuma análise no histórico ainda.")
+    
+    # Visão da frota: todos os agentes e processos que reportam ao mesmo arquivo de analytics
+    agent = create_agent()
+    if agent is not None and agent.analytics is not None:
+        with st.expander("🌐 Qualidade e Latência da Frota"):
+            report = fleet_report()
+            if report:
+                def fmt(value, spec=".3f"):
+                    return "N/A" if value is None else format(value, spec)
+                
+                st.dataframe([{
+                    "Complexidade": row["complexity"],
+                    "Modelo": row["model"],
+                    "Threshold": row["threshold"],
+                    "Análises": row["count"],
+                    "Erros": row["errors"],
+                    "Aprovação": fmt(row["pass_rate"], ".1%"),
+                    "Score p10/p50/p90": "/".join(fmt(row[f"score_p{q}"]) for q in (10, 50, 90)),
+                    "Tentativas (média)": fmt(row["attempts_mean"], ".2f"),
+                    "Latência p50/p95/p99 (s)": "/".join(fmt(row[f"latency_p{q}_s"], ".2f") for q in (50, 95, 99))
+                } for row in report], use_container_width=True)
+                st.download_button("⬇️ Exportar JSON", json.dumps(report, indent=2, ensure_ascii=False),
+                                   file_name="fleet_analytics.json", mime="application/json")
+            else:
+                st.info("Nenhuma análise registrada na frota ainda.")
+
+def attach_documents(patient_id, uploads):
+    """Grava os uploads novos em disco e extrai o texto (uma vez por conteúdo, em paralelo)"""
+    upload_dir = os.getenv("VIZEVAL_UPLOADS_PATH", ".cache/uploads")
+    paths = []
+    for upload in uploads:
+        if upload.file_id in st.session_state.processed_uploads:
+            continue
+        # Diretório por conteúdo: o mesmo arquivo enviado de novo não é regravado
+        directory = os.path.join(upload_dir, hashlib.sha256(upload.getbuffer()).hexdigest()[:16])
+        path = os.path.join(directory, os.path.basename(upload.name))
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(upload.getbuffer())
+        paths.append(path)
+        st.session_state.processed_uploads.add(upload.file_id)
+    if not paths:
+        return
+    
+    with st.spinner("Extraindo e indexando os documentos..."):
+        try:
+            documents = document_ingestor().ingest(paths)
+            retrieval_index().add(documents)
+        except DocumentError as e:
+            st.error(f"❌ {e}")
+            return
+    attached = st.session_state.documents.setdefault(patient_id, [])
+    known = {d.sha256 for d in attached}
+    attached.extend(d for d in documents if d.sha256 not in known)
+
+@st.fragment
+@timed
+def documents_panel(patient_id):
+    """Documentos do caso selecionado: enviar arquivos reexecuta só este trecho"""
+    uploads = st.file_uploader("Anexar documentos", type=[ext.lstrip(".") for ext in SUPPORTED_EXTENSIONS],
+                               accept_multiple_files=True, key=f"uploads_{patient_id}")
+    if uploads:
+        attach_documents(patient_id, uploads)
+    
+    attached = st.session_state.documents.get(patient_id, [])
+    if not attached:
+        st.caption("Nenhum documento anexado a este caso: a análise usa apenas sintomas e histórico.")
+        return
+    
+    with st.container():
+        col1, col2 = st.columns(2)
+        left, right = document_cards(tuple((d.name, d.size, d.text_size) for d in attached))
+        with col1:
+            st.markdown(left, unsafe_allow_html=True)
+        with col2:
+            st.markdown(right, unsafe_allow_html=True)
+
+@st.fragment
+@timed
+def connection_settings():
+    """Conexão com o Vizeval (URL e botão de conexão) na barra lateral"""
+    st.markdown("#### 🔗 Conexão Vizeval")
+    st.text_input("URL do Vizeval", value=os.getenv("VIZEVAL_BASE_URL", "http://localhost:8000"), key="vizeval_url")
+    
+    if st.button("🔄 Conectar Sistema"):
+        with st.spinner("Conectando com Vizeval..."):
+            st.session_state.agent = create_agent()
+            if st.session_state.agent:
+                st.success("✅ Sistema Unimed conectado!")
+            else:
+                st.error("❌ Falha na conexão com Vizeval")
+
+@st.fragment
+@timed
+def evaluation_settings():
+    """Parâmetros de avaliação da sessão
+    
+    Mover o threshold ou mudar as tentativas reexecuta só este trecho: os valores ficam no
+    session_state (chaves dos widgets) e são lidos quando uma análise é enfileirada.
+    """
+    st.markdown("#### 📊 Parâmetros de Avaliação")
+    st.slider("Threshold de Qualidade", 0.0, 1.0, 0.85, 0.05, key="threshold")
+    st.number_input("Máximo de Tentativas", 1, 10, 5, key="max_retries")
+    st.checkbox("🔁 Ignorar cache (nova análise)", value=False, key="refresh_cache")
+
+def toggle_profiling():
+    page_profiler().enabled = st.session_state.profiling
+
+def profiling_panel():
+    """Chave do modo profiling e resumo de CPU local e memória por categoria"""
+    profiler = page_profiler()
+    st.toggle("🔬 Modo profiling", value=profiler.enabled, key="profiling", on_change=toggle_profiling,
+              help="Mede cada rerun e cada análise com cProfile e tracemalloc (vale para o processo inteiro)")
+    report = profiler.report()
+    if not report["profiles"]:
+        return
+    with st.expander(f"🔬 Profiling ({report['profiles']} trechos)"):
+        st.markdown("| Categoria | CPU | Memória retida |\n|---|---|---|\n" + "\n".join(
+            f"| {row['category']} | {row['cpu_s'] * 1000:.1f} ms | {row['retained_bytes'] / 1024:.1f} KiB |"
+            for row in report["categories"]))
+        st.markdown("**Principais pontos de alocação**\n\n" + "\n".join(
+            f"- `{row['site']}`: {row['retained_bytes'] / 1024:.1f} KiB" for row in report["top_allocations"][:5]))
+        if st.button("💾 Gravar profile.folded e report.json"):
+            profiler.write()
+            st.success(f"Perfis em {report['output_dir']}")
+
 def main():
     # Inicializar estado
     init_session_state()
@@ -313,27 +741,14 @@ def main():
         </div>
         """, unsafe_allow_html=True)
         
-        # Status da API
-        st.markdown("#### 🔗 Conexão Vizeval")
-        vizeval_url = st.text_input("URL do Vizeval", value="http://localhost:8000")
-        
-        if st.button("🔄 Conectar Sistema"):
-            with st.spinner("Conectando com Vizeval..."):
-                st.session_state.agent = create_agent()
-                if st.session_state.agent:
-                    st.success("✅ Sistema Unimed conectado!")
-                else:
-                    st.error("❌ Falha na conexão com Vizeval")
-        
-        # Configurações de avaliação
-        st.markdown("#### 📊 Parâmetros de Avaliação")
-        threshold = st.slider("Threshold de Qualidade", 0.0, 1.0, 0.85, 0.05)
-        max_retries = st.number_input("Máximo de Tentativas", 1, 10, 5)
+        # Conexão e parâmetros: cada widget reexecuta só o seu trecho da barra lateral
+        connection_settings()
+        evaluation_settings()
         
-        # Casos de exemplo
+        # Casos de exemplo (trocar de caso atualiza a página inteira)
         st.markdown("#### 📋 Casos Clínicos")
-        sample_cases = create_sample_cases()
-        case_names = [f"{case.patient_id} ({case.complexity_level})" for case in sample_cases]
+        cases = sample_cases()
+        case_names = [f"{case.patient_id} ({case.complexity_level})" for case in cases]
         selected_case_idx = st.selectbox("Selecionar Caso", range(len(case_names)), format_func=lambda x: case_names[x])
     
     # Área principal
@@ -343,7 +758,7 @@ def main():
         st.markdown("## 🔍 Análise de Caso Clínico")
         
         # Usar caso selecionado na sidebar
-        selected_case = sample_cases[selected_case_idx]
+        selected_case = cases[selected_case_idx]
         
         # Exibir detalhes do caso
         col1, col2 = st.columns(2)
@@ -371,101 +786,45 @@ def main():
         
         # Seção de documentos anexados
         st.markdown("### 📄 Documentos do Paciente")
+        documents_panel(selected_case.patient_id)
         
-        # Container principal dos documentos
-        with st.container():
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Documento 1
-                st.markdown("""
-                <div style="background: white; border: 1px solid #e8f5e8; border-radius: 10px; padding: 1rem; margin: 0.5rem 0; display: flex; align-items: center; gap: 1rem;">
-                    <div style="padding: 0.8rem; font-size: 1.5rem;">📋</div>
-                    <div>
-                        <div style="font-weight: 500; color: #333;">Histórico_Médico_Completo.pdf</div>
-                        <div style="font-size: 0.8rem; color: #666;">2.4 MB • ✓ Processado</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Documento 2
-                st.markdown("""
-                <div style="background: white; border: 1px solid #e8f5e8; border-radius: 10px; padding: 1rem; margin: 0.5rem 0; display: flex; align-items: center; gap: 1rem;">
-                    <div style="padding: 0.8rem; font-size: 1.5rem;">🩺</div>
-                    <div>
-                        <div style="font-weight: 500; color: #333;">Exames_Laboratoriais_2024.pdf</div>
-                        <div style="font-size: 0.8rem; color: #666;">1.8 MB • ✓ Processado</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col2:
-                # Documento 3
-                st.markdown("""
-                <div style="background: white; border: 1px solid #e8f5e8; border-radius: 10px; padding: 1rem; margin: 0.5rem 0; display: flex; align-items: center; gap: 1rem;">
-                    <div style="padding: 0.8rem; font-size: 1.5rem;">🏥</div>
-                    <div>
-                        <div style="font-weight: 500; color: #333;">Relatório_Consulta_Anterior.docx</div>
-                        <div style="font-size: 0.8rem; color: #666;">892 KB • ✓ Processado</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Documento 4
-                st.markdown("""
-                <div style="background: white; border: 1px solid #e8f5e8; border-radius: 10px; padding: 1rem; margin: 0.5rem 0; display: flex; align-items: center; gap: 1rem;">
-                    <div style="padding: 0.8rem; font-size: 1.5rem;">💊</div>
-                    <div>
-                        <div style="font-weight: 500; color: #333;">Lista_Medicamentos_Atuais.pdf</div>
-                        <div style="font-size: 0.8rem; color: #666;">456 KB • ✓ Processado</div>
-                    </div>
-                </div>
-                """, unsafe_allow_html=True)
+        # Botões de análise: os jobs rodam em segundo plano e a página continua respondendo
+        col1, col2 = st.columns(2)
+        with col1:
+            run_selected = st.button("🚀 Executar Análise Médica", type="primary")
+        with col2:
+            run_all = st.button("📋 Enfileirar Todos os Casos")
         
-        # Botão de análise
-        if st.button("🚀 Executar Análise Médica", type="primary"):
+        if run_selected or run_all:
             if not st.session_state.agent:
                 st.error("❌ Conecte o sistema Vizeval primeiro na barra lateral")
-            elif not case_to_analyze.symptoms.strip():
+            elif run_selected and not case_to_analyze.symptoms.strip():
                 st.error("❌ Informe os sintomas do paciente")
             else:
-                with st.spinner("🔍 Analisando caso com sistema Unimed..."):
-                    # Atualizar configurações do agente
-                    st.session_state.agent.client.set_vizeval_config({
-                        "api_key": st.session_state.agent.vizeval_config.api_key,
-                        "evaluator": "medical",
-                        "threshold": threshold,
-                        "max_retries": max_retries,
-                        "base_url": vizeval_url,
-                        "metadata": {"unimed_system": True, "streamlit_demo": True}
-                    })
-                    
-                    # Fazer análise
-                    results = st.session_state.agent.analyze_case(case_to_analyze)
-                    
-                    # Salvar no histórico
-                    st.session_state.analysis_history.append(results)
-                    
-                    # Exibir apenas o resultado da análise médica
-                    st.success("✅ Análise Unimed concluída com sucesso!")
-                    
-                    # Mostrar apenas a análise médica
-                    analysis_text = results["analysis"].replace('\n', '<br>')
-                    st.markdown(f'''
-                    <div class="info-card">
-                        <h4>🏥 Diagnóstico Médico Unimed</h4>
-                        <div style="white-space: pre-wrap; line-height: 1.6;">{analysis_text}</div>
-                    </div>
-                    ''', unsafe_allow_html=True)
-                    
-                    # Informar sobre métricas na aba Resultados
-                    st.info("📊 Para ver as métricas de qualidade e avaliação Vizeval, acesse a aba **Resultados**")
+                try:
+                    for case in (cases if run_all else [case_to_analyze]):
+                        case = replace(case, documents=[d.path for d in st.session_state.documents.get(case.patient_id, [])]
+                                       or None)
+                        config = session_config(st.session_state.agent, case, st.session_state.threshold,
+                                                st.session_state.max_retries, st.session_state.vizeval_url)
+                        job_id = job_queue().submit(case, config=config, refresh=st.session_state.refresh_cache)
+                        st.session_state.jobs[job_id] = job_queue().get(job_id)
+                    st.toast("⏳ Análise enfileirada - acompanhe o progresso abaixo")
+                except ValueError as e:
+                    # URL do Vizeval inválida na barra lateral
+                    st.error(f"❌ {e}")
+        
+        # Progresso dos jobs da sessão, atualizado sem reexecutar a página inteira
+        if st.session_state.jobs:
+            st.markdown("### ⏳ Análises da Sessão")
+            active = any(job.active for job in st.session_state.jobs.values())
+            st.fragment(run_every=1.0 if active else None)(timed(jobs_panel))()
     
     with tab2:
         st.markdown("## 📊 Resultados da Análise")
         
-        if st.session_state.analysis_history:
-            latest_result = st.session_state.analysis_history[-1]
+        latest_result = history_store().latest(st.session_state.history_session)
+        if latest_result:
             
             # Métricas principais
             st.markdown("### 📈 Métricas de Qualidade")
@@ -480,11 +839,38 @@ def main():
                     attempts_data.append({
                         "Tentativa": attempt["attempt"],
                         "Score": f"{attempt['score']:.3f}" if attempt["score"] else "N/A",
-                        "Status": "✅ Aprovado" if attempt["score"] and attempt["score"] >= threshold else "🔄 Retry"
+                        "Status": "✅ Aprovado" if attempt["score"] and attempt["score"] >= st.session_state.threshold else "🔄 Retry"
                     })
                 
                 st.dataframe(attempts_data, use_container_width=True)
-            
+
+            # Onde o tempo foi gasto: fila, geração (OpenAI) e avaliação (Vizeval)
+            if "performance" in latest_result:
+                st.markdown("### ⏱️ Latência e Tokens")
+                performance = latest_result["performance"]
+
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Tempo Total", f"{performance['total_s']:.2f}s")
+                with col2:
+                    st.metric("Geração (OpenAI)", f"{performance['generation_s']:.2f}s")
+                with col3:
+                    st.metric("Avaliação (Vizeval)", f"{performance['evaluation_s']:.2f}s")
+                with col4:
+                    st.metric("Tokens", performance["prompt_tokens"] + performance["completion_tokens"])
+
+                st.dataframe([
+                    {
+                        "Tentativa": attempt["attempt"],
+                        "Fila (s)": round(attempt.get("queue_s") or 0.0, 2),
+                        "Geração (s)": round(attempt.get("generation_s") or 0.0, 2),
+                        "Avaliação (s)": round(attempt.get("evaluation_s") or 0.0, 2),
+                        "Tokens prompt": attempt.get("prompt_tokens"),
+                        "Tokens resposta": attempt.get("completion_tokens")
+                    }
+                    for attempt in latest_result["attempt_history"]
+                ], use_container_width=True)
+
             # JSON dos resultados
             st.markdown("### 🔧 Dados Técnicos")
             with st.expander("Ver Dados Completos do Vizeval"):
@@ -494,45 +880,7 @@ def main():
             st.info("📝 Nenhuma análise realizada ainda. Vá para a aba 'Análise Clínica' para começar.")
     
     with tab3:
-        st.markdown("## 📈 Histórico de Análises")
-        
-        if st.session_state.analysis_history:
-            # Estatísticas gerais
-            total_analyses = len(st.session_state.analysis_history)
-            avg_score = sum(r["quality_metrics"].get("final_score", 0) for r in st.session_state.analysis_history) / total_analyses
-            total_attempts = sum(r["quality_metrics"].get("total_attempts", 0) for r in st.session_state.analysis_history)
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Total de Análises", total_analyses)
-            with col2:
-                st.metric("Score Médio", f"{avg_score:.3f}")
-            with col3:
-                st.metric("Total de Tentativas", total_attempts)
-            
-            # Tabela do histórico
-            st.markdown("### 📋 Todas as Análises")
-            
-            history_data = []
-            for i, result in enumerate(st.session_state.analysis_history):
-                metrics = result["quality_metrics"]
-                history_data.append({
-                    "#": i + 1,
-                    "Paciente": result["patient_id"],
-                    "Score": f"{metrics.get('final_score', 0):.3f}",
-                    "Status": "✅" if metrics.get('passed_threshold', False) else "❌",
-                    "Tentativas": metrics.get('total_attempts', 'N/A')
-                })
-            
-            st.dataframe(history_data, use_container_width=True)
-            
-            # Botão para limpar histórico
-            if st.button("🗑️ Limpar Histórico"):
-                st.session_state.analysis_history = []
-                st.rerun()
-        
-        else:
-            st.info("📝 Nenhuma análise no histórico ainda.")
+        history_panel()
     
     # Footer
     st.markdown("""
@@ -542,6 +890,14 @@ def main():
         <p><small>Avaliação de qualidade em tempo real com tecnologia Vizeval</small></p>
     </div>
     """, unsafe_allow_html=True)
+    
+    # Tempo desta execução e painel de desempenho contra os orçamentos
+    record_run()
+    with st.sidebar:
+        performance_panel()
+        profiling_panel()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # Modo profiling ligado: a rerun inteira é medida (desligado, não custa nada)
+    with page_profiler().profile("rerun"):
+        main() 
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""Testes rodam a partir da raiz do repositório: os módulos do projeto são planos (sem pacote)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
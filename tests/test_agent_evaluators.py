@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+import medical_agent
+from medical_agent import AnalysisConfig, AsyncMedicalAgent, MedicalAgent
+
+medical_agent.console.quiet = True
+
+
+class FakePool:
+    def __init__(self, clients):
+        self.urls = list(clients)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    async def aclose(self):
+        self.closed = True
+
+
+def agent(cls=MedicalAgent, pools=2):
+    instance = cls("x", "x", vizeval_base_url="http://localhost:8000", max_evaluator_pools=pools)
+    instance._create_evaluator = lambda url: url
+    instance._create_evaluator_pool = FakePool
+    return instance
+
+
+def test_config_normalizes_and_validates_base_url():
+    assert AnalysisConfig(base_url=" http://a:8000/ , https://b ").base_url == "http://a:8000,https://b"
+    for url in ("", " , ", "localhost:8000", "ftp://a", "http://"):
+        with pytest.raises(ValueError):
+            AnalysisConfig(base_url=url)
+
+
+def test_least_recently_used_pool_is_closed():
+    evaluators = agent()
+    pools = {}
+    for url in ("http://a", "http://b", "http://a", "http://c"):
+        with evaluators._evaluator_for(url) as pool:
+            pools.setdefault(url, pool)
+            assert pool is pools[url]
+    assert list(evaluators._evaluators) == ["http://a", "http://c"]
+    assert pools["http://b"].closed and not pools["http://a"].closed
+    assert evaluators._evaluator_leases == {}
+    evaluators.close()
+    assert pools["http://a"].closed and pools["http://c"].closed
+
+
+def test_evicted_pool_in_use_closes_on_release():
+    evaluators = agent(pools=1)
+    with evaluators._evaluator_for("http://a") as first:
+        with evaluators._evaluator_for("http://b"):
+            pass
+        assert "http://a" not in evaluators._evaluators
+        assert not first.closed
+    assert first.closed
+    evaluators.close()
+
+
+def test_async_agent_closes_evicted_pools():
+    async def run():
+        evaluators = agent(AsyncMedicalAgent, pools=1)
+        async with evaluators._evaluator_for("http://a") as first:
+            pass
+        async with evaluators._evaluator_for("http://b") as second:
+            assert first.closed and not second.closed
+        await evaluators.aclose()
+        assert second.closed
+
+    asyncio.run(run())
@@ -0,0 +1,85 @@
+import json
+import random
+
+import pytest
+
+from analytics import FleetAnalytics, GroupStats, QuantileSketch
+
+
+def exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def sketch_of(values, **kwargs):
+    sketch = QuantileSketch(**kwargs)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def test_quantiles_within_relative_accuracy():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(0, 1) for _ in range(5000)]
+    sketch = sketch_of(values)
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        assert sketch.quantile(q) == pytest.approx(exact(values, q), rel=0.01)
+
+
+def test_merge_equals_sketch_of_all_values():
+    rng = random.Random(2)
+    left = [rng.uniform(0.1, 5) for _ in range(1000)]
+    right = [rng.uniform(3, 50) for _ in range(700)] + [0.0] * 10
+    merged = sketch_of(left)
+    merged.merge(sketch_of(right))
+    combined = sketch_of(left + right)
+    assert merged.bins == combined.bins
+    assert (merged.count, merged.zero_count, merged.min, merged.max) == \
+           (combined.count, combined.zero_count, combined.min, combined.max)
+    assert merged.sum == pytest.approx(combined.sum)
+    for q in (0.0, 0.25, 0.5, 0.95, 1.0):
+        assert merged.quantile(q) == combined.quantile(q)
+
+
+def test_merge_into_empty_and_roundtrip():
+    source = sketch_of([0.5, 0.8, 0.9])
+    empty = QuantileSketch()
+    empty.merge(QuantileSketch())
+    assert empty.quantile(0.5) is None
+    empty.merge(source)
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(empty.to_dict())))
+    assert restored.quantile(0.5) == source.quantile(0.5)
+    assert (restored.min, restored.max, restored.count) == (0.5, 0.9, 3)
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy=0.01).merge(QuantileSketch(relative_accuracy=0.02))
+
+
+def test_collapse_keeps_count_and_upper_quantiles():
+    values = [1.05 ** i for i in range(400)]
+    sketch = sketch_of(values, max_bins=50)
+    assert len(sketch.bins) <= 50 and sketch.count == 400
+    assert sketch.quantile(0.99) == pytest.approx(exact(values, 0.99), rel=0.01)
+
+
+def result(score, passed, attempts, total_s):
+    return {"quality_metrics": {"final_score": score, "passed_threshold": passed, "total_attempts": attempts},
+            "performance": {"total_s": total_s}}
+
+
+def test_processes_merge_into_the_shared_file(tmp_path):
+    path = str(tmp_path / "fleet.sqlite3")
+    first, second = FleetAnalytics(path), FleetAnalytics(path)
+    first.record(result(0.9, True, 1, 2.0), "low", "m", 0.8)
+    second.record(result(0.5, False, 3, 6.0), "low", "m", 0.8)
+    second.record({"quality_metrics": {"error": "falhou"}}, "low", "m", 0.8)
+    first.flush()
+    second.flush()
+    (row,) = FleetAnalytics(path).report()
+    assert (row["count"], row["errors"], row["pass_rate"], row["attempts"]) == (3, 1, 0.5, {"1": 1, "3": 1})
+    expected = GroupStats()
+    for item in (result(0.9, True, 1, 2.0), result(0.5, False, 3, 6.0)):
+        expected.record(item)
+    assert row["latency_p95_s"] == expected.latency.quantile(0.95)
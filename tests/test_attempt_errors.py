@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+from vizeval.exceptions import VizevalOpenAIError
+
+import medical_agent
+from medical_agent import AnalysisConfig, AsyncMedicalAgent, MedicalAgent
+
+medical_agent.console.quiet = True
+
+
+class QuotaError(Exception):
+    pass
+
+
+def failing(*args, **kwargs):
+    raise QuotaError("cota excedida")
+
+
+async def failing_async(*args, **kwargs):
+    raise QuotaError("cota excedida")
+
+
+@pytest.mark.parametrize("candidates", [1, 2])
+def test_failed_attempts_keep_the_last_error(candidates):
+    agent = MedicalAgent("x", "x")
+    agent._generate_and_evaluate = failing
+    config = AnalysisConfig(max_retries=1, speculative_candidates=candidates)
+    with pytest.raises(VizevalOpenAIError, match="cota excedida") as raised:
+        agent._run_attempts("sistema", "usuário", config)
+    assert isinstance(raised.value.__cause__, QuotaError)
+    agent.close()
+
+
+def test_async_speculative_candidates_keep_the_last_error():
+    async def run():
+        agent = AsyncMedicalAgent("x", "x")
+        agent._generate_and_evaluate = failing_async
+        try:
+            with pytest.raises(VizevalOpenAIError, match="cota excedida") as raised:
+                await agent._run_attempts("sistema", "usuário", AnalysisConfig(max_retries=1, speculative_candidates=2))
+            assert isinstance(raised.value.__cause__, QuotaError)
+        finally:
+            await agent.aclose()
+
+    asyncio.run(run())
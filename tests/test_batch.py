@@ -0,0 +1,76 @@
+import json
+import threading
+
+from batch import BatchCheckpoint, run_batch
+
+
+class FakeAgent:
+    def __init__(self):
+        self.analyzed = []
+        self._lock = threading.Lock()
+
+    def analyze_case(self, case, config=None, show_progress=True, refresh=False):
+        with self._lock:
+            self.analyzed.append(case.patient_id)
+        return {"patient_id": case.patient_id, "analysis": "ok", "quality_metrics": {"final_score": 0.9},
+                "attempt_history": [], "performance": {"queue_s": 0.0}}
+
+    def _error_result(self, case, error):
+        return {"patient_id": case.patient_id, "analysis": str(error), "quality_metrics": {"error": str(error)},
+                "attempt_history": []}
+
+
+def write_cases(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"patient_id": f"p{i}", "symptoms": "dor", "medical_history": "nada",
+                                "complexity_level": "low"}) + "\n")
+
+
+def output_indices(path):
+    with open(path, encoding="utf-8") as f:
+        return sorted(json.loads(line)["index"] for line in f)
+
+
+def test_checkpoint_watermark_advances_over_out_of_order_cases(tmp_path):
+    checkpoint = BatchCheckpoint(str(tmp_path / "out.jsonl"))
+    for index in (2, 0, 3):
+        checkpoint.mark(index)
+    assert (checkpoint.watermark, checkpoint.done) == (1, {2, 3})
+    checkpoint.mark(1)
+    assert (checkpoint.watermark, checkpoint.done) == (4, set())
+
+
+def test_rerun_skips_finished_cases(tmp_path):
+    write_cases(tmp_path / "cases.jsonl", 10)
+    output = str(tmp_path / "out.jsonl")
+    assert run_batch(FakeAgent(), str(tmp_path / "cases.jsonl"), output, max_concurrency=3)["processed"] == 10
+    agent = FakeAgent()
+    assert run_batch(agent, str(tmp_path / "cases.jsonl"), output) == {"processed": 0, "skipped": 10, "errors": 0}
+    assert agent.analyzed == [] and output_indices(output) == list(range(10))
+
+
+def test_resume_discards_partial_line_after_crash(tmp_path):
+    write_cases(tmp_path / "cases.jsonl", 6)
+    output = tmp_path / "out.jsonl"
+    # Execução interrompida: dois casos gravados, um pela metade e o checkpoint ainda no início
+    output.write_text('{"index": 0, "quality_metrics": {}}\n{"index": 3, "quality_metrics": {}}\n{"index": 1, "qu',
+                      encoding="utf-8")
+    (tmp_path / "out.jsonl.checkpoint").write_text(json.dumps({"watermark": 0, "done": [], "offset": 0}))
+    agent = FakeAgent()
+    stats = run_batch(agent, str(tmp_path / "cases.jsonl"), str(output), max_concurrency=2)
+    assert stats == {"processed": 4, "skipped": 2, "errors": 0}
+    assert sorted(agent.analyzed) == ["p1", "p2", "p4", "p5"]
+    assert output_indices(output) == list(range(6))
+
+
+def test_should_stop_leaves_the_rest_for_the_next_run(tmp_path):
+    write_cases(tmp_path / "cases.jsonl", 8)
+    output = str(tmp_path / "out.jsonl")
+    agent = FakeAgent()
+    stats = run_batch(agent, str(tmp_path / "cases.jsonl"), output, max_concurrency=1,
+                      should_stop=lambda: len(agent.analyzed) >= 3)
+    written = output_indices(output)
+    assert stats["processed"] == len(written) < 8
+    rest = run_batch(FakeAgent(), str(tmp_path / "cases.jsonl"), output)
+    assert rest["skipped"] == len(written) and output_indices(output) == list(range(8))
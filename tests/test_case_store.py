@@ -0,0 +1,40 @@
+from batch import read_cases
+from case_store import CaseStore
+from medical_agent import MedicalCase
+
+CASES = [
+    MedicalCase("p0", "febre", "saudável", "low"),
+    MedicalCase("p1", "dor no peito — irradiando", "hipertenso", "high", expected_focus=["ECG", "troponina"]),
+    MedicalCase("p2", "", "", "raro", documents=["exame.pdf", "laudo.txt"]),
+    MedicalCase("p3", "tosse", "fumante", "medium"),
+    MedicalCase("p4", "cefaleia", "", "low"),
+]
+
+
+def test_roundtrip_keeps_every_field(tmp_path):
+    store = CaseStore.write(str(tmp_path / "store"), iter(CASES))
+    assert len(store) == 5
+    assert list(store) == CASES
+    assert [store[i] for i in range(-5, 5)] == CASES + CASES
+    assert store.complexity_counts() == {"low": 2, "medium": 1, "high": 1, "raro": 1}
+    store.close()
+
+
+def test_views_and_shards_share_the_columns(tmp_path):
+    CaseStore.write(str(tmp_path / "store"), CASES).close()
+    store = CaseStore(str(tmp_path / "store"))
+    assert list(store.view(1, 3)) == CASES[1:3]
+    assert list(store.view(3, 1)) == []
+    shards = [list(store.shard(i, 3)) for i in range(3)]
+    assert sum(shards, []) == CASES
+    assert [len(batch) for batch in store.batches(2)] == [2, 2, 1]
+    assert store.view(2, 5).complexity_counts() == {"medium": 1, "low": 1, "raro": 1}
+    assert list(read_cases(str(tmp_path / "store")))[1] == (1, CASES[1])
+    store.close()
+
+
+def test_rewrite_replaces_the_store(tmp_path):
+    CaseStore.write(str(tmp_path / "store"), CASES).close()
+    store = CaseStore.write(str(tmp_path / "store"), CASES[:2])
+    assert list(store) == CASES[:2]
+    store.close()
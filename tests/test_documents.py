@@ -0,0 +1,43 @@
+import pytest
+
+import documents
+from documents import DocumentError, DocumentIngestor
+
+
+def test_empty_pdf_raises_document_error(tmp_path):
+    (tmp_path / "vazio.pdf").write_bytes(b"")
+    ingestor = DocumentIngestor(str(tmp_path / "cache"))
+    with pytest.raises(DocumentError, match="vazio"):
+        ingestor.ingest([str(tmp_path / "vazio.pdf")])
+    ingestor.close()
+
+
+def test_text_is_extracted_once_per_content(tmp_path):
+    for name in ("a.txt", "b.txt"):
+        (tmp_path / name).write_text("mesmo conteúdo", encoding="utf-8")
+    ingestor = DocumentIngestor(str(tmp_path / "cache"))
+    first, second = ingestor.ingest([str(tmp_path / "a.txt"), str(tmp_path / "b.txt")])
+    assert first.sha256 == second.sha256 and first.read() == "mesmo conteúdo"
+    assert ingestor.stats() == {"documents": 2, "cache_hits": 1, "extracted": 1}
+    ingestor.close()
+
+
+def test_digest_memo_is_bounded(tmp_path, monkeypatch):
+    hashed = []
+    file_digest = documents.file_digest
+    monkeypatch.setattr(documents, "file_digest", lambda path: hashed.append(path) or file_digest(path))
+    paths = []
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.txt").write_text(name, encoding="utf-8")
+        paths.append(str(tmp_path / f"{name}.txt"))
+    ingestor = DocumentIngestor(str(tmp_path / "cache"), max_digests=2)
+    ingestor.ingest(paths[:1])
+    ingestor.ingest(paths[1:2])
+    ingestor.ingest(paths[:1])
+    ingestor.ingest(paths[2:])
+    assert len(ingestor._digests) == 2
+    assert hashed == paths[:2] + paths[2:]
+    # b saiu do memo (menos usado recentemente); a continua
+    ingestor.ingest(paths[:2])
+    assert hashed[3:] == paths[1:2]
+    ingestor.close()
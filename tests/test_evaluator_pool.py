@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from evaluator_pool import (CLOSED, HALF_OPEN, OPEN, AsyncEvaluatorPool, CircuitBreaker, EvaluatorPool,
+                            EvaluatorUnavailable)
+from rate_limit import Upstream
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeClient:
+    """Cliente Vizeval simulado: cada chamada consome o próximo item de `outcomes` (exceção ou resultado)"""
+
+    def __init__(self, *outcomes, delay: float = 0.0):
+        self.session = self
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else "ok"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def close(self):
+        pass
+
+    def evaluate(self, **kwargs):
+        time.sleep(self.delay)
+        return self._next()
+
+
+class FakeAsyncClient(FakeClient):
+    async def evaluate(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self._next()
+
+
+def half_open(breaker: CircuitBreaker):
+    breaker.state, breaker._opened_at = OPEN, time.monotonic() - breaker.reset_timeout
+
+
+def limiter():
+    return Upstream("vizeval", backoff_base=0.001, backoff_max=0.01)
+
+
+def test_breaker_release_returns_probe_slot():
+    breaker = CircuitBreaker(reset_timeout=0.0)
+    half_open(breaker)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_cancelled_async_probe_releases_breaker():
+    pool = AsyncEvaluatorPool({"a": FakeAsyncClient(delay=10.0)}, limiter())
+    half_open(pool.breakers["a"])
+
+    async def run():
+        task = asyncio.ensure_future(pool.evaluate(text="x"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert pool.breakers["a"].state == HALF_OPEN
+    assert pool.breakers["a"].allow()
+
+
+def test_request_error_does_not_reserve_failover_probe():
+    pool = EvaluatorPool({"a": FakeClient(StatusError(400)), "b": FakeClient()}, limiter())
+    pool._next = 0
+    half_open(pool.breakers["b"])
+    with pytest.raises(StatusError):
+        pool.evaluate(text="x")
+    assert pool.clients["b"].calls == 0
+    assert pool.breakers["b"].allow()
+    pool.close()
+
+
+def test_async_request_error_does_not_reserve_failover_probe():
+    pool = AsyncEvaluatorPool({"a": FakeAsyncClient(StatusError(422)), "b": FakeAsyncClient()}, limiter())
+    pool._next = 0
+    half_open(pool.breakers["b"])
+    with pytest.raises(StatusError):
+        asyncio.run(pool.evaluate(text="x"))
+    assert pool.breakers["b"].allow()
+
+
+def test_single_endpoint_keeps_limiter_retries():
+    pool = EvaluatorPool({"a": FakeClient(StatusError(503), StatusError(429))}, limiter())
+    assert pool.evaluate(text="x") == "ok"
+    assert pool.clients["a"].calls == 3
+    assert pool.breakers["a"].state == CLOSED
+    pool.close()
+
+
+def test_healthy_alternative_skips_limiter_retries():
+    pool = EvaluatorPool({"a": FakeClient(StatusError(503)), "b": FakeClient()}, limiter())
+    pool._next = 0
+    assert pool.evaluate(text="x") == "ok"
+    assert pool.clients["a"].calls == 1
+    assert pool.stats()["failovers"] == 1
+    pool.close()
+
+
+def test_all_endpoints_down_is_unavailable():
+    pool = EvaluatorPool({"a": FakeClient(*[StatusError(503)] * 10)}, Upstream("vizeval", max_retries=1,
+                                                                              backoff_base=0.001))
+    with pytest.raises(EvaluatorUnavailable):
+        pool.evaluate(text="x")
+    pool.close()
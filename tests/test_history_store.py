@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import history_store
+from history_store import HistoryStore, MemoryHistoryStore, SQLiteHistoryStore
+
+
+def result(patient_id, score, passed=True, attempts=1):
+    return {"patient_id": patient_id,
+            "quality_metrics": {"final_score": score, "passed_threshold": passed, "total_attempts": attempts}}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryHistoryStore(max_entries=2)
+    else:
+        store = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"), max_entries=2)
+        yield store
+        store.close()
+
+
+def test_history_store_is_abstract():
+    with pytest.raises(TypeError):
+        HistoryStore()
+
+
+def test_oldest_entries_leave_the_aggregates(store):
+    store.add("s", result("p1", 0.2, passed=False, attempts=3))
+    store.add("s", result("p2", 0.9))
+    store.add("s", result("p3", 0.7, attempts=2))
+    assert [entry["patient_id"] for entry in store.page("s")] == ["p3", "p2"]
+    aggregates = store.aggregates("s")
+    assert (aggregates["count"], aggregates["passed"], aggregates["attempts_sum"]) == (2, 2, 3)
+    assert aggregates["avg_score"] == pytest.approx(0.8)
+    assert store.latest("s")["patient_id"] == "p3"
+
+
+def test_expired_sessions_are_purged(store, monkeypatch):
+    store.session_ttl = 60
+    store.add("old", result("p1", 0.5))
+    store.add("new", result("p2", 0.5))
+    later = time.time() + 120
+    monkeypatch.setattr(history_store.time, "time", lambda: later)
+    store.add("new", result("p3", 0.5))
+    assert store.purge() == 1
+    assert store.latest("old") is None and store.aggregates("new")["count"] == 2
+
+
+def test_sqlite_latest_only_writes_stale_access(tmp_path, monkeypatch):
+    store = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    store.add("s", result("p1", 0.5))
+    changes = store._db.total_changes
+    for _ in range(3):
+        assert store.latest("s")["patient_id"] == "p1"
+    assert store._db.total_changes == changes
+    now = time.time()
+    monkeypatch.setattr(history_store.time, "time", lambda: now + history_store.TOUCH_INTERVAL)
+    store.latest("s")
+    assert store._db.total_changes == changes + 1
+    assert store._db.execute("SELECT last_access FROM history_aggregates").fetchone()[0] == now + history_store.TOUCH_INTERVAL
+    store.close()
@@ -0,0 +1,44 @@
+import time
+
+from jobs import DONE, JobQueue
+from medical_agent import MedicalCase
+from profiling import Profiler
+
+
+class FakeAgent:
+    profiler = Profiler(enabled=False)
+
+    def stream_case(self, case, config=None, refresh=False):
+        yield {"type": "result", "result": {"patient_id": case.patient_id, "analysis": "ok",
+                                            "quality_metrics": {"final_score": 0.9}}}
+
+
+def wait_done(queue, job_id):
+    for _ in range(100):
+        job = queue.get(job_id)
+        if not job.active:
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job não terminou")
+
+
+def test_sweep_drops_uncollected_finished_jobs():
+    queue = JobQueue(FakeAgent(), max_workers=1, finished_ttl=0.05)
+    abandoned = queue.submit(MedicalCase("p1", "dor", "nada", "low"))
+    assert wait_done(queue, abandoned).status == DONE
+    time.sleep(0.1)
+    collected = queue.submit(MedicalCase("p2", "dor", "nada", "low"))
+    assert queue.get(abandoned) is None
+    assert wait_done(queue, collected).status == DONE
+    queue.shutdown()
+
+
+def test_sweep_keeps_recent_jobs():
+    queue = JobQueue(FakeAgent(), max_workers=1)
+    job_id = queue.submit(MedicalCase("p1", "dor", "nada", "low"))
+    wait_done(queue, job_id)
+    assert queue.sweep() == 0
+    assert queue.get(job_id) is not None
+    queue.forget(job_id)
+    assert queue.get(job_id) is None
+    queue.shutdown()
@@ -0,0 +1,70 @@
+import types
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import PROMETHEUS_CONTENT_TYPE, AgentMetrics, attempt_stats
+
+
+def result(passed=True, evaluated=True):
+    history = [{"generation_s": 0.3, "evaluation_s": 0.2, "queue_s": 0.0, "prompt_tokens": 100,
+                "completion_tokens": 40},
+               {"generation_s": 3.0, "evaluation_s": None, "queue_s": 0.0, "prompt_tokens": None,
+                "completion_tokens": 60}]
+    return {"attempt_history": history, "performance": {"total_s": 3.5},
+            "quality_metrics": {"passed_threshold": passed, "evaluated": evaluated}}
+
+
+def test_attempt_stats_splits_stages():
+    usage = types.SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+    stats = attempt_stats(usage, 1.0, 1.5, 3.0, 3.25)
+    assert stats == {"queue_s": 0.5, "generation_s": 1.5, "evaluation_s": 0.25,
+                     "prompt_tokens": 10, "completion_tokens": 5}
+    assert attempt_stats(None, None, 1.0, 2.0, 2.0)["queue_s"] == 0.0
+    assert attempt_stats(None, None, 1.0, 2.0, 2.0)["prompt_tokens"] is None
+
+
+def test_prometheus_counters_and_histograms():
+    metrics = AgentMetrics(buckets=(0.5, 1.0))
+    metrics.observe_result(result(), "high", "gpt-4")
+    metrics.observe_result(result(passed=False), "high", "gpt-4")
+    metrics.observe_result(result(evaluated=False), "low", "gpt-4")
+    metrics.observe_result({"quality_metrics": {"error": "falhou"}}, "low", "gpt-4")
+    metrics.observe_coalesced()
+    lines = metrics.render_prometheus().splitlines()
+
+    for expected in ('medical_agent_analyses_total{complexity="high",outcome="passed"} 1',
+                     'medical_agent_analyses_total{complexity="high",outcome="failed"} 1',
+                     'medical_agent_analyses_total{complexity="low",outcome="unevaluated"} 1',
+                     'medical_agent_analyses_total{complexity="low",outcome="error"} 1',
+                     'medical_agent_attempts_total{complexity="high",model="gpt-4"} 4',
+                     'medical_agent_tokens_total{model="gpt-4",kind="prompt"} 300',
+                     'medical_agent_tokens_total{model="gpt-4",kind="completion"} 300',
+                     'medical_agent_coalesced_calls_total 1',
+                     'medical_agent_stage_seconds_bucket{stage="generation",complexity="high",le="0.5"} 2',
+                     'medical_agent_stage_seconds_bucket{stage="generation",complexity="high",le="1.0"} 2',
+                     'medical_agent_stage_seconds_bucket{stage="generation",complexity="high",le="+Inf"} 4',
+                     'medical_agent_stage_seconds_count{stage="evaluation",complexity="high"} 2',
+                     'medical_agent_stage_seconds_count{stage="total",complexity="low"} 1'):
+        assert expected in lines, expected
+    generation_sum = next(line for line in lines
+                          if line.startswith('medical_agent_stage_seconds_sum{stage="generation",complexity="high"}'))
+    assert float(generation_sum.split()[-1]) == pytest.approx(6.6)
+
+
+def test_metrics_endpoint():
+    metrics = AgentMetrics()
+    metrics.observe_coalesced()
+    server = metrics.serve(port=0, host="127.0.0.1")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{base}/metrics?x=1", timeout=5) as response:
+            assert response.headers["Content-Type"] == PROMETHEUS_CONTENT_TYPE
+            assert "medical_agent_coalesced_calls_total 1" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base}/", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from profiling import Profiler, main
+from prompt_builder import trim_text
+
+TEXT = " ".join(f"achado {i} com detalhes clínicos relevantes," for i in range(300))
+
+
+def busy():
+    # CPU na categoria "Montagem de prompts" e memória retida fora de qualquer categoria
+    for _ in range(5):
+        trim_text(TEXT, 200)
+    return [bytearray(1024) for _ in range(200)]
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"), write_interval=3600, trace_frames=4)
+    yield profiler
+    profiler.close()
+
+
+def test_disabled_profiler_measures_nothing(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"), enabled=False)
+    with profiler.profile("caso"):
+        busy()
+    assert profiler.report()["profiles"] == 0
+    profiler.close()
+    assert not os.path.exists(tmp_path / "profiles")
+
+
+def test_profile_attributes_cpu_and_memory(profiler):
+    kept = []
+    with profiler.profile("caso p1"):
+        kept.append(busy())
+        # Trechos aninhados entram no perfil do mais externo
+        with profiler.profile("interno"):
+            trim_text(TEXT, 100)
+    report = profiler.report()
+    assert report["profiles"] == 1 and report["memory_samples"] == 1
+    prompts = next(row for row in report["categories"] if row["category"] == "Montagem de prompts")
+    assert prompts["cpu_s"] > 0 and 0 < prompts["cpu_share"] <= 1
+    assert report["recent"][0]["retained_bytes"] >= 200 * 1024
+    assert report["recent"][0]["path"].endswith("00001-caso_p1.prof")
+    assert os.path.exists(report["recent"][0]["path"])
+
+
+def test_memory_is_sampled_every_n_profiles(tmp_path):
+    profiler = Profiler(str(tmp_path / "profiles"), memory_every=2, write_interval=3600, trace_frames=4)
+    for i in range(3):
+        with profiler.profile(f"caso {i}"):
+            busy()
+    report = profiler.report()
+    assert report["profiles"] == 3 and report["memory_samples"] == 2
+    assert [entry["peak_bytes"] is None for entry in report["recent"]] == [False, True, False]
+    profiler.close()
+    assert not tracemalloc.is_tracing()
+
+
+def test_async_profile_and_written_report(profiler, capsys):
+    async def run():
+        async with profiler.aprofile("async"):
+            busy()
+            await asyncio.sleep(0)
+
+    asyncio.run(run())
+    profiler.write()
+    with open(os.path.join(profiler.output_dir, "report.json"), encoding="utf-8") as f:
+        assert json.load(f)["profiles"] == 1
+    with open(os.path.join(profiler.output_dir, "profile.folded"), encoding="utf-8") as f:
+        stacks = f.read().splitlines()
+    assert any("prompt_builder.py:trim_text" in line for line in stacks)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in stacks)
+    main([profiler.output_dir])
+    assert "Montagem de prompts" in capsys.readouterr().out
@@ -0,0 +1,51 @@
+from medical_agent import MedicalCase
+from prompt_builder import (MIN_FIELD_TOKENS, PromptBuilder, context_window, count_message_tokens, count_tokens,
+                            fit_max_tokens, trim_text)
+
+
+def long_text(prefix, count):
+    return " ".join(f"{prefix} {i} com detalhes clínicos relevantes," for i in range(count))
+
+
+def test_trim_text_keeps_leading_pieces_within_budget():
+    text = long_text("achado", 200)
+    trimmed, cut = trim_text(text, 100)
+    assert cut and count_tokens(trimmed) <= 100
+    assert trimmed.startswith("achado 0 ") and trimmed.endswith("omitido(s) por limite de tamanho]")
+    assert trim_text("curto.", 100) == ("curto.", False)
+
+
+def test_system_prefix_is_identical_across_cases():
+    builder = PromptBuilder()
+    first = builder.build(MedicalCase("p1", "febre", "saudável", "low"))
+    second = builder.build(MedicalCase("p2", "dor", "diabético", "high"), max_tokens=500)
+    assert first.system == second.system == builder.system_prompt
+    assert "p1" in first.user and "p1" not in first.system
+    assert not first.trimmed
+
+
+def test_documents_are_trimmed_before_history_and_symptoms():
+    builder = PromptBuilder(max_case_tokens=600)
+    case = MedicalCase("p1", "febre alta há dois dias.", long_text("histórico", 20), "medium")
+    documents = [("exame.pdf", long_text("exame", 300)), ("laudo.txt", long_text("laudo", 300))]
+    prompt = builder.build(case, documents=documents)
+    assert prompt.trimmed
+    assert count_tokens(prompt.user) <= 600
+    assert case.symptoms in prompt.user and case.medical_history in prompt.user
+    assert prompt.user.count("omitido(s)") == 2
+
+
+def test_history_and_symptoms_shrink_when_still_over_budget():
+    builder = PromptBuilder(max_case_tokens=2 * MIN_FIELD_TOKENS)
+    case = MedicalCase("p1", long_text("sintoma", 100), long_text("histórico", 100), "high")
+    prompt = builder.build(case)
+    assert prompt.trimmed and prompt.user.count("omitido(s)") == 2
+    assert "sintoma 0 " in prompt.user and "histórico 0 " in prompt.user
+
+
+def test_max_tokens_fits_the_context_window():
+    messages = [{"role": "user", "content": long_text("texto", 50)}]
+    used = count_message_tokens(messages, "gpt-4")
+    assert fit_max_tokens(messages, "gpt-4", 100) == 100
+    assert fit_max_tokens(messages, "gpt-4", 10 ** 6) == context_window("gpt-4") - used
+    assert fit_max_tokens([{"role": "user", "content": "x" * 10 ** 6}], "gpt-4", 100) == 1
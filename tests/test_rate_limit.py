@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from rate_limit import AdaptiveConcurrency, TokenBucket, Upstream, classify, parse_retry_after
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = httpx.Response(status_code, headers=headers or {})
+
+
+def flaky(*outcomes):
+    calls = []
+
+    def fn():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    fn.calls = calls
+    return fn
+
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert 0 < parse_retry_after({"retry-after": time.strftime("%a, %d %b %Y %H:%M:%S GMT",
+                                                               time.gmtime(time.time() + 30))}) <= 30
+    assert parse_retry_after({"retry-after": "amanhã"}) is None
+    assert parse_retry_after(None) is None
+
+
+def test_classify_statuses_and_connection_errors():
+    assert classify(StatusError(429, {"retry-after": "2"})) == (True, 2.0)
+    assert classify(StatusError(503)) == (True, None)
+    assert classify(StatusError(400)) == (False, None)
+    assert classify(httpx.ConnectTimeout("timeout")) == (True, None)
+    assert classify(ValueError("json")) == (False, None)
+
+
+def test_token_bucket_charges_debt_and_refunds():
+    bucket = TokenBucket(rate=100, capacity=10)
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(5) == pytest.approx(0.05, abs=0.01)
+    bucket.refund(5)
+    assert bucket.reserve(1) < 0.02
+
+
+def test_aimd_backs_off_once_per_burst_and_grows_back():
+    concurrency = AdaptiveConcurrency(initial=8, cooldown=60)
+    for _ in range(3):
+        concurrency.acquire()
+    for _ in range(3):
+        concurrency.release(None, overloaded=True)
+    assert concurrency.limit == 4
+    for _ in range(8):
+        concurrency.acquire()
+        concurrency.release(0.1)
+    assert 5 < concurrency.limit < 6
+
+
+def test_waiters_are_granted_when_a_slot_frees():
+    concurrency = AdaptiveConcurrency(initial=1)
+    concurrency.acquire()
+    granted = threading.Event()
+    waiter = threading.Thread(target=lambda: (concurrency.acquire(), granted.set()))
+    waiter.start()
+    assert not granted.wait(0.05)
+    concurrency.release(None)
+    assert granted.wait(1)
+    waiter.join()
+    assert concurrency.in_flight == 1
+
+
+def test_call_retries_overload_after_retry_after():
+    upstream = Upstream("teste", backoff_base=0.001)
+    fn = flaky(StatusError(429, {"retry-after-ms": "20"}), "ok")
+    started = time.monotonic()
+    assert upstream.call(fn) == "ok"
+    assert time.monotonic() - started >= 0.02
+    assert upstream.stats()["retries"] == 1 and upstream.stats()["in_flight"] == 0
+
+
+def test_client_errors_are_not_retried_and_refund_tokens():
+    upstream = Upstream("teste", tokens_per_minute=600)
+    with pytest.raises(StatusError):
+        upstream.call(flaky(StatusError(400)), tokens=60)
+    assert upstream.tokens.reserve(60) == 0
+    assert upstream.stats()["retries"] == 0
+
+
+def test_call_without_retries_still_pauses_the_upstream():
+    upstream = Upstream("teste")
+    with pytest.raises(StatusError):
+        upstream.call(flaky(StatusError(429, {"retry-after": "5"})), max_retries=0)
+    assert upstream._admission_delay(0) > 4
+
+
+def test_cancelled_async_call_releases_its_slot():
+    async def run():
+        upstream = Upstream("teste", initial_concurrency=1)
+        task = asyncio.ensure_future(upstream.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert upstream.stats()["in_flight"] == 0
+        assert await asyncio.wait_for(upstream.acall(lambda: asyncio.sleep(0, "ok")), 1) == "ok"
+
+    asyncio.run(run())
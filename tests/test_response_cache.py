@@ -0,0 +1,61 @@
+from dataclasses import replace
+
+import response_cache
+from medical_agent import AnalysisConfig
+from response_cache import ResponseCache, cache_key
+
+RESULT = {"patient_id": "p1", "analysis": "ok", "quality_metrics": {"final_score": 0.9}}
+
+
+def test_key_depends_on_prompt_and_generation_settings():
+    config = AnalysisConfig()
+    key = cache_key("sistema", "caso", config)
+    assert key == cache_key("sistema", "caso", AnalysisConfig())
+    assert key != cache_key("sistema", "outro caso", config)
+    assert key != cache_key("sistema", "caso", replace(config, temperature=0.2))
+    # O endpoint do avaliador não muda a resposta
+    assert key == cache_key("sistema", "caso", replace(config, base_url="http://outro:8000"))
+
+
+def test_memory_level_is_lru():
+    cache = ResponseCache(max_memory_entries=2)
+    for key in ("a", "b"):
+        cache.set(key, RESULT)
+    cache.get("a")
+    cache.set("c", RESULT)
+    assert cache.get("b") is None and cache.get("a") == RESULT
+    assert cache.stats()["memory_entries"] == 2
+
+
+def test_disk_level_survives_restart_and_expires(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(path, ttl_seconds=60)
+    cache.set("a", RESULT)
+    cache.close()
+
+    reopened = ResponseCache(path, ttl_seconds=60)
+    assert reopened.get("a") == RESULT and reopened.stats()["disk_hits"] == 1
+    now = response_cache.time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + 120)
+    assert reopened.get("a") is None
+    assert reopened.stats()["disk_bytes"] == 0
+    reopened.close()
+
+
+def test_disk_level_evicts_least_recently_accessed(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: clock[0])
+    size = len(response_cache.json.dumps(RESULT, ensure_ascii=False).encode("utf-8"))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_memory_entries=1, ttl_seconds=None,
+                          max_disk_bytes=2 * size)
+    for key in ("a", "b"):
+        clock[0] += 1
+        cache.set(key, RESULT)
+    clock[0] += 1
+    cache.get("a")
+    clock[0] += 1
+    cache.set("c", RESULT)
+    cache.invalidate("c")
+    assert cache.get("b") is None and cache.get("a") == RESULT
+    assert cache.stats()["evictions"] == 1 and cache.stats()["disk_bytes"] == size
+    cache.close()
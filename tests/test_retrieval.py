@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import retrieval
+from documents import DocumentIngestor
+from retrieval import RetrievalIndex, _ClaimLost
+
+
+@pytest.fixture
+def document(tmp_path):
+    ingestor = DocumentIngestor(str(tmp_path / "docs"))
+    return ingestor.ingest_text("exame", "Paciente com dispneia e edema. " * 200)
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "retrieval.sqlite3")
+
+
+def foreign_claim(path, document, claimed_at):
+    """Reserva gravada por outro processo (outra conexão ao mesmo arquivo)"""
+    other = RetrievalIndex(path)
+    with other._db:
+        other._db.execute("INSERT INTO documents (doc_id, name, passages, claimed_at) VALUES (?, ?, -1, ?)",
+                          (document.sha256, document.name, claimed_at))
+    return other
+
+
+def claim_of(index, document):
+    return index._db.execute("SELECT claimed_at FROM documents WHERE doc_id = ?", (document.sha256,)).fetchone()[0]
+
+
+def test_add_waits_for_fresh_foreign_claim(monkeypatch, index_path, document):
+    monkeypatch.setattr(retrieval, "CLAIM_POLL", 0.01)
+    other = foreign_claim(index_path, document, time.time())
+    index = RetrievalIndex(index_path)
+    added = []
+    worker = threading.Thread(target=lambda: added.append(index.add([document])))
+    worker.start()
+    time.sleep(0.1)
+    assert worker.is_alive()
+    assert document.sha256 not in index._indexed
+
+    # O outro processo conclui a indexação que reservou
+    count, claim = other._index(document, claim_of(other, document))
+    with other._db:
+        other._refresh_claim(document.sha256, claim, passages=count)
+    worker.join(5)
+    assert added == [0]
+    assert index.search("dispneia", [document])
+
+
+def test_add_takes_over_stale_claim(index_path, document):
+    foreign_claim(index_path, document, time.time() - retrieval.STALE_CLAIM - 1)
+    index = RetrievalIndex(index_path)
+    assert index.add([document]) == 1
+    assert index.stats()["documents"] == 1
+    assert index.search("edema", [document])
+
+
+def test_batch_write_after_takeover_raises_claim_lost(index_path, document):
+    index = RetrievalIndex(index_path)
+    stale = time.time() - retrieval.STALE_CLAIM - 1
+    foreign_claim(index_path, document, stale)
+    assert RetrievalIndex(index_path).add([document]) == 1
+    with pytest.raises(_ClaimLost):
+        index._write_batch(document.sha256, stale, [(0, "texto", {"texto": 1})])
+
+
+def test_concurrent_adds_index_once(document):
+    index = RetrievalIndex(None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(index.add([document]))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == [0, 0, 0, 1]
+    assert index.stats()["passages"] > 0
@@ -0,0 +1,52 @@
+from attempt_log import AttemptLog
+from retry_policy import LearnedRetryPolicy, RetryBudget
+
+SEQUENTIAL = [{"attempt": 1, "score": 0.4}, {"attempt": 2, "score": 0.7}, {"attempt": 3, "score": 0.6}]
+# Dois candidatos paralelos na rodada 1 e um na rodada 2
+SPECULATIVE = [{"attempt": 1, "round": 1, "score": 0.4}, {"attempt": 2, "round": 1, "score": 0.9},
+               {"attempt": 3, "round": 2, "score": 0.95}]
+
+
+def policy():
+    return LearnedRetryPolicy(min_samples=1)
+
+
+def test_observe_records_gains_between_sequential_attempts():
+    learned = policy()
+    learned.observe("media", SEQUENTIAL)
+    assert abs(learned.expected_gain("media", 1) - 0.3) < 1e-9
+    assert learned.expected_gain("media", 2) == 0.0
+
+
+def test_observe_ignores_speculative_candidates():
+    learned = policy()
+    learned.observe("media", SPECULATIVE)
+    assert learned.expected_gain("media", 1) is None
+    assert learned.expected_gain("media", 2) is None
+
+
+def test_warm_start_matches_observe_and_skips_speculative():
+    log = AttemptLog(path=None, flush_interval=0)
+    try:
+        log.record({"patient_id": "p1", "attempt_history": SEQUENTIAL}, "media", "m", 0.8, 3)
+        log.record({"patient_id": "p2", "attempt_history": SPECULATIVE}, "media", "m", 0.8, 3)
+        log.flush()
+        warm = policy()
+        assert warm.warm_start(log) == 2
+        observed = policy()
+        observed.observe("media", SEQUENTIAL)
+        observed.observe("media", SPECULATIVE)
+        assert warm.stats()["expected_gain"] == observed.stats()["expected_gain"]
+    finally:
+        log.close()
+
+
+def test_budget_refuses_retries_without_credit():
+    learned = LearnedRetryPolicy(budget=RetryBudget(0.5, max_credit=1))
+    learned.begin("media")
+    assert learned.allow_retry("media", 1, 0.2, 0.8) == (True, None)
+    learned.begin("media")
+    assert learned.allow_retry("media", 1, 0.2, 0.8) == (False, "budget")
+    learned.begin("media")
+    assert learned.allow_retry("media", 1, 0.2, 0.8) == (True, None)
+    assert learned.stats()["stopped_budget"] == 1
@@ -0,0 +1,34 @@
+import json
+
+from medical_agent import DEFAULT_ROUTES, MedicalCase, Route, RoutingPolicy
+
+
+def test_known_levels_are_normalized_and_unknown_use_default():
+    policy = RoutingPolicy()
+    assert policy.route_for(MedicalCase("p1", "febre", "", " LOW ")) == DEFAULT_ROUTES["low"]
+    assert policy.route_for(MedicalCase("p2", "febre", "", "raro")) == Route()
+    assert policy.route_for(MedicalCase("p3", "febre", "", None)) == Route()
+
+
+def test_long_cases_escalate_only_upwards():
+    policy = RoutingPolicy(escalate_above_chars=100)
+    long_case = "dor " * 30
+    assert policy.level_for(MedicalCase("p1", long_case, "", "low")) == "high"
+    assert policy.level_for(MedicalCase("p2", long_case, "", "very_high")) == "very_high"
+    assert policy.level_for(MedicalCase("p3", "dor", "", "low")) == "low"
+    # Níveis desconhecidos já recebem o tratamento completo
+    assert policy.level_for(MedicalCase("p4", long_case, "", "raro")) == "raro"
+    assert RoutingPolicy(escalate_above_chars=None).level_for(MedicalCase("p5", long_case, "", "low")) == "low"
+
+
+def test_policy_from_file(tmp_path):
+    path = tmp_path / "routing.json"
+    path.write_text(json.dumps({
+        "routes": {"low": {"model": "local", "max_retries": 0}, "high": {"threshold": 0.95}},
+        "default": {"max_tokens": 900},
+        "escalate_above_chars": 10
+    }), encoding="utf-8")
+    policy = RoutingPolicy.from_file(str(path))
+    assert policy.route_for(MedicalCase("p1", "dor", "", "low")) == Route(model="local", max_retries=0)
+    assert policy.route_for(MedicalCase("p2", "dor no peito irradiando", "", "low")).threshold == 0.95
+    assert policy.route_for(MedicalCase("p3", "dor", "", "medium")) == Route(max_tokens=900)
@@ -0,0 +1,90 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import sharded_batch
+from sharded_batch import DONE, FAILED, ShardQueue, finalize, merge, prepare, shard_of
+
+
+def write_cases(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"patient_id": f"p{i}", "symptoms": "dor", "medical_history": "nada",
+                                "complexity_level": "low"}) + "\n")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    write_cases(tmp_path / "cases.jsonl", 12)
+    return prepare(str(tmp_path / "cases.jsonl"), str(tmp_path / "work"), shards=3, lease_s=0.2, max_claims=2)
+
+
+def test_prepare_partitions_once(tmp_path, queue):
+    assert queue.meta()["cases"] == 12
+    assert queue.status()["cases"].get("pending", 0) + queue.status()["cases"].get(DONE, 0) == 12
+    again = prepare(str(tmp_path / "cases.jsonl"), str(tmp_path / "work"), shards=5)
+    assert again.meta()["shards"] == 3
+
+
+def test_shard_of_is_stable():
+    assert shard_of("p1", 64) == shard_of("p1", 64)
+    assert {shard_of(f"p{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_expired_lease_moves_to_another_worker(queue):
+    pending = queue.status()["shards"]["pending"]
+    leases = [queue.claim("a") for _ in range(pending)]
+    assert queue.claim("b") is None
+    time.sleep(0.25)
+    taken = queue.claim("b")
+    assert taken.shard == leases[0].shard and taken.token != leases[0].token
+    # O dono anterior perdeu o lease: não renova nem conclui
+    assert not queue.renew(leases[0])
+    assert not queue.complete(leases[0], {"processed": 1, "errors": 0})
+    assert queue.complete(taken, {"processed": 1, "errors": 0})
+
+
+def test_shard_claimed_too_often_fails(queue):
+    first = queue.claim("a")
+    time.sleep(0.25)
+    assert queue.claim("b").shard == first.shard
+    time.sleep(0.25)
+    # Terceiro claim: o shard vira falho e o próximo pendente é entregue
+    assert queue.claim("c").shard != first.shard
+    assert queue.status()["shards"][FAILED] == 1
+
+
+def test_claim_reports_a_locked_queue(queue):
+    blocker = sqlite3.connect(queue.path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    queue._connect = lambda: sqlite3.connect(queue.path, timeout=0, isolation_level=None)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            queue.claim("a")
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+
+def test_merge_is_ordered_and_deduplicated(tmp_path, queue):
+    work_dir = str(tmp_path / "work")
+    while (lease := queue.claim("a")) is not None:
+        path = sharded_batch._shard_path(work_dir, lease.shard, "input")
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        with open(sharded_batch._shard_path(work_dir, lease.shard, "output"), "w", encoding="utf-8") as out:
+            # Saída fora de ordem e com uma linha repetida (shard retomado após queda)
+            for local in reversed(range(len(records))):
+                out.write(json.dumps({"index": local, "patient_id": records[local]["patient_id"]}) + "\n")
+            if records:
+                out.write(json.dumps({"index": 0, "patient_id": "duplicada"}) + "\n")
+        finalize(work_dir, lease.shard)
+        assert queue.complete(lease, {"processed": len(records), "errors": 0})
+
+    output = tmp_path / "out.jsonl"
+    assert merge(work_dir, str(output)) == 12
+    lines = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [line["index"] for line in lines] == list(range(12))
+    assert [line["patient_id"] for line in lines] == [f"p{i}" for i in range(12)]
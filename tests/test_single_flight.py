@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_do_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 1}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("k", work))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True, True]
+    assert all(result == {"value": 1} for result, _ in results)
+
+
+def test_cancelled_async_leader_does_not_cancel_followers():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return len(calls)
+
+    async def run():
+        leader = asyncio.ensure_future(flights.do_async("k", work))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.ensure_future(flights.do_async("k", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(run())
+    assert len(calls) == 2
+    assert [result for result, _ in results] == [2, 2, 2]
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True]
+    assert flights.stats() == {"calls": 4, "coalesced": 2, "in_flight": 0}
+
+
+def test_async_leader_error_reaches_followers():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        raise ValueError("falhou")
+
+    async def run():
+        tasks = [asyncio.ensure_future(flights.do_async("k", work)) for _ in range(3)]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
@@ -0,0 +1,35 @@
+import json
+import socket
+import struct
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from benchmarks.stub_servers import StubProfile, StubServers
+
+PROFILE = StubProfile(openai_latency_ms=0, vizeval_latency_ms=0, completion_words=200_000)
+
+
+def test_stub_servers_answer_both_apis():
+    with StubServers(StubProfile(openai_latency_ms=0, vizeval_latency_ms=0, completion_words=5)) as (openai, vizeval):
+        completion = httpx.post(f"{openai}/chat/completions", json={"messages": [{"role": "user", "content": "oi"}]})
+        content = completion.json()["choices"][0]["message"]["content"]
+        assert content.startswith("[tentativa 1]")
+        evaluation = httpx.post(f"{vizeval}/evaluation", json={"response": content})
+        assert evaluation.status_code == 201 and 0 <= evaluation.json()["score"] <= 1
+
+
+def test_client_disconnect_during_stream_is_not_logged(capfd):
+    with StubServers(PROFILE) as (openai, _):
+        address = urlsplit(openai)
+        body = json.dumps({"messages": [], "stream": True}).encode("utf-8")
+        client = socket.create_connection((address.hostname, address.port))
+        client.sendall(b"POST /v1/chat/completions HTTP/1.1\r\nHost: stub\r\nContent-Type: application/json\r\n"
+                       b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        assert client.recv(1024).startswith(b"HTTP/1.0 200")
+        # Fechamento abrupto (RST) com a resposta ainda em andamento
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+        client.close()
+        time.sleep(0.5)
+    assert "Traceback" not in capfd.readouterr().err
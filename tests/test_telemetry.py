@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+from vizeval import EvaluationResponse
+
+import medical_agent
+from analytics import FleetAnalytics
+from attempt_log import AttemptLog
+from medical_agent import MedicalAgent, MedicalCase
+
+medical_agent.console.quiet = True
+
+RESULTS = {"patient_id": "p1", "quality_metrics": {"final_score": 0.9, "passed_threshold": True, "total_attempts": 1},
+           "attempt_history": [{"attempt": 1, "score": 0.9, "feedback": "ok"}],
+           "performance": {"total_s": 1.0}}
+
+
+def lock(path):
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN EXCLUSIVE")
+    return blocker
+
+
+def test_attempt_log_keeps_batch_when_database_is_locked(tmp_path):
+    path = str(tmp_path / "attempts.sqlite3")
+    log = AttemptLog(path, flush_interval=0)
+    log._db.execute("PRAGMA busy_timeout = 0")
+    blocker = lock(path)
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        log.record(RESULTS, "media", "m", 0.8, 3)
+    blocker.execute("COMMIT")
+    blocker.close()
+    log.flush()
+    assert log.count() == {"analyses": 1, "attempts": 1}
+    log.close()
+
+
+def test_fleet_analytics_keeps_delta_when_database_is_locked(tmp_path, monkeypatch):
+    path = str(tmp_path / "fleet.sqlite3")
+    analytics = FleetAnalytics(path, flush_interval=0)
+    monkeypatch.setattr(analytics, "_connect", lambda: sqlite3.connect(path, timeout=0, isolation_level=None))
+    blocker = lock(path)
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        analytics.record(RESULTS, "media", "m", 0.8)
+    blocker.execute("COMMIT")
+    blocker.close()
+    analytics.flush()
+    assert [group["count"] for group in analytics.report()] == [1]
+
+
+class LockedStore:
+    def record(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+    def flush(self):
+        pass
+
+
+def test_telemetry_failure_keeps_analysis_result():
+    agent = MedicalAgent("x", "x", analytics=LockedStore(), attempt_log=LockedStore())
+    evaluation = EvaluationResponse(evaluator="medical", score=0.9, feedback="ok")
+    result = {"content": "análise", "evaluation": evaluation, "passed": True, "best_score": 0.9, "evaluated": True,
+              "early_stop": None, "elapsed_s": 0.1, "model": "m", "threshold": 0.8, "max_retries": 3,
+              "attempts": [{"attempt": 1, "round": 1, "score": 0.9, "feedback": "ok"}]}
+    results = agent._success_result(MedicalCase("p1", "dor", "nada", "medium"), result)
+    assert results["analysis"] == "análise"
+    assert results["quality_metrics"]["passed_threshold"]
+    agent.close()
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from attempt_log import AttemptLog
+from whatif import AttemptMatrix, load_attempts, simulate
+
+THRESHOLDS = (0.6, 0.8, 0.95)
+RETRIES = (0, 1, 2, 4, 7)
+
+
+def random_matrix(seed=0, count=400, width=5):
+    rng = np.random.default_rng(seed)
+    recorded = rng.integers(1, width + 1, count)
+    mask = np.arange(width) < recorded[:, None]
+    scores = np.where(mask, rng.uniform(0.4, 1.0, (count, width)), np.nan)
+    terminal = rng.random(count) < 0.1
+    # Análise terminal: a última tentativa registrada não foi avaliada
+    scores[terminal, recorded[terminal] - 1] = np.nan
+    latency = np.where(mask, rng.uniform(0.5, 20.0, (count, width)), 0.0)
+    cost = np.where(mask, rng.uniform(0.001, 0.01, (count, width)), 0.0)
+    return AttemptMatrix("high", "gpt-4o", scores, latency, cost, recorded, terminal)
+
+
+def reference(matrix, threshold, max_retries):
+    """Política reaplicada análise por análise"""
+    budget = max_retries + 1
+    passed, used, latencies, costs, censored = 0, [], [], [], 0
+    for scores, latency, cost, recorded, terminal in zip(matrix.scores, matrix.latency_s, matrix.cost_usd,
+                                                         matrix.recorded, matrix.terminal):
+        hits = np.flatnonzero(scores >= threshold)
+        end = hits[0] + 1 if len(hits) else recorded
+        attempts = min(end, budget)
+        passed += bool(len(hits)) and end <= budget
+        censored += not len(hits) and not terminal and recorded < budget
+        used.append(attempts)
+        latencies.append(latency[:attempts].sum())
+        costs.append(cost[:attempts].sum())
+    count = len(matrix)
+    return {"pass_rate": passed / count, "attempts_mean": np.mean(used), "latency_mean_s": np.mean(latencies),
+            "cost_per_analysis_usd": np.mean(costs), "censored": censored / count,
+            "latency_p95_s": sorted(latencies)[int(0.95 * (count - 1))]}
+
+
+def test_vectorized_grid_matches_per_analysis_replay():
+    matrix = random_matrix()
+    rows = simulate(matrix, THRESHOLDS, RETRIES)
+    assert [(row["threshold"], row["max_retries"]) for row in rows] == \
+           [(t, r) for t in THRESHOLDS for r in RETRIES]
+    for row in rows:
+        expected = reference(matrix, row["threshold"], row["max_retries"])
+        for key in ("pass_rate", "attempts_mean", "latency_mean_s", "cost_per_analysis_usd", "censored"):
+            assert row[key] == pytest.approx(expected[key]), key
+        assert row["latency_p95_s"] == pytest.approx(expected["latency_p95_s"], rel=0.02)
+
+
+def test_unknown_model_has_no_cost():
+    matrix = random_matrix(count=20)
+    matrix.cost_usd[:] = np.nan
+    assert all(row["cost_per_analysis_usd"] is None for row in simulate(matrix, (0.8,), (1,)))
+
+
+def test_load_attempts_builds_matrices_from_the_log():
+    log = AttemptLog(path=None, flush_interval=3600)
+    history = [{"attempt": 1, "score": 0.5, "prompt_tokens": 1000, "completion_tokens": 500,
+                "generation_s": 1.0, "evaluation_s": 0.5},
+               {"attempt": 2, "score": None, "evaluated": False, "generation_s": 2.0}]
+    log.record({"patient_id": "p1", "attempt_history": history}, "high", "gpt-4o", 0.8, 3)
+    log.record({"patient_id": "p2", "attempt_history": history[:1]}, "high", "gpt-4o", 0.8, 3)
+    log.record({"patient_id": "p3", "attempt_history": history[:1]}, "low", "gpt-4o", 0.8, 3)
+    log.flush()
+    matrices = load_attempts(log.connection(), complexity="high")
+    log.close()
+
+    (matrix,) = matrices
+    assert matrix.scores.shape == (2, 2) and np.isnan(matrix.scores[0, 1]) and np.isnan(matrix.scores[1, 1])
+    assert matrix.recorded.tolist() == [2, 1] and matrix.terminal.tolist() == [True, False]
+    assert matrix.latency_s.tolist() == [[1.5, 2.0], [1.5, 0.0]]
+    assert matrix.cost_usd[0, 0] == pytest.approx((1000 * 2.5 + 500 * 10.0) / 1e6)
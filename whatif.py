@@ -0,0 +1,264 @@
+"""
+Simulador what-if de threshold e retries sobre as tentativas registradas (AttemptLog)
+Reaplica o histórico de scores de todas as análises, vetorizado em NumPy, para uma grade threshold × retries
+
+Uso:
+    python whatif.py                                          # grade padrão, por complexidade e modelo
+    python whatif.py --thresholds 0.8,0.85,0.9 --retries 0-4  # grade própria
+    python whatif.py --complexity high --json whatif.json     # um nível, com exportação
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from attempt_log import AttemptLog
+
+# Preço de tabela em US$ por 1M de tokens (prompt, resposta); ajuste com --prices
+DEFAULT_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6)
+}
+
+DEFAULT_THRESHOLDS = (0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+DEFAULT_RETRIES = (0, 1, 2, 3, 4, 5)
+
+# Latências agrupadas em buckets logarítmicos para os quantis (de 1 ms a ~28 h)
+LATENCY_ACCURACY = 0.01
+LATENCY_MIN_S = 0.001
+LATENCY_BUCKETS = 1024
+_GAMMA = (1 + LATENCY_ACCURACY) / (1 - LATENCY_ACCURACY)
+
+_ROW_DTYPE = np.dtype([("analysis_id", np.int64), ("attempt", np.int32), ("score", np.float64),
+                       ("evaluated", np.int8), ("prompt_tokens", np.int64), ("completion_tokens", np.int64),
+                       ("latency_s", np.float64)])
+
+
+@dataclass
+class AttemptMatrix:
+    """Tentativas de um grupo de análises em matrizes análise × tentativa
+
+    Células de tentativas não registradas têm score NaN e custo/latência zero. `recorded` é o
+    número de tentativas registradas de cada análise e `terminal` marca análises cujo ciclo
+    parou por falta de avaliação (mais retries não mudariam o resultado).
+    """
+    complexity: str
+    model: str
+    scores: np.ndarray
+    latency_s: np.ndarray
+    cost_usd: np.ndarray
+    recorded: np.ndarray
+    terminal: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.recorded)
+
+
+def load_attempts(db: sqlite3.Connection, complexity: Optional[str] = None, model: Optional[str] = None,
+                  prices: Mapping[str, Tuple[float, float]] = DEFAULT_PRICES) -> List[AttemptMatrix]:
+    """Uma matriz por (complexidade, modelo), lida do SQLite em streaming direto para arrays NumPy"""
+    groups = db.execute("SELECT DISTINCT complexity, model FROM analyses ORDER BY complexity, model").fetchall()
+    matrices = []
+    for group_complexity, group_model in groups:
+        if complexity is not None and group_complexity != complexity:
+            continue
+        if model is not None and group_model != model:
+            continue
+        # Score NULL (não avaliada) vira -1: NaN não existe no SQLite
+        cursor = db.execute(
+            """SELECT t.analysis_id, t.attempt, COALESCE(t.score, -1.0), t.evaluated,
+                      COALESCE(t.prompt_tokens, 0), COALESCE(t.completion_tokens, 0),
+                      COALESCE(t.generation_s, 0.0) + COALESCE(t.evaluation_s, 0.0)
+               FROM attempts t JOIN analyses a ON a.id = t.analysis_id
+               WHERE a.complexity = ? AND a.model = ?
+               ORDER BY t.analysis_id, t.attempt""", (group_complexity, group_model))
+        rows = np.fromiter(cursor, dtype=_ROW_DTYPE)
+        if not len(rows):
+            continue
+
+        # Linhas já ordenadas por análise: a linha da matriz muda onde o id muda
+        ids = rows["analysis_id"]
+        index = np.concatenate(([0], np.cumsum(ids[1:] != ids[:-1])))
+        column = rows["attempt"] - 1
+        shape = (int(index[-1]) + 1, int(column.max()) + 1)
+
+        scores = np.full(shape, np.nan)
+        score = rows["score"]
+        scores[index, column] = np.where(score < 0, np.nan, score)
+        latency = np.zeros(shape)
+        latency[index, column] = rows["latency_s"]
+        prompt_price, completion_price = prices.get(group_model, (np.nan, np.nan))
+        cost = np.zeros(shape)
+        cost[index, column] = (rows["prompt_tokens"] * prompt_price
+                               + rows["completion_tokens"] * completion_price) / 1e6
+        recorded = np.zeros(shape[0], dtype=np.int64)
+        np.maximum.at(recorded, index, column + 1)
+        terminal = np.zeros(shape[0], dtype=bool)
+        terminal[index[rows["evaluated"] == 0]] = True
+        matrices.append(AttemptMatrix(group_complexity, group_model, scores, latency, cost, recorded, terminal))
+    return matrices
+
+
+def _latency_buckets(latency: np.ndarray) -> np.ndarray:
+    """Bucket logarítmico de cada latência (erro relativo de LATENCY_ACCURACY, como os sketches de analytics.py)"""
+    scaled = np.maximum(latency, LATENCY_MIN_S) / LATENCY_MIN_S
+    return np.minimum(np.ceil(np.log(scaled) / np.log(_GAMMA)), LATENCY_BUCKETS - 1).astype(np.int64)
+
+
+def _bucket_quantile(histogram: np.ndarray, q: float) -> Optional[float]:
+    total = histogram.sum()
+    if not total:
+        return None
+    bucket = int(np.searchsorted(np.cumsum(histogram), q * (total - 1), side="right"))
+    return float(LATENCY_MIN_S * 2 * _GAMMA ** bucket / (_GAMMA + 1)) if bucket else LATENCY_MIN_S
+
+
+def simulate(matrix: AttemptMatrix, thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+             retries: Sequence[int] = DEFAULT_RETRIES) -> List[Dict[str, Any]]:
+    """Métricas de cada combinação threshold × max_retries reaplicando as tentativas registradas
+
+    Para cada análise, a política simulada para na primeira tentativa com score ≥ threshold ou
+    ao esgotar max_retries + 1 tentativas. Latência é a soma de geração + avaliação das
+    tentativas usadas (como em retries sequenciais) e custo é o preço dos tokens delas.
+
+    Quando a política pediria uma tentativa que não foi registrada (o ciclo original parou
+    antes, por ter passado num threshold menor ou por ter menos retries), a análise é
+    contada como reprovada com as tentativas registradas: a taxa de aprovação é um limite
+    inferior e `censored` informa a fração de análises nessa situação.
+
+    Com `end` = tentativa em que a análise para sem limite de retries (a primeira aprovada ou
+    a última registrada), a análise usa min(end, max_retries + 1) tentativas. Por isso cada
+    threshold custa algumas contagens (bincount) sobre o corpus, agrupadas por `end`, e todos
+    os valores de retries saem dessas contagens sem percorrer o corpus de novo.
+    """
+    count, width = matrix.scores.shape
+    attempts = np.arange(width + 1)
+    cumulative_latency = np.cumsum(matrix.latency_s, axis=1)
+    cumulative_cost = np.cumsum(matrix.cost_usd, axis=1)
+    buckets = _latency_buckets(cumulative_latency)
+    rows = []
+    for threshold in thresholds:
+        # NaN >= t é False: tentativas não registradas ou não avaliadas nunca aprovam
+        hits = matrix.scores >= threshold
+        hit = hits.any(axis=1)
+        first = np.where(hit, hits.argmax(axis=1) + 1, 0)
+        end = np.where(hit, first, matrix.recorded)
+
+        # Contagens por tentativa de parada: aprovações, análises, censuráveis e somas por coluna
+        passes = np.cumsum(np.bincount(first, minlength=width + 1)[1:])
+        ends = np.bincount(end, minlength=width + 1)
+        open_ended = np.cumsum(np.bincount(matrix.recorded[~hit & ~matrix.terminal], minlength=width + 1))
+        latency_by_end = np.stack([np.bincount(end, weights=cumulative_latency[:, j], minlength=width + 1)
+                                   for j in range(width)], axis=1)
+        cost_by_end = np.stack([np.bincount(end, weights=cumulative_cost[:, j], minlength=width + 1)
+                                for j in range(width)], axis=1)
+        histogram_by_end = np.stack([
+            np.bincount(end * LATENCY_BUCKETS + buckets[:, j],
+                        minlength=(width + 1) * LATENCY_BUCKETS).reshape(width + 1, LATENCY_BUCKETS)
+            for j in range(width)
+        ])
+
+        for max_retries in retries:
+            budget = max_retries + 1
+            b = min(budget, width)
+            # Análises que param antes do limite usam `end` tentativas; as demais usam o limite
+            stopped, limited = attempts[1:b], slice(b, width + 1)
+            latency_sum = latency_by_end[stopped, stopped - 1].sum() + latency_by_end[limited, b - 1].sum()
+            cost_sum = cost_by_end[stopped, stopped - 1].sum() + cost_by_end[limited, b - 1].sum()
+            histogram = histogram_by_end[stopped - 1, stopped].sum(axis=0) + histogram_by_end[b - 1, limited].sum(axis=0)
+            rows.append({
+                "complexity": matrix.complexity,
+                "model": matrix.model,
+                "threshold": float(threshold),
+                "max_retries": int(max_retries),
+                "analyses": count,
+                "pass_rate": float(passes[b - 1] / count),
+                "attempts_mean": float(((ends * np.minimum(attempts, b)).sum()) / count),
+                "latency_mean_s": float(latency_sum / count),
+                "latency_p95_s": _bucket_quantile(histogram, 0.95),
+                "cost_per_analysis_usd": None if np.isnan(cost_sum) else float(cost_sum / count),
+                "censored": float(open_ended[min(budget - 1, width)] / count)
+            })
+    return rows
+
+
+def parse_thresholds(value: str) -> List[float]:
+    """"0.8,0.85,0.9" ou "início:fim:passo" (fim incluído)"""
+    if ":" in value:
+        start, stop, step = (float(v) for v in value.split(":"))
+        return [round(t, 6) for t in np.arange(start, stop + step / 2, step)]
+    return [float(v) for v in value.split(",")]
+
+
+def parse_retries(value: str) -> List[int]:
+    """"0,1,3" ou intervalo "0-5" """
+    if "-" in value:
+        start, stop = (int(v) for v in value.split("-"))
+        return list(range(start, stop + 1))
+    return [int(v) for v in value.split(",")]
+
+
+def display_report(report: List[Dict[str, Any]], console=None):
+    """Grade simulada no terminal"""
+    # rich só é carregado aqui, como em analytics.display_report
+    from rich.console import Console
+    from rich.table import Table
+
+    def fmt(value, spec=".3f"):
+        return "N/A" if value is None else format(value, spec)
+
+    table = Table(title="🔮 Simulação What-if de Threshold e Retries")
+    for column in ("Complexidade", "Modelo", "Threshold", "Retries", "Análises", "Aprovação", "Tentativas (média)",
+                   "Latência média/p95", "Custo/análise", "Censuradas"):
+        table.add_column(column, style="cyan" if column in ("Complexidade", "Modelo") else "green")
+    for row in report:
+        table.add_row(
+            row["complexity"], row["model"], f"{row['threshold']:g}", str(row["max_retries"]), str(row["analyses"]),
+            fmt(row["pass_rate"], ".1%"), fmt(row["attempts_mean"], ".2f"),
+            f"{fmt(row['latency_mean_s'], '.2f')}/{fmt(row['latency_p95_s'], '.2f')}s",
+            "N/A" if row["cost_per_analysis_usd"] is None else f"${row['cost_per_analysis_usd']:.4f}",
+            fmt(row["censored"], ".1%")
+        )
+    (console or Console()).print(table)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Simulador what-if de threshold e retries do Agente Médico Vizeval")
+    parser.add_argument("--path", default=os.getenv("VIZEVAL_ATTEMPTS_PATH", ".cache/attempts.sqlite3"))
+    parser.add_argument("--thresholds", type=parse_thresholds, default=list(DEFAULT_THRESHOLDS),
+                        help='Lista "0.8,0.9" ou intervalo "0.7:0.95:0.05"')
+    parser.add_argument("--retries", type=parse_retries, default=list(DEFAULT_RETRIES),
+                        help='Lista "0,2,4" ou intervalo "0-5"')
+    parser.add_argument("--complexity", help="Simular apenas um nível de complexidade")
+    parser.add_argument("--model", help="Simular apenas um modelo")
+    parser.add_argument("--prices", help='JSON {"modelo": [US$ prompt, US$ resposta] por 1M de tokens}')
+    parser.add_argument("--json", help="Exportar a grade em JSON")
+    args = parser.parse_args(argv)
+
+    prices = dict(DEFAULT_PRICES)
+    if args.prices:
+        with open(args.prices, encoding="utf-8") as f:
+            prices.update({model: tuple(price) for model, price in json.load(f).items()})
+
+    log = AttemptLog(args.path)
+    db = log.connection()
+    report = []
+    for matrix in load_attempts(db, args.complexity, args.model, prices):
+        report.extend(simulate(matrix, args.thresholds, args.retries))
+    db.close()
+    log.close()
+
+    display_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()